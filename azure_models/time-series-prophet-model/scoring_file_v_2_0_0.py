@@ -65,14 +65,15 @@ def run(Inputs, GlobalParameters={"quantiles":[0.025, 0.975]}):
     
     quantiles = GlobalParameters.get("quantiles", [0.025, 0.975])
     quantiles = [min(quantiles), 0.5, max(quantiles)]
-    PI = 'prediction_interval'
     model.quantiles = quantiles
     pred_quantiles = model.forecast_quantiles(data, y_query, ignore_data_errors=True)
-    pred_quantiles[PI] = pred_quantiles[[min(quantiles), max(quantiles)]].apply(lambda x: '[{}, {}]'.format(x[0], x[1]), axis=1)
 
-    index_as_df = pred_quantiles.iloc[:,:-4].reset_index(drop=True)# get time column name and grain column name
-    forecast_as_list = pred_quantiles[0.5].to_list()
-    PI_as_list = pred_quantiles[PI].to_list()
+    # Intervals as numeric [lower, upper] pairs, taken column-wise rather than
+    # formatted into strings row by row
+    quantile_columns = list(dict.fromkeys(quantiles))
+    index_as_df = pred_quantiles.drop(columns=quantile_columns).reset_index(drop=True)# get time column name and grain column name
+    forecast_as_list = pred_quantiles[0.5].to_numpy().tolist()
+    PI_as_list = pred_quantiles[[min(quantiles), max(quantiles)]].to_numpy().tolist()
     result = {
         "forecast": forecast_as_list,
         "prediction_interval": PI_as_list,
@@ -0,0 +1,266 @@
+#backtest.py
+import os
+import json
+import math
+import time
+import argparse
+import importlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from forecasting import weekly_actions, BUY, SELL
+
+# Walk-forward replay of the service's weekly buy/sell/hold signals over
+# historical closes. At each fold origin the model forecasts the next
+# `horizon` bars from the `lookback` bars before it, the forecast is labelled
+# with forecasting.weekly_actions, and every 7-bar block is traded at the
+# actual closes: long from the buy bar to the sell bar, or short from the sell
+# bar to the buy bar when shorting is allowed.
+DEFAULT_CSV = os.path.join('notebooks', 'stock_data_with_all_indicators.csv')
+BACKTEST_WORKERS = int(os.getenv('BACKTEST_WORKERS', os.cpu_count() or 1))
+TRADING_DAYS_PER_YEAR = 252
+
+
+def load_csv_history(path=DEFAULT_CSV):
+    frame = pd.read_csv(path, usecols=['Date', 'Ticker', 'Close'])
+    dates = pd.to_datetime(frame['Date'], format='%Y-%m-%d', errors='coerce')
+    if dates.isna().any():
+        # The notebook exports write dates day first (02/01/2019)
+        dates = pd.to_datetime(frame['Date'], dayfirst=True)
+    frame['Date'] = dates
+    return frame
+
+
+def load_mongo_history(tickers=None, start_date=None, end_date=None):
+    from database import model_data_collection
+
+    query = {}
+    if tickers:
+        query['Ticker'] = {'$in': list(tickers)}
+    if start_date or end_date:
+        query['Date'] = {}
+        if start_date:
+            query['Date']['$gte'] = pd.Timestamp(start_date).to_pydatetime()
+        if end_date:
+            query['Date']['$lte'] = pd.Timestamp(end_date).to_pydatetime()
+    docs = model_data_collection.find(query, {'_id': 0, 'Date': 1, 'Ticker': 1, 'Close': 1})
+    return pd.DataFrame(list(docs), columns=['Date', 'Ticker', 'Close'])
+
+
+def close_panel(history):
+    # (dates, tickers, closes) with closes shaped (bars, tickers) and NaN
+    # where a ticker has no bar
+    panel = history.pivot_table(index='Date', columns='Ticker', values='Close', aggfunc='last').sort_index()
+    return panel.index.to_numpy(), panel.columns.to_numpy(), panel.to_numpy(dtype=float)
+
+
+def drift_model(windows, horizon):
+    # Straight-line extrapolation of each window's average change per bar
+    slope = (windows[:, -1] - windows[:, 0]) / (windows.shape[1] - 1)
+    return windows[:, -1:] + slope[:, None] * np.arange(1, horizon + 1)
+
+
+def seasonal_model(windows, horizon, season=5):
+    # Drift plus the shape of the last `season` bars, repeated
+    recent = windows[:, -season:]
+    pattern = recent - recent.mean(axis=1, keepdims=True)
+    repeats = np.tile(pattern, -(-horizon // season))[:, :horizon]
+    return drift_model(windows, horizon) + repeats
+
+
+# Models take windows shaped (n, lookback) of closes and return (n, horizon)
+# forecasts; any other model can be plugged in as 'module:function'
+MODELS = {'drift': drift_model, 'seasonal': seasonal_model}
+
+
+def resolve_model(model):
+    if callable(model):
+        return model
+    if model in MODELS:
+        return MODELS[model]
+    module_name, _, function_name = model.partition(':')
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def fold_origins(n_bars, lookback, horizon, step):
+    # Index of the last bar each fold's model sees
+    return np.arange(lookback - 1, n_bars - horizon, step)
+
+
+def simulate_folds(closes, origins, model, lookback, horizon, fee_rate=0.0, allow_short=False):
+    # Returns (returns, traded), both shaped (folds, tickers, weeks): the net
+    # return of each weekly trade and whether a trade was made
+    n_tickers = closes.shape[1]
+    weeks = horizon // 7
+    window_index = origins[:, None] - lookback + 1 + np.arange(lookback)
+    future_index = origins[:, None] + 1 + np.arange(horizon)
+    windows = closes[window_index].transpose(0, 2, 1)
+    future = closes[future_index].transpose(0, 2, 1)
+
+    # Skip tickers with a gap in either the history or the traded bars
+    valid = np.isfinite(windows).all(axis=2) & np.isfinite(future).all(axis=2)
+    returns = np.zeros((len(origins), n_tickers, weeks))
+    traded = np.zeros((len(origins), n_tickers, weeks), dtype=bool)
+    if not valid.any():
+        return returns, traded
+
+    forecasts = resolve_model(model)(windows[valid], horizon)
+    codes = weekly_actions(forecasts).reshape(-1, weeks, 7)
+    actual = future[valid].reshape(-1, weeks, 7)
+
+    buy_day = (codes == BUY).argmax(axis=2)
+    sell_day = (codes == SELL).argmax(axis=2)
+    # A flat forecast week has a buy but no sell
+    has_sell = (codes == SELL).any(axis=2)
+    buy_price = np.take_along_axis(actual, buy_day[..., None], axis=2)[..., 0]
+    sell_price = np.take_along_axis(actual, sell_day[..., None], axis=2)[..., 0]
+
+    is_long = has_sell & (buy_day < sell_day)
+    is_short = has_sell & (sell_day < buy_day) & allow_short
+    long_return = sell_price * (1 - fee_rate) / (buy_price * (1 + fee_rate)) - 1
+    short_return = (sell_price * (1 - fee_rate) - buy_price * (1 + fee_rate)) / sell_price
+
+    returns[valid] = np.where(is_long, long_return, np.where(is_short, short_return, 0.0))
+    traded[valid] = is_long | is_short
+    return returns, traded
+
+
+_worker_closes = None
+
+
+def _init_worker(closes):
+    global _worker_closes
+    _worker_closes = closes
+
+
+def _simulate_chunk(origins, model, lookback, horizon, fee_rate, allow_short):
+    return simulate_folds(_worker_closes, origins, model, lookback, horizon, fee_rate, allow_short)
+
+
+def max_drawdown(equity):
+    peaks = np.maximum.accumulate(np.concatenate([[1.0], equity]))
+    return float((1 - np.concatenate([[1.0], equity]) / peaks).max())
+
+
+def summarize(tickers, dates, origins, returns, traded, horizon, step):
+    # Equal-weight portfolio over every ticker with a valid fold, one period
+    # per 7-bar block; with step < horizon the periods overlap and the
+    # portfolio figures overcount
+    n_folds, _, weeks = returns.shape
+    period_returns = returns.transpose(0, 2, 1).reshape(n_folds * weeks, -1).mean(axis=1)
+    equity = np.cumprod(1 + period_returns)
+    periods_per_year = TRADING_DAYS_PER_YEAR / 7
+    years = len(period_returns) / periods_per_year if len(period_returns) else 0
+    std = period_returns.std()
+    trade_returns = returns[traded]
+
+    per_ticker = {}
+    for i, ticker in enumerate(tickers):
+        ticker_returns = returns[:, i][traded[:, i]]
+        per_ticker[str(ticker)] = {
+            'trades': int(len(ticker_returns)),
+            'hit_rate': float((ticker_returns > 0).mean()) if len(ticker_returns) else None,
+            'mean_return': float(ticker_returns.mean()) if len(ticker_returns) else None,
+            'total_return': float(np.prod(1 + ticker_returns) - 1),
+        }
+
+    return {
+        'tickers': len(tickers),
+        'bars': len(dates),
+        'start': str(pd.Timestamp(dates[0]).date()) if len(dates) else None,
+        'end': str(pd.Timestamp(dates[-1]).date()) if len(dates) else None,
+        'folds': int(n_folds),
+        'horizon': horizon,
+        'step': step,
+        'overlapping_folds': step < horizon,
+        'trades': int(traded.sum()),
+        'hit_rate': float((trade_returns > 0).mean()) if len(trade_returns) else None,
+        'mean_trade_return': float(trade_returns.mean()) if len(trade_returns) else None,
+        'total_return': float(equity[-1] - 1) if len(equity) else 0.0,
+        'annualized_return': float(equity[-1] ** (1 / years) - 1) if years and equity[-1] > 0 else None,
+        'sharpe': float(period_returns.mean() / std * math.sqrt(periods_per_year)) if std > 0 else None,
+        'max_drawdown': max_drawdown(equity) if len(equity) else 0.0,
+        'per_ticker': per_ticker,
+    }
+
+
+def run_backtest(history, model='seasonal', lookback=60, horizon=28, step=None, fee_bps=5.0,
+                 allow_short=False, workers=BACKTEST_WORKERS):
+    # history is a long frame with Date, Ticker and Close columns
+    if horizon % 7:
+        raise ValueError("horizon must be a whole number of weeks")
+    step = step or horizon
+    started = time.perf_counter()
+    dates, tickers, closes = close_panel(history)
+    origins = fold_origins(len(dates), lookback, horizon, step)
+    fee_rate = fee_bps / 10000
+
+    if workers <= 1 or len(origins) < 2:
+        returns, traded = simulate_folds(closes, origins, model, lookback, horizon, fee_rate, allow_short)
+    else:
+        # Folds are independent; each worker gets the panel once and a
+        # contiguous run of fold origins per task
+        chunks = np.array_split(origins, min(len(origins), workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(closes,)) as pool:
+            simulate = partial(_simulate_chunk, model=model, lookback=lookback, horizon=horizon,
+                               fee_rate=fee_rate, allow_short=allow_short)
+            parts = list(pool.map(simulate, chunks))
+        returns = np.concatenate([part[0] for part in parts])
+        traded = np.concatenate([part[1] for part in parts])
+
+    report = summarize(tickers, dates, origins, returns, traded, horizon, step)
+    report.update({'model': model if isinstance(model, str) else getattr(model, '__name__', str(model)),
+                   'lookback': lookback, 'fee_bps': fee_bps, 'allow_short': allow_short,
+                   'elapsed_seconds': time.perf_counter() - started})
+    return report
+
+
+def format_report(report, top=10):
+    lines = [
+        f"{report['tickers']} tickers, {report['bars']} bars ({report['start']} to {report['end']}), "
+        f"{report['folds']} folds of {report['horizon']} bars, model {report['model']}",
+        f"trades {report['trades']}, hit rate {report['hit_rate'] or 0:.1%}, "
+        f"mean trade {report['mean_trade_return'] or 0:.3%}",
+        f"total return {report['total_return']:.2%}, annualized {report['annualized_return'] or 0:.2%}, "
+        f"sharpe {report['sharpe'] or 0:.2f}, max drawdown {report['max_drawdown']:.2%}",
+        f"elapsed {report['elapsed_seconds']:.2f}s",
+        '',
+        f"{'ticker':<10}{'trades':>8}{'hit rate':>10}{'mean':>10}{'total':>10}",
+    ]
+    ranked = sorted(report['per_ticker'].items(), key=lambda item: item[1]['total_return'], reverse=True)
+    for ticker, stats in ranked[:top]:
+        lines.append(f"{ticker:<10}{stats['trades']:>8}{stats['hit_rate'] or 0:>10.1%}"
+                     f"{stats['mean_return'] or 0:>10.3%}{stats['total_return']:>10.2%}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Walk-forward backtest of the buy/sell/hold signals')
+    parser.add_argument('--csv', default=DEFAULT_CSV, help='History CSV with Date, Ticker and Close columns')
+    parser.add_argument('--mongo', action='store_true', help='Read history from model_ready_data instead')
+    parser.add_argument('--tickers', help='Comma-separated tickers to include')
+    parser.add_argument('--model', default='seasonal', help="'drift', 'seasonal' or 'module:function'")
+    parser.add_argument('--lookback', type=int, default=60)
+    parser.add_argument('--horizon', type=int, default=28)
+    parser.add_argument('--step', type=int, help='Bars between fold origins (default: the horizon)')
+    parser.add_argument('--fee-bps', type=float, default=5.0, help='Cost per fill in basis points')
+    parser.add_argument('--allow-short', action='store_true')
+    parser.add_argument('--workers', type=int, default=BACKTEST_WORKERS)
+    parser.add_argument('--output', help='Write the full report as JSON')
+    args = parser.parse_args()
+
+    tickers = args.tickers.split(',') if args.tickers else None
+    if args.mongo:
+        history = load_mongo_history(tickers)
+    else:
+        history = load_csv_history(args.csv)
+        if tickers:
+            history = history[history['Ticker'].isin(tickers)]
+
+    report = run_backtest(history, args.model, args.lookback, args.horizon, args.step, args.fee_bps,
+                          args.allow_short, args.workers)
+    print(format_report(report))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
@@ -0,0 +1,103 @@
+#benchmarks/fetch_benchmark.py
+# Compares the model_ready_data read paths used by get_prediction_data:
+# the original unprojected find() into a DataFrame, projected documents and
+# the server-side columnar pipeline (which falls back to projected documents
+# on servers older than MongoDB 5.0 and on mongomock). Reports per-fetch latency and the peak
+# Python allocations of one fetch.
+#
+#   python benchmarks/fetch_benchmark.py --mongo-uri mongodb://localhost:27017/trading_bot_bench
+#   python benchmarks/fetch_benchmark.py --mongomock
+import os
+import sys
+import time
+import argparse
+import statistics
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def seed(collection, tickers, bars, columns):
+    dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=bars)
+    rng = np.random.default_rng(0)
+    collection.delete_many({'Ticker': {'$in': tickers}})
+    for ticker in tickers:
+        values = rng.normal(100, 10, (bars, len(columns)))
+        docs = []
+        for i, date in enumerate(dates):
+            doc = {'Date': date.to_pydatetime(), 'Ticker': ticker, 'Adj Close': float(values[i, 0])}
+            doc.update({col: float(values[i, j]) for j, col in enumerate(columns)})
+            docs.append(doc)
+        collection.insert_many(docs)
+
+
+def measure(fetch, tickers, iterations):
+    timings = []
+    for i in range(iterations):
+        ticker = tickers[i % len(tickers)]
+        started = time.perf_counter()
+        fetch(ticker)
+        timings.append(time.perf_counter() - started)
+    tracemalloc.start()
+    fetch(tickers[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(timings) * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark model_ready_data fetch paths')
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--history', type=int, default=1500, help='bars stored per ticker')
+    parser.add_argument('--bars', type=int, default=120, help='bars fetched per request')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/trading_bot_bench')
+    parser.add_argument('--mongomock', action='store_true',
+                        help='use an in-process mongomock database instead of mongod')
+    args = parser.parse_args()
+
+    os.environ['MONGO_URI'] = args.mongo_uri
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    import database
+    from feature_cache import FEATURE_COLUMNS, NUMERIC_COLUMNS, mongo_window_loader
+    from pymongo import DESCENDING
+
+    collection = database.model_data_collection
+    tickers = [f'BENCH{i:03d}' for i in range(args.tickers)]
+    seed(collection, tickers, args.history, NUMERIC_COLUMNS)
+
+    def unprojected_documents(ticker):
+        # The original get_prediction_data: no projection, rows as dicts
+        docs = list(collection.find({'Ticker': ticker}).sort('Date', DESCENDING).limit(args.bars))
+        docs.reverse()
+        return pd.DataFrame(docs)[FEATURE_COLUMNS]
+
+    documents_loader = mongo_window_loader(collection, mode='documents')
+    columnar_loader = mongo_window_loader(collection, mode='columnar')
+
+    database.ensure_indexes()
+    results = []
+    paths = [
+        ('unprojected documents', unprojected_documents),
+        ('projected documents', lambda t: documents_loader(t, args.bars).to_frame()),
+        ('columnar pipeline', lambda t: columnar_loader(t, args.bars).to_frame()),
+    ]
+    for name, fetch in paths:
+        results.append((name,) + measure(fetch, tickers, args.iterations))
+
+    print(f"{args.tickers} tickers x {args.history} bars stored, {args.bars} bars per fetch")
+    print(f"{'path':<24}{'median ms':>12}{'peak KiB':>12}")
+    for name, latency, peak in results:
+        print(f"{name:<24}{latency:>12.2f}{peak:>12.0f}")
+
+    collection.delete_many({'Ticker': {'$in': tickers}})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+#benchmarks/ingest_benchmark.py
+# Measures data_handler.update_database throughput against a stubbed price
+# source, so no yfinance traffic is involved.
+#
+#   python benchmarks/ingest_benchmark.py --symbols 200 --mongomock
+#   python benchmarks/ingest_benchmark.py --symbols 500 --mongo-uri mongodb://localhost:27017/trading_bot_bench
+#   FEATURE_STORE=arrow python benchmarks/ingest_benchmark.py --symbols 200
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from synthetic import price_source as synthetic_price_source, tickers as synthetic_tickers, use_mongomock
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark data_handler ingestion')
+    parser.add_argument('--symbols', type=int, default=100)
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--latency-ms', type=float, default=200,
+                        help='simulated latency of each download request')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/trading_bot_bench')
+    parser.add_argument('--mongomock', action='store_true',
+                        help='write to an in-process mongomock database instead of mongod')
+    args = parser.parse_args()
+
+    os.environ['MONGO_URI'] = args.mongo_uri
+    if args.mongomock:
+        use_mongomock()
+    if os.getenv('FEATURE_STORE') == 'arrow':
+        # Write the arrow store to a scratch directory
+        os.environ.setdefault('FEATURE_STORE_PATH', tempfile.mkdtemp(prefix='feature-store-'))
+
+    import data_handler
+    from feature_store import MongoFeatureStore
+
+    tickers = synthetic_tickers(args.symbols)
+    price_source = synthetic_price_source(args.years, args.latency_ms / 1000)
+
+    store = data_handler.feature_store
+    if isinstance(store, MongoFeatureStore):
+        store.collection.delete_many({'Ticker': {'$in': tickers}})
+        store.state_collection.delete_many({'Ticker': {'$in': tickers}})
+
+    started = time.perf_counter()
+    data_handler.update_database(tickers=tickers, price_source=price_source)
+    elapsed = time.perf_counter() - started
+    if isinstance(store, MongoFeatureStore):
+        rows = store.collection.count_documents({'Ticker': {'$in': tickers}})
+    else:
+        rows = sum(store.read(ticker, columns=['Date']).num_rows for ticker in tickers)
+
+    print(f"Ingested {args.symbols} symbols ({rows} rows) in {elapsed:.2f}s")
+    print(f"{args.symbols / elapsed:.1f} symbols/sec, {rows / elapsed:.0f} rows/sec")
+
+
+if __name__ == '__main__':
+    main()
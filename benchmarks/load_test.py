@@ -0,0 +1,146 @@
+#benchmarks/load_test.py
+# Load test for the prediction endpoint. By default starts gunicorn with
+# gunicorn.conf.py on benchmarks/stub_wsgi.py (stub model, synthetic data)
+# and reports p50/p99 latency and requests/sec per concurrency level.
+#
+#   python benchmarks/load_test.py --workers 4 --threads 4 --concurrency 1,8,32
+#   python benchmarks/load_test.py --url http://localhost:5000 --symbols AAPL,MSFT
+#   python benchmarks/load_test.py --workers 1 --threads 16 --batch-window-ms 10
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import subprocess
+import http.client
+import numpy as np
+from urllib.parse import urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(port, args):
+    env = dict(os.environ, WEB_WORKERS=str(args.workers), WEB_THREADS=str(args.threads),
+               BIND=f"127.0.0.1:{port}", MODEL_WATCH_SECONDS='0', STUB_TICKERS=str(args.tickers),
+               STUB_MODEL_CPU_MS=str(args.model_cpu_ms))
+    if args.batch_window_ms is not None:
+        env.update(INFERENCE_BATCHING='true', INFERENCE_BATCH_WINDOW_MS=str(args.batch_window_ms))
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--pythonpath', 'benchmarks',
+         '--log-level', 'warning', 'stub_wsgi:app'],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited during startup")
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/api/v1/trading/ready')
+            if conn.getresponse().status == 200:
+                return server
+        except OSError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def run_level(host, port, symbols, concurrency, duration, prediction_days):
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        conn = http.client.HTTPConnection(host, port, timeout=30)
+        i = index
+        while time.perf_counter() < deadline:
+            body = json.dumps({'symbol': symbols[i % len(symbols)], 'current_price': 100.0,
+                               'prediction_days': prediction_days})
+            started = time.perf_counter()
+            try:
+                conn.request('POST', '/api/v1/trading/predict', body, {'Content-Type': 'application/json'})
+                response = conn.getresponse()
+                response.read()
+                if response.status != 200:
+                    errors[index] += 1
+                    continue
+            except (OSError, http.client.HTTPException):
+                errors[index] += 1
+                conn.close()
+                conn = http.client.HTTPConnection(host, port, timeout=30)
+                continue
+            latencies[index].append(time.perf_counter() - started)
+            i += concurrency
+        conn.close()
+
+    started = time.perf_counter()
+    clients = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for t in clients:
+        t.start()
+    for t in clients:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_latencies = np.array([x for client_latencies in latencies for x in client_latencies]) * 1000
+    if not len(all_latencies):
+        return 0.0, float('nan'), float('nan'), sum(errors)
+    return (len(all_latencies) / elapsed, np.percentile(all_latencies, 50), np.percentile(all_latencies, 99),
+            sum(errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the prediction endpoint')
+    parser.add_argument('--url', help='Running service to test instead of starting the stub server')
+    parser.add_argument('--symbols', help='Comma-separated symbols to request (default: the stub tickers)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--tickers', type=int, default=20, help='Stub tickers to seed')
+    parser.add_argument('--model-cpu-ms', type=float, default=5, help='CPU time per stub model call')
+    parser.add_argument('--batch-window-ms', type=float,
+                        help='Enable inference micro-batching with this collection window')
+    parser.add_argument('--concurrency', default='1,4,16,64', help='Comma-separated client counts')
+    parser.add_argument('--duration', type=float, default=10, help='Seconds per concurrency level')
+    parser.add_argument('--prediction-days', type=int, default=28)
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        parts = urlsplit(args.url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        host, port = '127.0.0.1', free_port()
+        server = start_server(port, args)
+        batching = f", batching window {args.batch_window_ms:g} ms" if args.batch_window_ms is not None else ''
+        print(f"gunicorn: {args.workers} workers x {args.threads} threads, "
+              f"stub model {args.model_cpu_ms:g} ms CPU per call{batching}")
+
+    symbols = args.symbols.split(',') if args.symbols else [f"T{i:03d}" for i in range(args.tickers)]
+    total_errors = 0
+    try:
+        print(f"{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+        for concurrency in [int(c) for c in args.concurrency.split(',')]:
+            rps, p50, p99, errors = run_level(host, port, symbols, concurrency, args.duration,
+                                              args.prediction_days)
+            total_errors += errors
+            print(f"{concurrency:>12}{rps:>10.1f}{p50:>10.1f}{p99:>10.1f}{errors:>8}"
+                  f"{'  FAILED' if errors else ''}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    if total_errors:
+        # req/s and latencies count successful requests only, so a run with
+        # failures is not a valid measurement
+        sys.exit(f"{total_errors} requests failed; the figures above are not comparable")
+
+
+if __name__ == '__main__':
+    main()
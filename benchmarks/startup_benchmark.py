@@ -0,0 +1,83 @@
+#benchmarks/startup_benchmark.py
+# Measures service cold start in fresh interpreters: the import time of each
+# heavy dependency, then the model artifact lookup (including checksum
+# validation) and the MLflow load, reported separately.
+#
+#   python benchmarks/startup_benchmark.py
+#   python benchmarks/startup_benchmark.py --model-path mlflow-model --runs 5
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTS = ['flask', 'pandas', 'pymongo', 'feature_cache', 'model_loader', 'mlflow.pyfunc', 'azureml.core']
+
+IMPORT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+try:
+    __import__(sys.argv[1])
+    print(json.dumps({'seconds': time.perf_counter() - started}))
+except Exception as e:
+    print(json.dumps({'error': f'{type(e).__name__}: {e}'}))
+"""
+
+LOAD_SCRIPT = """
+import json, sys, time
+import model_loader
+started = time.perf_counter()
+try:
+    path, version = model_loader.resolve_model_path()
+    resolved = time.perf_counter()
+    model_loader.load_model(path)
+    print(json.dumps({'path': path, 'resolve': resolved - started, 'load': time.perf_counter() - resolved}))
+except Exception as e:
+    print(json.dumps({'error': f'{type(e).__name__}: {e}'}))
+"""
+
+
+def run(script, *args, env=None):
+    result = subprocess.run([sys.executable, '-c', script, *args], cwd=ROOT, env=env,
+                            capture_output=True, text=True)
+    lines = result.stdout.strip().splitlines()
+    if not lines:
+        return {'error': result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'no output'}
+    return json.loads(lines[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark service import and model load times')
+    parser.add_argument('--model-path', help='Local artifact to load (sets MODEL_PATH)')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per measurement')
+    args = parser.parse_args()
+
+    env = dict(os.environ, MODEL_SOURCE='local')
+    if args.model_path:
+        env['MODEL_PATH'] = os.path.abspath(args.model_path)
+
+    print(f"{'import':<24}{'median s':>12}")
+    for module in IMPORTS:
+        results = [run(IMPORT_SCRIPT, module, env=env) for _ in range(args.runs)]
+        errors = [r['error'] for r in results if 'error' in r]
+        if errors:
+            print(f"{module:<24}{'n/a':>12}  ({errors[0]})")
+        else:
+            print(f"{module:<24}{statistics.median(r['seconds'] for r in results):>12.3f}")
+
+    results = [run(LOAD_SCRIPT, env=env) for _ in range(args.runs)]
+    errors = [r['error'] for r in results if 'error' in r]
+    print()
+    if errors:
+        print(f"model load failed: {errors[0]}")
+        return
+    print(f"model artifact: {results[0]['path']}")
+    print(f"{'resolve + checksum':<24}{statistics.median(r['resolve'] for r in results):>12.3f}")
+    print(f"{'mlflow load':<24}{statistics.median(r['load'] for r in results):>12.3f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#benchmarks/store_benchmark.py
+# Compares the feature store backends on the get_prediction_data read: the
+# MongoDB loader (columnar pipeline, falling back to projected documents on
+# mongomock) against memory-mapped Arrow IPC and Parquet part files, each
+# with ticker and year partitioning. Reports write time, per-fetch latency,
+# the peak Python allocations of one fetch and the Arrow memory its result
+# still holds (zero when the columns are views of the memory map).
+#
+#   python benchmarks/store_benchmark.py --mongomock --tickers 3 --history 500
+#   python benchmarks/store_benchmark.py --mongo-uri mongodb://localhost:27017/trading_bot_bench --history 2500
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import tracemalloc
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def synthetic_bars(tickers, bars, columns):
+    dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=bars)
+    rng = np.random.default_rng(0)
+    frames = []
+    for ticker in tickers:
+        frame = pd.DataFrame(rng.normal(100, 10, (bars, len(columns))), columns=columns)
+        frame.insert(0, 'Date', dates)
+        frame['Ticker'] = ticker
+        frame['Adj Close'] = frame['Close']
+        frames.append(frame)
+    return frames
+
+
+def measure(fetch, tickers, iterations):
+    timings = []
+    for i in range(iterations):
+        ticker = tickers[i % len(tickers)]
+        started = time.perf_counter()
+        fetch(ticker)
+        timings.append(time.perf_counter() - started)
+    arrow_before = pa.total_allocated_bytes()
+    tracemalloc.start()
+    result = fetch(tickers[0])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    arrow_allocated = max(0, pa.total_allocated_bytes() - arrow_before)
+    del result
+    return statistics.median(timings) * 1000, peak / 1024, arrow_allocated / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark feature store backends')
+    parser.add_argument('--tickers', type=int, default=10)
+    parser.add_argument('--history', type=int, default=1500, help='bars stored per ticker')
+    parser.add_argument('--bars', type=int, default=120, help='bars fetched per request')
+    parser.add_argument('--appends', type=int, default=4, help='part files written per ticker')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/trading_bot_bench')
+    parser.add_argument('--mongomock', action='store_true',
+                        help='use an in-process mongomock database instead of mongod')
+    args = parser.parse_args()
+
+    os.environ['MONGO_URI'] = args.mongo_uri
+    if args.mongomock:
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+
+    from feature_cache import NUMERIC_COLUMNS
+    from feature_store import MongoFeatureStore, ArrowFeatureStore
+
+    tickers = [f'BENCH{i:03d}' for i in range(args.tickers)]
+    frames = synthetic_bars(tickers, args.history, NUMERIC_COLUMNS)
+    root = tempfile.mkdtemp(prefix='store-benchmark-')
+
+    stores = [('mongo', MongoFeatureStore())]
+    for file_format in ('arrow', 'parquet'):
+        for partitioning in ('ticker', 'year'):
+            path = os.path.join(root, f'{file_format}-{partitioning}')
+            # Keep the appended parts so reads see an incrementally built store
+            stores.append((f'{file_format} / {partitioning}',
+                           ArrowFeatureStore(path, file_format, partitioning, max_parts=args.appends)))
+
+    mongo_store = stores[0][1]
+    mongo_store.collection.delete_many({'Ticker': {'$in': tickers}})
+    mongo_store.prepare()
+
+    results = []
+    try:
+        for name, store in stores:
+            started = time.perf_counter()
+            for frame in frames:
+                # Written in appends, as the ingest pipeline would
+                bounds = np.linspace(0, len(frame), args.appends + 1).astype(int)
+                for start, end in zip(bounds[:-1], bounds[1:]):
+                    store.upsert(frame.iloc[start:end])
+            write_seconds = time.perf_counter() - started
+
+            loader = store.window_loader()
+            results.append((name, write_seconds)
+                           + measure(lambda t: loader(t, args.bars).to_frame(), tickers, args.iterations))
+    finally:
+        mongo_store.collection.delete_many({'Ticker': {'$in': tickers}})
+        shutil.rmtree(root)
+
+    print(f"{args.tickers} tickers x {args.history} bars stored in {args.appends} appends, "
+          f"{args.bars} bars per fetch")
+    print(f"{'store':<20}{'write s':>10}{'median ms':>12}{'peak KiB':>12}{'arrow KiB':>12}")
+    for name, write_seconds, latency, peak, arrow_allocated in results:
+        print(f"{name:<20}{write_seconds:>10.2f}{latency:>12.2f}{peak:>12.0f}{arrow_allocated:>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+#benchmarks/stub_wsgi.py
+# wsgi.py with the real service routes, synthetic bars in mongomock and a
+# stub forecaster in place of the MLflow model, for benchmarks/load_test.py:
+#
+#   gunicorn -c gunicorn.conf.py --pythonpath benchmarks stub_wsgi:app
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# model_loader reads MODEL_LOAD_MODE when it is imported, which happens below
+# before wsgi.py could set it; a warm-up thread started in the gunicorn master
+# would not survive the fork
+os.environ['MODEL_LOAD_MODE'] = 'eager'
+
+from synthetic import StubForecaster, use_mongomock, use_stub_model
+
+os.environ.setdefault('MONGO_URI', 'mongodb://localhost/trading_bot_bench')
+os.environ.setdefault('REFRESH_ENABLED', 'false')
+# Measure the model path rather than forecast cache hits
+os.environ.setdefault('FORECAST_CACHE_MAX_ENTRIES', '0')
+use_mongomock()
+
+STUB_TICKERS = int(os.getenv('STUB_TICKERS', 20))
+STUB_BARS = int(os.getenv('STUB_BARS', 120))
+STUB_MODEL_CPU_MS = float(os.getenv('STUB_MODEL_CPU_MS', 5))
+
+use_stub_model(StubForecaster(STUB_MODEL_CPU_MS))
+
+from database import model_data_collection
+from feature_cache import NUMERIC_COLUMNS
+
+
+def stub_tickers():
+    return [f"T{i:03d}" for i in range(STUB_TICKERS)]
+
+
+def seed():
+    dates = pd.bdate_range(end=pd.Timestamp.now().normalize(), periods=STUB_BARS)
+    rng = np.random.default_rng(0)
+    docs = []
+    for ticker in stub_tickers():
+        values = 100 + rng.normal(0, 1, (len(dates), len(NUMERIC_COLUMNS))).cumsum(axis=0)
+        for i, date in enumerate(dates):
+            doc = {'Date': date.to_pydatetime(), 'Ticker': ticker}
+            doc.update({col: float(values[i, j]) for j, col in enumerate(NUMERIC_COLUMNS)})
+            doc['Volume'] = 1000
+            docs.append(doc)
+    model_data_collection.insert_many(docs)
+
+
+seed()
+
+import wsgi
+
+app = wsgi.app
@@ -0,0 +1,245 @@
+#benchmarks/suite.py
+# Offline benchmark suite for the whole pipeline: synthetic OHLCV bars in
+# place of yfinance, a scratch feature store (Arrow files, mongomock or a
+# real mongod) in place of model_ready_data and a stub forecaster with a
+# fixed per-call cost in place of the MLflow model. Each case is timed over
+# several rounds and the results can be written as JSON and compared with an
+# earlier run:
+#
+#   python benchmarks/suite.py --output bench-results/base.json
+#   python benchmarks/suite.py --compare bench-results/base.json --output bench-results/new.json
+#   python benchmarks/suite.py --store mongo --mongo-uri mongodb://localhost:27017/trading_bot_bench
+#   python benchmarks/suite.py --cases indicators,predict
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import itertools
+import statistics
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import StubForecaster, ohlcv, price_source, tickers as synthetic_tickers, use_mongomock, \
+    use_stub_model
+
+CASES = ['indicators', 'prepare', 'ingest', 'fetch_cold', 'fetch_warm', 'predict', 'predict_batch']
+
+
+def measure(fn, rounds, warmup=1, setup=None):
+    # pytest-benchmark style statistics over rounds calls of fn, in seconds;
+    # setup runs once before the warm-up calls and is not timed
+    if setup is not None:
+        setup()
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    mean = statistics.mean(timings)
+    return {
+        'min': min(timings),
+        'max': max(timings),
+        'mean': mean,
+        'median': statistics.median(timings),
+        'stddev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': rounds,
+        'ops': 1 / mean if mean else float('inf'),
+    }
+
+
+def machine_info():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'commit': commit,
+    }
+
+
+def setup_environment(args):
+    # Everything here must happen before the service modules are imported
+    scratch = tempfile.mkdtemp(prefix='bench-suite-')
+    os.environ['MONGO_URI'] = args.mongo_uri
+    os.environ['REFRESH_ENABLED'] = 'false'
+    os.environ['MODEL_LOAD_MODE'] = 'eager'
+    # Time the model path rather than forecast cache hits
+    os.environ['FORECAST_CACHE_MAX_ENTRIES'] = '0'
+    if args.store == 'arrow':
+        os.environ['FEATURE_STORE'] = 'arrow'
+        os.environ['FEATURE_STORE_PATH'] = os.path.join(scratch, 'features')
+    else:
+        os.environ['FEATURE_STORE'] = 'mongo'
+        if args.store == 'mongomock':
+            use_mongomock()
+    use_stub_model(StubForecaster(args.model_call_ms, args.model_row_us))
+    return scratch
+
+
+def build_cases(args, symbols):
+    import data_handler
+    from indicators import compute_panel
+
+    source = price_source(args.years)
+    end_date = pd.Timestamp.now().normalize()
+    dates = pd.bdate_range(end_date - pd.Timedelta(days=round(365.25 * args.years)), end_date)
+    dates = dates[dates < end_date]
+    panel = np.column_stack([ohlcv(symbol, dates)['Close'].to_numpy() for symbol in symbols])
+    cases = {}
+
+    # Indicator computation over the whole (dates x tickers) panel
+    cases['indicators'] = (lambda: compute_panel(panel), {'bars': panel.size}, None)
+
+    # fetch_and_prepare_data for one symbol, downloads served by the synthetic source
+    def download_prices(symbol, start_date, end_date):
+        return source([symbol], start_date, end_date)[symbol]
+    data_handler.download_prices = download_prices
+    start, end = dates[0].strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d')
+    cases['prepare'] = (lambda: data_handler.fetch_and_prepare_data(symbols[0], start, end), {'bars': len(dates)},
+                        None)
+
+    # Full ingest of every symbol into the scratch store
+    def ingest():
+        data_handler.update_database(full_refresh=True, tickers=symbols, price_source=source)
+    cases['ingest'] = (ingest, {'symbols': len(symbols), 'rows': len(symbols) * len(dates)}, None)
+    return cases, ingest
+
+
+def build_service_cases(symbols):
+    # The service is imported only after the store holds data
+    service = importlib.import_module('predict-1')
+    client = service.app.test_client()
+    cycle = itertools.cycle(symbols)
+    cases = {}
+
+    def fetch_cold():
+        service.feature_cache.invalidate()
+        service.get_prediction_data(next(cycle))
+    cases['fetch_cold'] = (fetch_cold, {}, None)
+
+    # fetch_cold leaves the cache empty, so every symbol is loaded before the
+    # warm rounds, and each round must be a hit
+    def fill_cache():
+        service.feature_cache.invalidate()
+        for symbol in symbols:
+            service.get_prediction_data(symbol)
+
+    def fetch_warm():
+        stats = service.feature_cache.stats()
+        service.get_prediction_data(next(cycle))
+        after = service.feature_cache.stats()
+        assert after['hits'] == stats['hits'] + 1 and after['misses'] == stats['misses'], \
+            "fetch_warm missed the feature cache"
+    cases['fetch_warm'] = (fetch_warm, {}, fill_cache)
+
+    def predict():
+        response = client.post('/api/v1/trading/predict',
+                               json={'symbol': next(cycle), 'current_price': 100.0, 'prediction_days': 28})
+        assert response.status_code == 200, response.get_data(as_text=True)
+    cases['predict'] = (predict, {}, None)
+
+    batch = {'requests': symbols, 'prediction_days': 28}
+
+    def predict_batch():
+        response = client.post('/api/v1/trading/predict/batch', json=batch)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    cases['predict_batch'] = (predict_batch, {'symbols': len(symbols)}, None)
+    return cases
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {b['name']: b for b in json.load(f)['benchmarks']}
+    print(f"\ncompared with {baseline_path}")
+    print(f"{'case':<16}{'base ms':>12}{'now ms':>12}{'change':>10}")
+    for result in results:
+        base = baseline.get(result['name'])
+        if base is None:
+            continue
+        before, after = base['stats']['median'] * 1000, result['stats']['median'] * 1000
+        print(f"{result['name']:<16}{before:>12.2f}{after:>12.2f}{(after - before) / before:>+10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the offline benchmark suite')
+    parser.add_argument('--cases', default=','.join(CASES), help='Comma-separated cases to run')
+    parser.add_argument('--tickers', type=int, default=20)
+    parser.add_argument('--years', type=float, default=2)
+    parser.add_argument('--rounds', type=int, default=20, help='Rounds per case (ingest runs at most 3)')
+    parser.add_argument('--store', choices=['arrow', 'mongomock', 'mongo'], default='arrow',
+                        help='Where model_ready_data is kept; mongo wipes the database at --mongo-uri')
+    parser.add_argument('--mongo-uri', default='mongodb://localhost:27017/trading_bot_bench')
+    parser.add_argument('--model-call-ms', type=float, default=20, help='Stub model CPU time per call')
+    parser.add_argument('--model-row-us', type=float, default=20, help='Stub model CPU time per input row')
+    parser.add_argument('--output', help='Write the results to this JSON file')
+    parser.add_argument('--compare', help='Earlier JSON results to compare against')
+    args = parser.parse_args()
+
+    selected = [c.strip() for c in args.cases.split(',') if c.strip()]
+    unknown = set(selected) - set(CASES)
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+
+    scratch = setup_environment(args)
+    symbols = synthetic_tickers(args.tickers)
+    results = []
+    try:
+        cases, ingest = build_cases(args, symbols)
+        if set(selected) & {'fetch_cold', 'fetch_warm', 'predict', 'predict_batch'}:
+            if 'ingest' not in selected:
+                ingest()
+            # Ingest first so the service cases read what it wrote
+            selected = sorted(selected, key=lambda c: c != 'ingest')
+        service_cases = None
+
+        print(f"{args.tickers} tickers x {args.years:g} years, store {args.store}, stub model "
+              f"{args.model_call_ms:g} ms + {args.model_row_us:g} us/row")
+        print(f"{'case':<16}{'median ms':>12}{'min ms':>10}{'stddev':>10}{'ops/s':>10}")
+        for name in selected:
+            if name not in cases:
+                service_cases = service_cases or build_service_cases(symbols)
+                fn, extra, setup = service_cases[name]
+            else:
+                fn, extra, setup = cases[name]
+            rounds = min(args.rounds, 3) if name == 'ingest' else args.rounds
+            stats = measure(fn, rounds, warmup=0 if name == 'ingest' else 1, setup=setup)
+            results.append({'name': name, 'stats': stats, 'extra_info': extra})
+            print(f"{name:<16}{stats['median'] * 1000:>12.2f}{stats['min'] * 1000:>10.2f}"
+                  f"{stats['stddev'] * 1000:>10.2f}{stats['ops']:>10.1f}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    if args.compare:
+        compare(results, args.compare)
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({
+                'machine_info': machine_info(),
+                'datetime': datetime.utcnow().isoformat() + 'Z',
+                'params': vars(args),
+                'benchmarks': results,
+            }, f, indent=2)
+        print(f"\nresults written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+#benchmarks/synthetic.py
+# Offline stand-ins shared by the benchmarks: random-walk OHLCV bars in
+# place of yfinance, mongomock in place of mongod, and a stub forecaster in
+# place of the MLflow model.
+import time
+import numpy as np
+import pandas as pd
+
+
+def ohlcv(symbol, dates):
+    # Random-walk bars for symbol, the same for a symbol on every run
+    rng = np.random.default_rng(sum(ord(c) * 31 ** i for i, c in enumerate(symbol)) % (2 ** 32))
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, len(dates))))
+    return pd.DataFrame({
+        'Open': close * (1 + rng.normal(0, 0.002, len(dates))),
+        'High': close * 1.01,
+        'Low': close * 0.99,
+        'Close': close,
+        'Adj Close': close,
+        'Volume': rng.integers(1_000_000, 10_000_000, len(dates)),
+    }, index=pd.DatetimeIndex(dates, name='Date'))
+
+
+def price_source(years, latency_seconds=0.0):
+    # data_handler price source returning up to `years` of business-day bars
+    # for any symbols, with a fixed per-request delay standing in for the
+    # network round trip
+    def download(symbols, start_date, end_date):
+        time.sleep(latency_seconds)
+        start = max(pd.Timestamp(start_date), pd.Timestamp(end_date) - pd.Timedelta(days=round(365.25 * years)))
+        # The end date is excluded by hand: bdate_range takes closed= before
+        # pandas 1.4 (requirements.txt pins 1.3.5) and inclusive= from 2.0
+        dates = pd.bdate_range(start, end_date)
+        dates = dates[dates < pd.Timestamp(end_date)]
+        return {symbol: ohlcv(symbol, dates) for symbol in symbols}
+    return download
+
+
+def tickers(count, prefix='SYM'):
+    return [f"{prefix}{i:04d}" for i in range(count)]
+
+
+class LockedMongomock:
+    # Runs every call into a mongomock client, database, collection or cursor
+    # under one lock, and reads cursors to the end while holding it, since
+    # mongomock is not thread-safe (threaded servers otherwise fail with
+    # "dictionary changed size during iteration" and projection errors)
+
+    def __init__(self, target, lock):
+        self._target = target
+        self._lock = lock
+
+    def _wrap(self, value):
+        if type(value).__module__.startswith('mongomock'):
+            return LockedMongomock(value, self._lock)
+        return value
+
+    def __getattr__(self, name):
+        with self._lock:
+            value = getattr(self._target, name)
+        if not callable(value) or type(value).__module__.startswith('mongomock'):
+            return self._wrap(value)
+
+        def call(*args, **kwargs):
+            with self._lock:
+                return self._wrap(value(*args, **kwargs))
+        return call
+
+    def __getitem__(self, key):
+        with self._lock:
+            return self._wrap(self._target[key])
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._target))
+
+
+def use_mongomock():
+    # Must run before database is imported
+    import threading
+    import mongomock
+    import pymongo
+
+    lock = threading.RLock()
+    pymongo.MongoClient = lambda *args, **kwargs: LockedMongomock(mongomock.MongoClient(*args, **kwargs), lock)
+
+
+class StubForecaster:
+    # One value per input row, after burning call_ms of CPU per call plus
+    # row_us per input row while holding the GIL, as the AutoML forecaster
+    # does (featurizer setup and grain validation dominate small calls)
+
+    def __init__(self, call_ms=5.0, row_us=0.0):
+        self.call_ms = call_ms
+        self.row_us = row_us
+
+    def predict(self, frame):
+        deadline = time.perf_counter() + self.call_ms / 1000 + len(frame) * self.row_us / 1e6
+        while time.perf_counter() < deadline:
+            pass
+        return frame['Close'].to_numpy() * (1 + 0.001 * np.arange(len(frame)))
+
+
+def use_stub_model(model):
+    # Has model_loader hand out model instead of resolving an artifact
+    import model_loader
+
+    model_loader.resolve_model_path = lambda *args, **kwargs: ('stub-model', 'stub')
+    model_loader.load_model = lambda path: model
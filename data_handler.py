@@ -1,86 +1,396 @@
 #data_handler.py
 import os
+import time
+import argparse
+import threading
+import multiprocessing
 from datetime import datetime, timedelta
-import yfinance as yf
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+import numpy as np
 import pandas as pd
-import pandas_ta as ta
-from pymongo import MongoClient
-from dotenv import load_dotenv
+from feature_store import feature_store_from_env
+from indicators import INDICATOR_COLUMNS, STATE_VERSION, IndicatorState, compute_panel
 
-# Load environment variables
-load_dotenv()
+DEFAULT_TICKERS = ['AAPL', 'AMZN', 'BRK-B', 'GOOGL', 'JNJ', 'JPM', 'META', 'MSFT', 'NVDA', 'TSLA']
+HISTORY_START_DATE = '2019-01-01'
 
-# MongoDB setup
-mongo_uri = os.getenv('MONGO_URI')
-client = MongoClient(mongo_uri)
-db = client.get_default_database()
-model_data_collection = db['model_ready_data']
+# Ingestion pipeline tuning
+DOWNLOAD_BATCH_SIZE = int(os.getenv('DOWNLOAD_BATCH_SIZE', 50))
+DOWNLOAD_WORKERS = int(os.getenv('DOWNLOAD_WORKERS', 4))
+DOWNLOAD_RETRIES = int(os.getenv('DOWNLOAD_RETRIES', 3))
+DOWNLOAD_BACKOFF_SECONDS = float(os.getenv('DOWNLOAD_BACKOFF_SECONDS', 2))
+INDICATOR_WORKERS = int(os.getenv('INDICATOR_WORKERS', os.cpu_count() or 1))
+# Download batches with fewer price bars than this are computed on threads
+# (the NumPy kernels release the GIL); larger ones, such as a first full
+# ingest, go to the indicator process pool
+INDICATOR_PROCESS_MIN_BARS = int(os.getenv('INDICATOR_PROCESS_MIN_BARS', 20000))
+WRITE_WORKERS = int(os.getenv('WRITE_WORKERS', 2))
+
+# Trading days downloaded in front of a requested start date so the
+# indicators (MACD 26/9, Bollinger 20, RSI 14) are warmed up by its first row;
+# the lookback is trimmed off once they are computed
+WARMUP_LOOKBACK_BARS = int(os.getenv('WARMUP_LOOKBACK_BARS', 250))
+
+# Where model_ready_data is kept, selected by FEATURE_STORE (mongo | arrow)
+feature_store = feature_store_from_env()
+
+# Callbacks run with (ticker, new_data) after new bars are written, e.g. to
+# keep in-process caches of model_ready_data current
+ingest_listeners = []
+
+def add_ingest_listener(listener):
+    ingest_listeners.append(listener)
+
+def load_tickers():
+    # The ticker universe comes from TICKERS (comma separated) or TICKERS_FILE
+    # (one symbol per line), falling back to the default list
+    tickers_file = os.getenv('TICKERS_FILE')
+    if tickers_file:
+        with open(tickers_file) as file:
+            tickers = [line.strip() for line in file]
+        return [t for t in tickers if t and not t.startswith('#')]
+    tickers = os.getenv('TICKERS')
+    if tickers:
+        return [t.strip() for t in tickers.split(',') if t.strip()]
+    return list(DEFAULT_TICKERS)
+
+TICKERS = load_tickers()
+
+def download_prices(symbol, start_date, end_date):
+    # Fetch historical stock data. yfinance is imported here so the pipeline
+    # can run from another price source without it.
+    import yfinance as yf
+
+    return yf.download(symbol, start=start_date, end=end_date)
+
+def download_prices_batch(symbols, start_date, end_date):
+    # One multi-symbol request, split back into a DataFrame per symbol
+    import yfinance as yf
+
+    data = yf.download(symbols, start=start_date, end=end_date, group_by='ticker',
+                       threads=False, progress=False)
+    if not isinstance(data.columns, pd.MultiIndex):
+        return {symbols[0]: data} if len(symbols) == 1 else {}
+    prices = {}
+    for symbol in symbols:
+        if symbol in data.columns.get_level_values(0):
+            frame = data[symbol].dropna(how='all')
+            if not frame.empty:
+                prices[symbol] = frame
+    return prices
+
+def download_with_retry(symbols, start_date, end_date, price_source=None):
+    # Retries failed requests and also the symbols that came back without
+    # bars, since yf.download reports a failed symbol as empty columns rather
+    # than raising. A range without a weekday has no bars to wait for.
+    price_source = price_source or download_prices_batch
+    expect_bars = np.busday_count(pd.Timestamp(start_date).date(), pd.Timestamp(end_date).date()) > 0
+    prices = {}
+    missing = list(symbols)
+    for attempt in range(DOWNLOAD_RETRIES + 1):
+        try:
+            fetched = price_source(missing, start_date, end_date)
+        except Exception as e:
+            if attempt == DOWNLOAD_RETRIES:
+                if not prices:
+                    raise
+                print(f"Download of {len(missing)} symbols failed ({e}), giving up on them")
+                return prices
+            reason = str(e)
+        else:
+            prices.update({symbol: frame for symbol, frame in fetched.items() if not frame.empty})
+            missing = [symbol for symbol in missing if symbol not in prices]
+            if not missing or not expect_bars or attempt == DOWNLOAD_RETRIES:
+                return prices
+            reason = f"no bars for {', '.join(missing)}"
+        delay = DOWNLOAD_BACKOFF_SECONDS * 2 ** attempt
+        print(f"Download of {len(missing)} symbols failed ({reason}), retrying in {delay:.0f}s")
+        time.sleep(delay)
+
+def lookback_start(start_date, bars=WARMUP_LOOKBACK_BARS):
+    # Date roughly `bars` trading days before start_date, with room for
+    # market holidays
+    start = pd.Timestamp(start_date) - pd.offsets.BDay(bars + bars // 20 + 5)
+    return start.strftime('%Y-%m-%d')
+
+def attach_indicators(data, symbol, values):
+    # Add RSI, MACD, Bollinger Bands and the moving average to the DataFrame.
+    # Rows before the indicators have warmed up stay NaN: filling them would
+    # copy in values computed from later bars.
+    for i, column in enumerate(INDICATOR_COLUMNS):
+        data[column] = values[:, i]
 
-def fetch_and_prepare_data(symbol, start_date, end_date):
-    # Fetch historical stock data
-    data = yf.download(symbol, start=start_date, end=end_date)
-    
-    # Calculate RSI and MACD
-    data['RSI'] = ta.rsi(data['Close'])
-    macd = ta.macd(data['Close'])
-    
-    # Add MACD, MACD_Signal, and MACD_Hist to the DataFrame
-    data = pd.concat([data, macd], axis=1)
-    
-    # Calculate Bollinger Bands
-    bollinger = ta.bbands(data['Close'], length=20, std=2)
-    
-    # Add Bollinger Bands to the DataFrame
-    data = pd.concat([data, bollinger], axis=1)
-    
-    # Calculate Moving Average
-    data['MA'] = ta.sma(data['Close'], length=20)
-    
     # Add a column for the ticker
     data['Ticker'] = symbol
-    
-    # Forward fill and backward fill missing values
-    data.ffill(inplace=True)
-    data.bfill(inplace=True)
-    
+
+    return data
+
+def bars_only(prices):
+    # Rows without a close are not bars, and a re-sent date keeps its latest values
+    prices = prices.dropna(subset=['Close'])
+    return prices[~prices.index.duplicated(keep='last')]
+
+def add_indicators(data, symbol):
+    # Calculate all indicators in one pass over the closing prices
+    values, _ = compute_panel(data['Close'].to_numpy(dtype=float))
+    return attach_indicators(data, symbol, values[:, 0, :])
+
+def fetch_and_prepare_data(symbol, start_date, end_date):
+    # The indicators are computed from the start of a warm-up lookback and
+    # the lookback is trimmed off, so the first row has real values
+    data = bars_only(download_prices(symbol, lookback_start(start_date), end_date))
+    data = add_indicators(data, symbol)
+    data = data[data.index >= pd.Timestamp(start_date)]
+
     # Reset index to have Date as a column
     data.reset_index(inplace=True)
-    
+
     return data
 
-def update_database():
-    tickers = ['AAPL', 'AMZN', 'BRK-B', 'GOOGL', 'JNJ', 'JPM', 'META', 'MSFT', 'NVDA', 'TSLA']
-    start_date = '2019-01-01'
-    end_date = datetime.now().strftime('%Y-%m-%d')
+def compute_group(frames, state=None, start_date=None):
+    # Indicators for {ticker: prices} as one (Date x Ticker) panel, starting
+    # from state when given. Returns (ticker, data, state record) per ticker
+    # with rows before start_date trimmed off.
+    closes = pd.concat({ticker: frame['Close'] for ticker, frame in frames.items()}, axis=1)
+    values, state = compute_panel(closes.to_numpy(dtype=float), state)
+    records = state.to_records()
+
+    results = []
+    for i, ticker in enumerate(closes.columns):
+        frame = frames[ticker]
+        rows = closes.index.get_indexer(frame.index)
+        data = attach_indicators(frame.copy(), ticker, values[rows, i, :])
+        if start_date is not None:
+            data = data[data.index >= pd.Timestamp(start_date)]
+        results.append((ticker, data.reset_index(), records[i]))
+    return results
+
+def prepare_batch_data(jobs):
+    # Computes the indicators for a whole download batch. New tickers are
+    # computed from the start of their lookback download. The others continue
+    # from the IndicatorState saved at their high-water mark (or rebuilt from
+    # their stored history when there is none), which gives bit-identical
+    # values to recomputing the whole history. Runs in the indicator process
+    # pool, so it must not touch the feature store.
+    new, continued = {}, {}
+    for ticker, prices, last_date, state, history in jobs:
+        prices = bars_only(prices)
+        if last_date is not None:
+            prices = prices[prices.index > pd.Timestamp(last_date)]
+        if prices.empty:
+            continue
+        prices.index.name = 'Date'
+        if last_date is None:
+            new[ticker] = prices
+            continue
+        if state is None:
+            closes = bars_only(history)['Close'] if not history.empty else pd.Series(dtype=float)
+            _, rebuilt = compute_panel(closes.to_numpy(dtype=float))
+            state = rebuilt.to_records()[0]
+        continued[ticker] = (prices, state)
 
-    # Clear the existing data in the collection
-    model_data_collection.delete_many({})
-    print("Cleared existing data from the database.")
+    results = []
+    if new:
+        results += compute_group(new, start_date=HISTORY_START_DATE)
+    if continued:
+        state = IndicatorState.from_records([state for _, state in continued.values()])
+        results += compute_group({ticker: prices for ticker, (prices, _) in continued.items()}, state)
+    return results
 
+def get_high_water_marks(tickers):
+    return feature_store.get_high_water_marks(tickers)
+
+def get_high_water_mark(ticker):
+    return feature_store.get_high_water_marks([ticker])[ticker]
+
+def set_high_water_mark(ticker, last_date, indicator_state=None):
+    feature_store.set_high_water_mark(ticker, last_date, indicator_state)
+
+def load_warmup_bars(ticker, last_date, bars=None):
+    return feature_store.load_warmup_bars(ticker, last_date, bars)
+
+def warm_start(ticker, last_date, record):
+    # (state, history) to continue ticker's indicators after last_date: the
+    # persisted state when it was saved at that mark, otherwise the stored
+    # price history to rebuild it from
+    if record is not None and record.get('version') == STATE_VERSION and \
+            record.get('last_date') == pd.Timestamp(last_date).isoformat():
+        return record, None
+    print(f"No indicator state for {ticker} at {last_date:%Y-%m-%d}, rebuilding it from the stored bars")
+    return None, load_warmup_bars(ticker, last_date)
+
+def fetch_incremental_data(ticker, last_date, end_date):
+    start_date = (last_date + timedelta(days=1)).strftime('%Y-%m-%d')
+    new_prices = download_prices(ticker, start_date, end_date)
+    state, history = warm_start(ticker, last_date, feature_store.get_indicator_states([ticker])[ticker])
+    results = prepare_batch_data([(ticker, new_prices, last_date, state, history)])
+    return results[0][1] if results else pd.DataFrame()
+
+def upsert_bars(data):
+    return feature_store.upsert(data)
+
+def plan_batches(tickers, marks, end_date):
+    # Group tickers that share a start date so each group is one download request
+    groups = {}
     for ticker in tickers:
-        # Check if we have data for this ticker
-        existing_data = model_data_collection.find_one({'Ticker': ticker})
-        
-        if existing_data:
+        last_date = marks.get(ticker)
+        if last_date is None:
+            # The full history, plus the warm-up lookback in front of it
+            start_date = lookback_start(HISTORY_START_DATE)
+        else:
             # If data exists, only fetch the missing dates
-            last_date = model_data_collection.find({'Ticker': ticker}).sort('Date', -1).limit(1)[0]['Date']
             start_date = (last_date + timedelta(days=1)).strftime('%Y-%m-%d')
-        
+
         if start_date < end_date:
-            new_data = fetch_and_prepare_data(ticker, start_date, end_date)
-            
-            # Convert DataFrame to list of dictionaries
-            data_dict = new_data.to_dict('records')
-            
-            # Insert new data into MongoDB
-            model_data_collection.insert_many(data_dict)
-            
-            print(f"Updated data for {ticker} from {start_date} to {end_date}")
+            groups.setdefault(start_date, []).append(ticker)
         else:
             print(f"Data for {ticker} is already up to date")
 
+    batches = []
+    for start_date, group in sorted(groups.items()):
+        for i in range(0, len(group), DOWNLOAD_BATCH_SIZE):
+            batches.append((group[i:i + DOWNLOAD_BATCH_SIZE], start_date))
+    return batches
+
+def download_stage(symbols, start_date, end_date, marks, price_source=None):
+    prices = download_with_retry(symbols, start_date, end_date, price_source)
+    states = feature_store.get_indicator_states([t for t in symbols if marks.get(t) is not None])
+    jobs = []
+    for ticker in symbols:
+        if ticker not in prices:
+            print(f"No price data returned for {ticker}")
+            continue
+        last_date = marks.get(ticker)
+        state, history = warm_start(ticker, last_date, states[ticker]) if last_date is not None else (None, None)
+        jobs.append((ticker, prices[ticker], last_date, state, history))
+    return jobs
+
+def write_stage(ticker, new_data, indicator_state):
+    written = upsert_bars(new_data)
+    # The state is saved with the mark it belongs to, after the bars are in
+    last_date = new_data['Date'].max().to_pydatetime()
+    set_high_water_mark(ticker, last_date, {**indicator_state, 'last_date': pd.Timestamp(last_date).isoformat()})
+    for listener in ingest_listeners:
+        try:
+            listener(ticker, new_data)
+        except Exception as e:
+            print(f"Ingest listener failed for {ticker}: {e}")
+    return written
+
+_process_pool = None
+_process_pool_pid = None
+_process_pool_lock = threading.Lock()
+
+def indicator_process_pool(reset=False):
+    # Created once per process and kept across refreshes. Workers come from a
+    # forkserver rather than a fork of the caller, which may be a threaded web
+    # worker holding the model, the database client and their locks. They
+    # re-import the main script, so services compute on threads instead
+    # (update_database(processes=False)).
+    global _process_pool, _process_pool_pid
+    with _process_pool_lock:
+        if reset or _process_pool is None or _process_pool_pid != os.getpid():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['data_handler'])
+            _process_pool = ProcessPoolExecutor(max_workers=INDICATOR_WORKERS, mp_context=context)
+            _process_pool_pid = os.getpid()
+        return _process_pool
+
+def submit_compute(thread_pool, jobs, processes=True):
+    bars = sum(len(prices) + (len(history) if history is not None else 0)
+               for _, prices, _, _, history in jobs)
+    if not processes or INDICATOR_WORKERS <= 1 or bars < INDICATOR_PROCESS_MIN_BARS:
+        return thread_pool.submit(prepare_batch_data, jobs)
+    try:
+        return indicator_process_pool().submit(prepare_batch_data, jobs)
+    except BrokenProcessPool:
+        # A worker died in an earlier refresh
+        return indicator_process_pool(reset=True).submit(prepare_batch_data, jobs)
+
+def update_database(full_refresh=False, tickers=None, price_source=None, processes=True):
+    # Downloads, indicator computation and writes run in separate pools so
+    # network, CPU and database I/O overlap across batches. processes=False
+    # keeps the indicator computation on threads.
+    tickers = tickers or TICKERS
+    end_date = datetime.now().strftime('%Y-%m-%d')
+
+    feature_store.prepare()
+
+    if full_refresh:
+        # Clear the existing data in the store
+        feature_store.clear()
+        print("Cleared existing data from the feature store.")
+        marks = {}
+    else:
+        marks = get_high_water_marks(tickers)
+
+    batches = plan_batches(tickers, marks, end_date)
+    if not batches:
+        return 0
+
+    updated = 0
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as download_pool, \
+            ThreadPoolExecutor(max_workers=INDICATOR_WORKERS) as compute_pool, \
+            ThreadPoolExecutor(max_workers=WRITE_WORKERS) as write_pool:
+        # Every in-flight future with its stage: a batch's compute is submitted
+        # as soon as its download finishes and its writes as soon as the
+        # compute does, while other batches are still downloading
+        pending = {
+            download_pool.submit(download_stage, symbols, start_date, end_date, marks, price_source):
+                ('download', symbols, start_date)
+            for symbols, start_date in batches
+        }
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = pending.pop(future)
+
+                if stage[0] == 'download':
+                    _, symbols, start_date = stage
+                    try:
+                        jobs = future.result()
+                    except Exception as e:
+                        print(f"Failed to download {', '.join(symbols)} from {start_date}: {e}")
+                        continue
+                    if jobs:
+                        pending[submit_compute(compute_pool, jobs, processes)] = \
+                            ('compute', [job[0] for job in jobs], start_date)
+
+                elif stage[0] == 'compute':
+                    _, symbols, start_date = stage
+                    try:
+                        results = {ticker: (data, state) for ticker, data, state in future.result()}
+                    except Exception as e:
+                        print(f"Failed to compute indicators for {', '.join(symbols)}: {e}")
+                        continue
+                    for ticker in symbols:
+                        new_data, state = results.get(ticker, (None, None))
+                        if new_data is None or new_data.empty:
+                            print(f"No new bars for {ticker} since {start_date}")
+                            continue
+                        pending[write_pool.submit(write_stage, ticker, new_data, state)] = \
+                            ('write', ticker, start_date)
+
+                else:
+                    _, ticker, start_date = stage
+                    try:
+                        written = future.result()
+                    except Exception as e:
+                        print(f"Failed to write data for {ticker}: {e}")
+                        continue
+                    updated += 1
+                    print(f"Updated data for {ticker} from {start_date} to {end_date} ({written} rows)")
+
+    return updated
+
 def ensure_data_is_updated():
-    update_database()            
+    update_database()
 
 if __name__ == "__main__":
-    update_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Refresh model_ready_data in the feature store')
+    parser.add_argument('--full', action='store_true',
+                        help='wipe the stored data and reload the full history')
+    args = parser.parse_args()
+    update_database(full_refresh=args.full)
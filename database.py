@@ -0,0 +1,55 @@
+#database.py
+import os
+from pymongo import MongoClient, ASCENDING
+from dotenv import load_dotenv
+
+# motor is only needed by the asyncio service (predict_async.py)
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+# Load environment variables
+load_dotenv()
+
+# MongoDB setup, one pooled client per process shared by every module
+mongo_uri = os.getenv('MONGO_URI')
+pool_options = {
+    'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', 50)),
+    'minPoolSize': int(os.getenv('MONGO_MIN_POOL_SIZE', 2)),
+    'maxIdleTimeMS': int(os.getenv('MONGO_MAX_IDLE_TIME_MS', 300000)),
+    'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000)),
+    'retryReads': True,
+}
+client = MongoClient(mongo_uri, **pool_options)
+db = client.get_default_database()
+model_data_collection = db['model_ready_data']
+ingest_state_collection = db['ingest_state']
+
+def ensure_indexes():
+    # Backs the (Ticker, Date) upserts and the per-ticker date range reads
+    model_data_collection.create_index(
+        [('Ticker', ASCENDING), ('Date', ASCENDING)], unique=True, name='ticker_date')
+    ingest_state_collection.create_index('Ticker', unique=True)
+
+def bootstrap_indexes():
+    # Called at service startup; a read-only user cannot create indexes, so
+    # failures are reported rather than fatal
+    try:
+        ensure_indexes()
+        print("MongoDB indexes are in place")
+    except Exception as e:
+        print(f"Could not create MongoDB indexes: {e}")
+
+_async_client = None
+
+def async_model_data_collection():
+    # model_ready_data through a motor client with the same pool settings,
+    # created on first use so the blocking services never open it. None when
+    # motor is not installed.
+    global _async_client
+    if AsyncIOMotorClient is None:
+        return None
+    if _async_client is None:
+        _async_client = AsyncIOMotorClient(mongo_uri, **pool_options)
+    return _async_client.get_default_database()['model_ready_data']
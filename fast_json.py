@@ -0,0 +1,71 @@
+#fast_json.py
+import json
+import time
+from flask import Response
+from flask.json.provider import DefaultJSONProvider
+from instrumentation import observe_stage
+
+# orjson is optional; without it responses go through the stdlib encoder
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    # Flask JSON provider encoding with orjson, which also takes NumPy arrays
+    # and scalars directly. Dates and other types orjson does not handle go
+    # through Flask's default hook, so the output matches jsonify's.
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+
+def dumps(obj, sort_keys=False):
+    # Compact JSON text for obj, outside of a Flask response; sort_keys
+    # matches jsonify's key order
+    if orjson is None:
+        return json.dumps(obj, separators=(',', ':'), default=float, sort_keys=sort_keys)
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    if sort_keys:
+        option |= orjson.OPT_SORT_KEYS
+    return orjson.dumps(obj, option=option).decode()
+
+
+def prefers_ndjson(accept):
+    # Streaming is opt-in: only when the Accept header prefers NDJSON over JSON
+    best = accept.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+
+def wants_ndjson(request):
+    return prefers_ndjson(request.accept_mimetypes)
+
+
+def ndjson_response(records):
+    # Streams one JSON line per record as the generator produces it. Once the
+    # first line is out the status can no longer change, so a failure is
+    # reported as a final error record.
+    def lines():
+        # Encoding time is summed over the stream and recorded once
+        encoding = 0.0
+        try:
+            for record in records:
+                started = time.perf_counter()
+                line = dumps(record) + '\n'
+                encoding += time.perf_counter() - started
+                yield line
+        except Exception as e:
+            print(f"Error while streaming: {e}")
+            yield dumps({'type': 'error', 'error': str(e)}) + '\n'
+        finally:
+            observe_stage('serialize', encoding)
+
+    return Response(lines(), mimetype='application/x-ndjson')
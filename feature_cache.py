@@ -0,0 +1,305 @@
+#feature_cache.py
+import os
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+from pymongo import DESCENDING
+from pymongo.errors import OperationFailure
+from instrumentation import stage
+
+# Columns the model expects, in order
+FEATURE_COLUMNS = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Ticker',
+                   'RSI', 'MACD_12_26_9', 'MACDh_12_26_9', 'MACDs_12_26_9',
+                   'BBL_20_2.0', 'BBM_20_2.0', 'BBU_20_2.0', 'BBB_20_2.0', 'BBP_20_2.0', 'MA']
+NUMERIC_COLUMNS = [col for col in FEATURE_COLUMNS if col not in ('Date', 'Ticker')]
+
+FEATURE_CACHE_BARS = int(os.getenv('FEATURE_CACHE_BARS', 120))
+FEATURE_CACHE_TTL_SECONDS = float(os.getenv('FEATURE_CACHE_TTL_SECONDS', 300))
+FEATURE_CACHE_MAX_ENTRIES = int(os.getenv('FEATURE_CACHE_MAX_ENTRIES', 1000))
+FEATURE_CACHE_MAX_BYTES = int(os.getenv('FEATURE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+FEATURE_FETCH_MODE = os.getenv('FEATURE_FETCH_MODE', 'columnar')
+
+# model_ready_data fields the model does not use. Dotted field names cannot be
+# named in an inclusion projection, so the feature set is selected by exclusion.
+FEATURE_PROJECTION = {'_id': 0, 'Adj Close': 0, 'Ticker': 0}
+
+
+class FeatureWindow:
+    # The last N bars of one ticker, stored column by column as NumPy arrays
+
+    def __init__(self, ticker, dates, columns):
+        self.ticker = ticker
+        self.dates = dates
+        self.columns = columns
+        self.loaded_at = time.monotonic()
+        self.nbytes = dates.nbytes + sum(values.nbytes for values in columns.values())
+
+    def __len__(self):
+        return len(self.dates)
+
+    @classmethod
+    def from_documents(cls, ticker, docs):
+        # docs sorted by Date ascending
+        dates = np.array([doc['Date'] for doc in docs], dtype='datetime64[ns]')
+        columns = {col: np.array([doc.get(col, np.nan) for doc in docs], dtype=float)
+                   for col in NUMERIC_COLUMNS}
+        return cls(ticker, dates, columns)
+
+    @classmethod
+    def from_frame(cls, ticker, frame):
+        frame = frame.sort_values('Date')
+        dates = frame['Date'].to_numpy(dtype='datetime64[ns]')
+        columns = {col: frame[col].to_numpy(dtype=float) if col in frame else np.full(len(frame), np.nan)
+                   for col in NUMERIC_COLUMNS}
+        return cls(ticker, dates, columns)
+
+    def appended(self, other, max_bars):
+        # New window with the bars of other that are newer than this one's,
+        # trimmed to the last max_bars bars
+        newer = other.dates > self.dates[-1] if len(self) else np.ones(len(other), dtype=bool)
+        dates = np.concatenate([self.dates, other.dates[newer]])[-max_bars:]
+        columns = {col: np.concatenate([self.columns[col], other.columns[col][newer]])[-max_bars:]
+                   for col in NUMERIC_COLUMNS}
+        return FeatureWindow(self.ticker, dates, columns)
+
+    def to_frame(self, start_date=None, end_date=None):
+        # Model input built straight from the column arrays
+        mask = np.ones(len(self), dtype=bool)
+        if start_date is not None:
+            mask &= self.dates >= np.datetime64(pd.Timestamp(start_date))
+        if end_date is not None:
+            mask &= self.dates <= np.datetime64(pd.Timestamp(end_date))
+        data = {'Date': self.dates[mask]}
+        for col in FEATURE_COLUMNS[1:]:
+            if col == 'Ticker':
+                data[col] = np.full(mask.sum(), self.ticker, dtype=object)
+            else:
+                data[col] = self.columns[col][mask]
+        if np.isfinite(data['Volume']).all():
+            # Volume is an integer column in the model's input schema
+            data['Volume'] = data['Volume'].astype(np.int64)
+        return pd.DataFrame(data, columns=FEATURE_COLUMNS)
+
+
+class FeatureCache:
+    # LRU cache of FeatureWindows keyed by ticker, bounded by entry count and
+    # total bytes, with entries expiring after ttl_seconds
+
+    def __init__(self, loader, max_bars=FEATURE_CACHE_BARS, ttl_seconds=FEATURE_CACHE_TTL_SECONDS,
+                 max_entries=FEATURE_CACHE_MAX_ENTRIES, max_bytes=FEATURE_CACHE_MAX_BYTES):
+        self.loader = loader
+        self.max_bars = max_bars
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def _lookup(self, ticker):
+        # The cached window for ticker, or None on a miss
+        with self._lock:
+            window = self._entries.get(ticker)
+            if window is not None:
+                if time.monotonic() - window.loaded_at <= self.ttl_seconds:
+                    self._entries.move_to_end(ticker)
+                    self.hits += 1
+                    return window
+                self._remove(ticker)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def _reaches_back(self, window, start_date):
+        # True when the requested range starts before the cached window
+        return start_date is not None and len(window) >= self.max_bars and \
+            window.dates[0] > np.datetime64(pd.Timestamp(start_date))
+
+    def get(self, ticker):
+        window = self._lookup(ticker)
+        if window is None:
+            window = self.loader(ticker, self.max_bars)
+            with self._lock:
+                self._put(window)
+        return window
+
+    def get_frame(self, ticker, start_date=None, end_date=None):
+        with stage('fetch'):
+            window = self.get(ticker)
+            if self._reaches_back(window, start_date):
+                window = self.loader(ticker, None, start_date)
+        with stage('assemble'):
+            return window.to_frame(start_date, end_date)
+
+    async def get_frame_async(self, ticker, async_loader, start_date=None, end_date=None):
+        # get_frame for the asyncio service: misses are awaited on
+        # async_loader (same arguments as loader) instead of blocking
+        with stage('fetch'):
+            window = self._lookup(ticker)
+            if window is None:
+                window = await async_loader(ticker, self.max_bars)
+                with self._lock:
+                    self._put(window)
+            if self._reaches_back(window, start_date):
+                window = await async_loader(ticker, None, start_date)
+        with stage('assemble'):
+            return window.to_frame(start_date, end_date)
+
+    def append(self, ticker, new_data):
+        # Called by data_handler after it writes new bars for ticker
+        with self._lock:
+            window = self._entries.get(ticker)
+            if window is None:
+                return
+            update = FeatureWindow.from_frame(ticker, new_data)
+            if len(update) and len(window) and update.dates[0] <= window.dates[-1]:
+                # Existing bars were rewritten, reload on next access
+                self._remove(ticker)
+                return
+            self._remove(ticker)
+            self._put(window.appended(update, self.max_bars))
+
+    def invalidate(self, ticker=None):
+        with self._lock:
+            if ticker is None:
+                self._entries.clear()
+                self._bytes = 0
+            elif ticker in self._entries:
+                self._remove(ticker)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    def _put(self, window):
+        if window.ticker in self._entries:
+            self._remove(window.ticker)
+        self._entries[window.ticker] = window
+        self._bytes += window.nbytes
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def _remove(self, ticker):
+        window = self._entries.pop(ticker)
+        self._bytes -= window.nbytes
+
+
+def _columnar_pipeline(query, bars):
+    # Sort and limit on the (Ticker, Date) index, then fold the matching bars
+    # into one document holding an array per column. $getField is needed
+    # because the Bollinger Band field names contain dots.
+    pipeline = [{'$match': query}, {'$sort': {'Date': DESCENDING}}]
+    if bars:
+        pipeline.append({'$limit': bars})
+    group = {'_id': None, 'Date': {'$push': '$Date'}}
+    for i, col in enumerate(NUMERIC_COLUMNS):
+        group[f'c{i}'] = {'$push': {'$ifNull': [{'$getField': col}, None]}}
+    pipeline.append({'$group': group})
+    return pipeline
+
+
+def _window_query(ticker, start_date):
+    query = {'Ticker': ticker}
+    if start_date is not None:
+        query['Date'] = {'$gte': pd.Timestamp(start_date).to_pydatetime()}
+    return query
+
+
+def _columnar_window(ticker, result):
+    # FeatureWindow from the single document _columnar_pipeline returns
+    if not result:
+        return FeatureWindow(ticker, np.array([], dtype='datetime64[ns]'),
+                             {col: np.array([], dtype=float) for col in NUMERIC_COLUMNS})
+    arrays = result[0]
+    dates = np.array(arrays['Date'][::-1], dtype='datetime64[ns]')
+    columns = {col: np.array(arrays[f'c{i}'][::-1], dtype=float)
+               for i, col in enumerate(NUMERIC_COLUMNS)}
+    return FeatureWindow(ticker, dates, columns)
+
+
+def mongo_window_loader(collection, mode=FEATURE_FETCH_MODE):
+    # Loader reading the last `bars` bars of a ticker (or every bar since
+    # start_date when bars is None) from model_ready_data.
+    #
+    # 'columnar' has the server return one array per column (MongoDB 5.0+),
+    # 'documents' reads projected documents. Columnar falls back to documents
+    # if the server cannot run the pipeline.
+    state = {'mode': mode}
+
+    def load_columnar(ticker, query, bars):
+        return _columnar_window(ticker, list(collection.aggregate(_columnar_pipeline(query, bars))))
+
+    def load_documents(ticker, query, bars):
+        cursor = collection.find(query, FEATURE_PROJECTION).sort('Date', DESCENDING)
+        if bars:
+            cursor = cursor.limit(bars)
+        docs = list(cursor)
+        docs.reverse()
+        return FeatureWindow.from_documents(ticker, docs)
+
+    def load(ticker, bars, start_date=None):
+        query = _window_query(ticker, start_date)
+        if state['mode'] == 'columnar':
+            try:
+                return load_columnar(ticker, query, bars)
+            except (OperationFailure, NotImplementedError) as e:
+                print(f"Columnar feature fetch unavailable ({e}), using projected documents")
+                state['mode'] = 'documents'
+        return load_documents(ticker, query, bars)
+
+    return load
+
+
+def motor_window_loader(collection, mode=FEATURE_FETCH_MODE):
+    # mongo_window_loader for a motor collection: the same queries, awaited
+    # on the event loop instead of holding a thread
+    state = {'mode': mode}
+
+    async def load_columnar(ticker, query, bars):
+        cursor = collection.aggregate(_columnar_pipeline(query, bars))
+        return _columnar_window(ticker, await cursor.to_list(None))
+
+    async def load_documents(ticker, query, bars):
+        cursor = collection.find(query, FEATURE_PROJECTION).sort('Date', DESCENDING)
+        if bars:
+            cursor = cursor.limit(bars)
+        docs = await cursor.to_list(None)
+        docs.reverse()
+        return FeatureWindow.from_documents(ticker, docs)
+
+    async def load(ticker, bars, start_date=None):
+        query = _window_query(ticker, start_date)
+        if state['mode'] == 'columnar':
+            try:
+                return await load_columnar(ticker, query, bars)
+            except (OperationFailure, NotImplementedError) as e:
+                print(f"Columnar feature fetch unavailable ({e}), using projected documents")
+                state['mode'] = 'documents'
+        return await load_documents(ticker, query, bars)
+
+    return load
+
+
+def threaded_window_loader(loader, executor):
+    # Awaitable wrapper running a blocking loader on executor, for stores
+    # without an asyncio driver
+    async def load(ticker, bars, start_date=None):
+        return await asyncio.get_running_loop().run_in_executor(executor, loader, ticker, bars, start_date)
+
+    return load
@@ -0,0 +1,395 @@
+#feature_store.py
+import os
+import glob
+import json
+import time
+import uuid
+import shutil
+import argparse
+import threading
+from datetime import datetime
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+from pymongo import ReplaceOne, DESCENDING
+from feature_cache import (FEATURE_FETCH_MODE, NUMERIC_COLUMNS, FeatureWindow, mongo_window_loader,
+                           motor_window_loader, threaded_window_loader)
+
+# Where model_ready_data lives: 'mongo' (the model_ready_data collection) or
+# 'arrow' (partitioned columnar files under FEATURE_STORE_PATH)
+FEATURE_STORE = os.getenv('FEATURE_STORE', 'mongo')
+FEATURE_STORE_PATH = os.getenv('FEATURE_STORE_PATH', os.path.join('data', 'features'))
+FEATURE_STORE_FORMAT = os.getenv('FEATURE_STORE_FORMAT', 'arrow')  # arrow | parquet
+FEATURE_STORE_PARTITIONING = os.getenv('FEATURE_STORE_PARTITIONING', 'ticker')  # ticker | year
+FEATURE_STORE_MAX_PARTS = int(os.getenv('FEATURE_STORE_MAX_PARTS', 16))
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Adj Close', 'Volume']
+
+# Every part file is written with this schema so partitions always unify
+STORE_SCHEMA = pa.schema(
+    [('Date', pa.timestamp('ns')), ('Ticker', pa.string())]
+    + [(col, pa.float64()) for col in ['Adj Close'] + NUMERIC_COLUMNS])
+
+
+def _timestamp(value):
+    return pa.scalar(pd.Timestamp(value).value, pa.timestamp('ns'))
+
+
+class MongoFeatureStore:
+    # model_ready_data in MongoDB, with the ingest high-water marks kept in
+    # the ingest_state collection
+
+    def __init__(self):
+        from database import model_data_collection, ingest_state_collection
+        self.collection = model_data_collection
+        self.state_collection = ingest_state_collection
+
+    def prepare(self):
+        from database import ensure_indexes
+        ensure_indexes()
+
+    def clear(self):
+        self.collection.delete_many({})
+        self.state_collection.delete_many({})
+
+    def get_high_water_marks(self, tickers):
+        marks = {state['Ticker']: state['last_date'] for state in self.state_collection.find(
+            {'Ticker': {'$in': tickers}}, {'Ticker': 1, 'last_date': 1})}
+        for ticker in tickers:
+            if ticker not in marks:
+                marks[ticker] = self.last_date(ticker)
+        return marks
+
+    def last_date(self, ticker):
+        # Fallback for collections written before ingest_state existed
+        latest = self.collection.find_one({'Ticker': ticker}, {'Date': 1}, sort=[('Date', DESCENDING)])
+        return latest['Date'] if latest else None
+
+    def set_high_water_mark(self, ticker, last_date, indicator_state=None):
+        # The indicator state is written with the mark it belongs to; a mark
+        # set without one clears any older state
+        self.state_collection.update_one(
+            {'Ticker': ticker},
+            {'$set': {'last_date': last_date, 'indicator_state': indicator_state,
+                      'updated_at': datetime.utcnow()}},
+            upsert=True)
+
+    def get_indicator_states(self, tickers):
+        states = {state['Ticker']: state.get('indicator_state') for state in self.state_collection.find(
+            {'Ticker': {'$in': tickers}}, {'Ticker': 1, 'indicator_state': 1})}
+        return {ticker: states.get(ticker) for ticker in tickers}
+
+    def load_warmup_bars(self, ticker, last_date, bars=None):
+        # The last `bars` price bars up to last_date, or all of them
+        projection = {'_id': 0, 'Date': 1}
+        projection.update({col: 1 for col in PRICE_COLUMNS})
+        cursor = self.collection.find(
+            {'Ticker': ticker, 'Date': {'$lte': last_date}}, projection
+        ).sort('Date', DESCENDING)
+        if bars:
+            cursor = cursor.limit(bars)
+        warmup = pd.DataFrame(list(cursor))
+        if warmup.empty:
+            return warmup
+        return warmup.set_index('Date').sort_index()
+
+    def upsert(self, data):
+        if data.empty:
+            return 0
+        # Whole-document replacement, since $set would treat the dots in the
+        # Bollinger Band field names (BBL_20_2.0, ...) as nested paths
+        operations = [
+            ReplaceOne({'Ticker': doc['Ticker'], 'Date': doc['Date']}, doc, upsert=True)
+            for doc in data.to_dict('records')
+        ]
+        result = self.collection.bulk_write(operations, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    def window_loader(self, mode=FEATURE_FETCH_MODE):
+        return mongo_window_loader(self.collection, mode)
+
+    def async_window_loader(self, executor, mode=FEATURE_FETCH_MODE):
+        # Awaitable loader for the asyncio service: motor when it is
+        # installed, otherwise the blocking loader on executor
+        from database import async_model_data_collection
+        collection = async_model_data_collection()
+        if collection is None:
+            print("motor is not installed, running MongoDB reads on the I/O thread pool")
+            return threaded_window_loader(self.window_loader(mode), executor)
+        return motor_window_loader(collection, mode)
+
+
+class ArrowFeatureStore:
+    # model_ready_data as columnar part files, one directory per ticker
+    # (Ticker=AAPL/) or per calendar year (year=2024/). Appends add a part
+    # file and a partition is compacted into one file once it has more than
+    # max_parts. Arrow IPC files are read through memory maps, so an
+    # uncompacted, already sorted partition is handed to NumPy without
+    # copying; Parquet trades that for smaller files. Date filters are pushed
+    # down to the scan, and year partitions outside the range are skipped.
+
+    def __init__(self, root=FEATURE_STORE_PATH, file_format=FEATURE_STORE_FORMAT,
+                 partitioning=FEATURE_STORE_PARTITIONING, max_parts=FEATURE_STORE_MAX_PARTS):
+        if file_format not in ('arrow', 'parquet'):
+            raise ValueError(f"Unknown feature store format: {file_format}")
+        if partitioning not in ('ticker', 'year'):
+            raise ValueError(f"Unknown feature store partitioning: {partitioning}")
+        self.root = root
+        self.file_format = file_format
+        self.partitioning = partitioning
+        self.max_parts = max_parts
+        self.extension = 'arrow' if file_format == 'arrow' else 'parquet'
+        self.filesystem = pafs.LocalFileSystem(use_mmap=True)
+        self._write_lock = threading.Lock()
+
+    def prepare(self):
+        os.makedirs(self.root, exist_ok=True)
+
+    def clear(self):
+        if os.path.isdir(self.root):
+            shutil.rmtree(self.root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _partition_dirs(self, ticker, start_date=None, end_date=None):
+        if self.partitioning == 'ticker':
+            return [os.path.join(self.root, f"Ticker={quote(ticker, safe='')}")]
+        # Year partitions hold every ticker; prune by the requested dates
+        years = sorted(int(name.split('=', 1)[1]) for name in os.listdir(self.root)
+                       if name.startswith('year=')) if os.path.isdir(self.root) else []
+        if start_date is not None:
+            years = [y for y in years if y >= pd.Timestamp(start_date).year]
+        if end_date is not None:
+            years = [y for y in years if y <= pd.Timestamp(end_date).year]
+        return [os.path.join(self.root, f"year={y}") for y in years]
+
+    def _part_files(self, directory):
+        # Part names start with their write time, so this is write order
+        return sorted(glob.glob(os.path.join(directory, f"part-*.{self.extension}")))
+
+    def read(self, ticker, start_date=None, end_date=None, columns=None):
+        # Arrow table of ticker's bars in [start_date, end_date], sorted by
+        # Date with one row per Date (the latest write wins)
+        files = [f for d in self._partition_dirs(ticker, start_date, end_date) for f in self._part_files(d)]
+        columns = list(columns) if columns else STORE_SCHEMA.names
+        if not files:
+            return STORE_SCHEMA.empty_table().select(columns)
+
+        expression = ds.field('Ticker') == ticker
+        if start_date is not None:
+            expression &= ds.field('Date') >= _timestamp(start_date)
+        if end_date is not None:
+            expression &= ds.field('Date') <= _timestamp(end_date)
+
+        scan_columns = columns if 'Date' in columns else ['Date'] + columns
+        for attempt in range(2):
+            try:
+                dataset = ds.dataset(files, schema=STORE_SCHEMA, format=self._dataset_format(),
+                                     filesystem=self.filesystem)
+                table = dataset.to_table(columns=scan_columns, filter=expression)
+                break
+            except FileNotFoundError:
+                # A compaction replaced the parts between listing and reading
+                if attempt:
+                    raise
+                files = [f for d in self._partition_dirs(ticker, start_date, end_date)
+                         for f in self._part_files(d)]
+
+        dates = table['Date'].to_numpy()
+        if len(dates) > 1 and not (np.diff(dates) > np.timedelta64(0)).all():
+            # Overlapping appends: stable sort so the latest write of a Date
+            # comes last, then keep that one
+            table = table.take(pc.sort_indices(table, [('Date', 'ascending')]))
+            dates = table['Date'].to_numpy()
+            keep = np.append(dates[1:] != dates[:-1], True)
+            table = table.filter(pa.array(keep))
+        return table.select(columns)
+
+    def _dataset_format(self):
+        return 'ipc' if self.file_format == 'arrow' else 'parquet'
+
+    def _write_file(self, directory, table):
+        os.makedirs(directory, exist_ok=True)
+        name = f"part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.{self.extension}"
+        path = os.path.join(directory, name)
+        # Readers only ever see complete files
+        tmp_path = os.path.join(directory, f".{name}.tmp")
+        if self.file_format == 'arrow':
+            with pa.OSFile(tmp_path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, tmp_path, compression='zstd')
+        os.replace(tmp_path, path)
+        return path
+
+    def _to_table(self, data):
+        frame = data.reindex(columns=STORE_SCHEMA.names)
+        frame['Date'] = pd.to_datetime(frame['Date'])
+        return pa.Table.from_pandas(frame, schema=STORE_SCHEMA, preserve_index=False)
+
+    def upsert(self, data):
+        if data.empty:
+            return 0
+        table = self._to_table(data.sort_values('Date'))
+        if self.partitioning == 'ticker':
+            groups = {t: table.filter(pc.equal(table['Ticker'], t)) for t in pc.unique(table['Ticker']).to_pylist()}
+            directories = {t: self._partition_dirs(t)[0] for t in groups}
+        else:
+            years = pc.year(table['Date'])
+            groups = {y: table.filter(pc.equal(years, y)) for y in pc.unique(years).to_pylist()}
+            directories = {y: os.path.join(self.root, f"year={y}") for y in groups}
+
+        with self._write_lock:
+            for key, group in groups.items():
+                self._write_file(directories[key], group)
+                if len(self._part_files(directories[key])) > self.max_parts:
+                    self.compact(directories[key])
+        return table.num_rows
+
+    def compact(self, directory):
+        # Rewrite a partition as one sorted, de-duplicated file
+        parts = self._part_files(directory)
+        if len(parts) <= 1:
+            return
+        table = ds.dataset(parts, schema=STORE_SCHEMA, format=self._dataset_format()).to_table()
+        table = table.take(pc.sort_indices(table, [('Ticker', 'ascending'), ('Date', 'ascending')]))
+        tickers = table['Ticker'].to_numpy(zero_copy_only=False)
+        dates = table['Date'].to_numpy()
+        keep = np.append((tickers[1:] != tickers[:-1]) | (dates[1:] != dates[:-1]), True)
+        self._write_file(directory, table.filter(pa.array(keep)))
+        for part in parts:
+            os.remove(part)
+
+    def last_date(self, ticker):
+        if self.partitioning == 'ticker':
+            dates = self.read(ticker, columns=['Date'])['Date']
+        else:
+            # Newest year partition holding the ticker
+            dates = pa.array([], pa.timestamp('ns'))
+            for directory in reversed(self._partition_dirs(ticker)):
+                parts = self._part_files(directory)
+                if parts:
+                    dataset = ds.dataset(parts, schema=STORE_SCHEMA, format=self._dataset_format(),
+                                         filesystem=self.filesystem)
+                    dates = dataset.to_table(columns=['Date'], filter=ds.field('Ticker') == ticker)['Date']
+                    if len(dates):
+                        break
+        if not len(dates):
+            return None
+        return pd.Timestamp(pc.max(dates).value).to_pydatetime()
+
+    def get_high_water_marks(self, tickers):
+        # The files are the source of truth; there is no separate state
+        return {ticker: self.last_date(ticker) for ticker in tickers}
+
+    def _state_path(self, ticker):
+        return os.path.join(self.root, '_state', f"{quote(ticker, safe='')}.json")
+
+    def set_high_water_mark(self, ticker, last_date, indicator_state=None):
+        # The mark itself is the newest stored Date; only the indicator state
+        # is kept, as one JSON file per ticker
+        path = self._state_path(ticker)
+        if indicator_state is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(indicator_state, f)
+        os.replace(tmp_path, path)
+
+    def get_indicator_states(self, tickers):
+        states = {}
+        for ticker in tickers:
+            try:
+                with open(self._state_path(ticker)) as f:
+                    states[ticker] = json.load(f)
+            except FileNotFoundError:
+                states[ticker] = None
+        return states
+
+    def load_warmup_bars(self, ticker, last_date, bars=None):
+        # The last `bars` price bars up to last_date, or all of them
+        table = self.read(ticker, end_date=last_date, columns=['Date'] + PRICE_COLUMNS)
+        if bars:
+            table = table.slice(max(0, table.num_rows - bars))
+        warmup = table.to_pandas()
+        if warmup.empty:
+            return warmup
+        return warmup.set_index('Date')
+
+    def window_loader(self):
+        # Loader for FeatureCache: the last `bars` bars of a ticker, or every
+        # bar since start_date when bars is None
+        def load(ticker, bars, start_date=None):
+            table = self.read(ticker, start_date=start_date, columns=['Date'] + NUMERIC_COLUMNS)
+            if bars:
+                table = table.slice(max(0, table.num_rows - bars))
+            dates = table['Date'].to_numpy()
+            columns = {col: table[col].to_numpy() for col in NUMERIC_COLUMNS}
+            return FeatureWindow(ticker, dates.astype('datetime64[ns]', copy=False), columns)
+        return load
+
+    def async_window_loader(self, executor):
+        # Reads are local file I/O, so the asyncio service runs them on executor
+        return threaded_window_loader(self.window_loader(), executor)
+
+
+def feature_store_from_env():
+    if FEATURE_STORE == 'arrow':
+        return ArrowFeatureStore()
+    return MongoFeatureStore()
+
+
+def parse_dates(values):
+    # The notebook exports hold ISO or day-first dates
+    dates = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    if dates.isna().any():
+        dates = pd.to_datetime(values, dayfirst=True)
+    return dates
+
+
+def import_csvs(store, paths):
+    # Loads the notebook CSVs (Date, Ticker, prices and indicators) into
+    # store. Files missing any of those columns are skipped, and a
+    # (Ticker, Date) present in several files is taken from the first one.
+    frames = []
+    for path in paths:
+        frame = pd.read_csv(path)
+        missing = [col for col in ['Date', 'Ticker'] + NUMERIC_COLUMNS if col not in frame.columns]
+        if missing:
+            print(f"Skipping {path}: missing {', '.join(missing)}")
+            continue
+        frame['Date'] = parse_dates(frame['Date'])
+        frames.append(frame)
+        print(f"Read {len(frame)} rows from {path}")
+    if not frames:
+        return 0
+    data = pd.concat(frames, ignore_index=True).drop_duplicates(['Ticker', 'Date'], keep='first')
+    store.prepare()
+    written = 0
+    for ticker, bars in data.groupby('Ticker'):
+        written += store.upsert(bars.sort_values('Date'))
+        store.set_high_water_mark(ticker, bars['Date'].max().to_pydatetime())
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import notebook CSVs into the feature store')
+    parser.add_argument('csv', nargs='+', help='CSV files with Date, Ticker, prices and indicators')
+    parser.add_argument('--store', default=FEATURE_STORE, choices=['arrow', 'mongo'])
+    parser.add_argument('--path', default=FEATURE_STORE_PATH, help='Root directory of the arrow store')
+    parser.add_argument('--format', default=FEATURE_STORE_FORMAT, choices=['arrow', 'parquet'])
+    parser.add_argument('--partitioning', default=FEATURE_STORE_PARTITIONING, choices=['ticker', 'year'])
+    args = parser.parse_args()
+
+    if args.store == 'arrow':
+        store = ArrowFeatureStore(args.path, args.format, args.partitioning)
+    else:
+        store = MongoFeatureStore()
+    print(f"Imported {import_csvs(store, args.csv)} rows")
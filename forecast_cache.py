@@ -0,0 +1,169 @@
+#forecast_cache.py
+import os
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+FORECAST_CACHE_BACKEND = os.getenv('FORECAST_CACHE_BACKEND', 'memory')
+FORECAST_CACHE_PATH = os.getenv('FORECAST_CACHE_PATH', 'forecast_cache.sqlite3')
+FORECAST_CACHE_MAX_ENTRIES = int(os.getenv('FORECAST_CACHE_MAX_ENTRIES', 10000))
+
+
+class MemoryForecastBackend:
+    # In-process LRU of forecast arrays
+
+    def __init__(self, max_entries=FORECAST_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            predictions = self._entries.get(key)
+            if predictions is not None:
+                self._entries.move_to_end(key)
+            return predictions
+
+    def set(self, key, predictions):
+        with self._lock:
+            self._entries[key] = predictions
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def evict_before(self, ticker, last_date):
+        with self._lock:
+            stale = [key for key in self._entries if key[0] == ticker and key[1] < last_date]
+            for key in stale:
+                del self._entries[key]
+            return len(stale)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteForecastBackend:
+    # Forecast arrays in a local SQLite file, shared by every worker process
+    # on the host
+
+    def __init__(self, path=FORECAST_CACHE_PATH, max_entries=FORECAST_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self.evictions = 0
+        with self._connection() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS forecasts (
+                    ticker TEXT NOT NULL,
+                    last_date TEXT NOT NULL,
+                    horizon INTEGER NOT NULL,
+                    model_version TEXT NOT NULL,
+                    predictions BLOB NOT NULL,
+                    used_at REAL NOT NULL,
+                    PRIMARY KEY (ticker, last_date, horizon, model_version)
+                )""")
+            conn.execute("CREATE INDEX IF NOT EXISTS forecasts_used_at ON forecasts (used_at)")
+
+    def _connection(self):
+        # SQLite connections must not cross a fork, so a pre-forked worker
+        # opens its own rather than reusing the master's
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT predictions FROM forecasts WHERE ticker = ? AND last_date = ? AND horizon = ? "
+            "AND model_version = ?", key).fetchone()
+        if row is None:
+            return None
+        with conn:
+            conn.execute(
+                "UPDATE forecasts SET used_at = ? WHERE ticker = ? AND last_date = ? AND horizon = ? "
+                "AND model_version = ?", (time.time(),) + tuple(key))
+        return np.frombuffer(row[0], dtype=np.float64)
+
+    def set(self, key, predictions):
+        conn = self._connection()
+        blob = np.ascontiguousarray(predictions, dtype=np.float64).tobytes()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?, ?)",
+                         tuple(key) + (blob, time.time()))
+            excess = conn.execute("SELECT COUNT(*) FROM forecasts").fetchone()[0] - self.max_entries
+            if excess > 0:
+                conn.execute("DELETE FROM forecasts WHERE rowid IN "
+                             "(SELECT rowid FROM forecasts ORDER BY used_at LIMIT ?)", (excess,))
+                self.evictions += excess
+
+    def evict_before(self, ticker, last_date):
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute("DELETE FROM forecasts WHERE ticker = ? AND last_date < ?", (ticker, last_date))
+        return cursor.rowcount
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM forecasts").fetchone()[0]
+
+
+class ForecastCache:
+    # Memoizes model output per (ticker, latest bar date, horizon, model
+    # version). A forecast only changes when a new bar arrives or the model
+    # changes, so entries never go stale; older bar dates are evicted when
+    # ingest moves a ticker forward.
+
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryForecastBackend()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(ticker, last_date, horizon, model_version):
+        return (ticker, pd.Timestamp(last_date).strftime('%Y-%m-%d'), int(horizon), str(model_version))
+
+    def get(self, ticker, last_date, horizon, model_version):
+        predictions = self.backend.get(self.key(ticker, last_date, horizon, model_version))
+        if predictions is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return predictions
+
+    def put(self, ticker, last_date, horizon, model_version, predictions):
+        # predictions is (days,) or, for quantile forecasts, (quantiles, days);
+        # the SQLite backend hands back the flattened array
+        self.backend.set(self.key(ticker, last_date, horizon, model_version),
+                         np.asarray(predictions, dtype=np.float64)[..., :horizon])
+
+    def evict_before(self, ticker, last_date):
+        return self.backend.evict_before(ticker, pd.Timestamp(last_date).strftime('%Y-%m-%d'))
+
+    def on_ingest(self, ticker, new_data):
+        # data_handler ingest listener
+        self.evict_before(ticker, new_data['Date'].max())
+
+    def stats(self):
+        return {
+            'backend': type(self.backend).__name__,
+            'entries': len(self.backend),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions,
+        }
+
+
+def forecast_cache_from_env():
+    if FORECAST_CACHE_BACKEND == 'sqlite':
+        return ForecastCache(SQLiteForecastBackend(FORECAST_CACHE_PATH))
+    return ForecastCache(MemoryForecastBackend())
+
@@ -0,0 +1,319 @@
+#forecasting.py
+import os
+import threading
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from instrumentation import stage
+
+# Forecast horizons the service supports
+ALLOWED_DAYS = [7, 14, 21, 28, 35, 42, 49, 56]
+DEFAULT_PREDICTION_DAYS = 30
+MAX_BATCH_SYMBOLS = 100
+# Streamed batches are scored STREAM_CHUNK_SYMBOLS at a time, so they can be larger
+MAX_STREAM_SYMBOLS = int(os.getenv('MAX_STREAM_SYMBOLS', 5000))
+STREAM_CHUNK_SYMBOLS = int(os.getenv('STREAM_CHUNK_SYMBOLS', 20))
+# 'calendar' labels forecast days as consecutive dates, 'business' skips weekends
+FORECAST_CALENDAR = os.getenv('FORECAST_CALENDAR', 'calendar')
+# Most quantiles one request may ask for (the median is always added)
+MAX_QUANTILES = int(os.getenv('MAX_QUANTILES', 9))
+
+# Action labels indexed by the codes weekly_actions returns
+ACTIONS = np.array(['hold', 'buy', 'sell'], dtype=object)
+HOLD, BUY, SELL = 0, 1, 2
+
+def snap_prediction_days(prediction_days):
+    # Ensure prediction_days is one of the allowed values
+    return min(ALLOWED_DAYS, key=lambda x: abs(x - prediction_days))
+
+def forecast_calendar(prediction_days, start=None, calendar=FORECAST_CALENDAR):
+    # Dates of the forecast horizon after start (default today): every
+    # calendar day, or the next prediction_days business days
+    start = np.datetime64(pd.Timestamp(start or datetime.now()).date(), 'D')
+    if calendar == 'business':
+        return np.busday_offset(start, np.arange(1, prediction_days + 1), roll='backward')
+    return start + np.arange(1, prediction_days + 1)
+
+def weekly_actions(predictions):
+    # Action codes for predictions shaped (days,) or (forecasts, days): within
+    # each block of 7 days the lowest price is a buy and the highest a sell.
+    # Ties go to the earliest day, so a flat week has a single buy.
+    predictions = np.asarray(predictions, dtype=float)
+    squeeze = predictions.ndim == 1
+    predictions = np.atleast_2d(predictions)
+    n, days = predictions.shape
+    weeks = -(-days // 7)
+
+    # Pad the last partial week so it can never win argmin/argmax
+    low = np.full((n, weeks * 7), np.inf)
+    high = np.full((n, weeks * 7), -np.inf)
+    low[:, :days] = predictions
+    high[:, :days] = predictions
+    low = low.reshape(n, weeks, 7)
+    high = high.reshape(n, weeks, 7)
+
+    actions = np.zeros((n, weeks, 7), dtype=np.int8)
+    forecast_index, week_index = np.indices((n, weeks))
+    actions[forecast_index, week_index, high.argmax(axis=2)] = SELL
+    actions[forecast_index, week_index, low.argmin(axis=2)] = BUY
+    actions = actions.reshape(n, weeks * 7)[:, :days]
+    return actions[0] if squeeze else actions
+
+def overall_trends(predictions, prediction_days):
+    predictions = np.atleast_2d(np.asarray(predictions, dtype=float))
+    return np.where(predictions[:, prediction_days - 1] > predictions[:, 0], 'upward', 'downward')
+
+def build_responses(tickers, current_prices, predictions, prediction_days, start=None,
+                    quantiles=None, bands=None):
+    # Response bodies for many forecasts of the same horizon at once;
+    # predictions is (forecasts, >= prediction_days). With quantiles, bands
+    # is (forecasts, len(quantiles), >= prediction_days) and every day also
+    # carries its value at each quantile.
+    with stage('postprocess'):
+        predictions = np.atleast_2d(np.asarray(predictions, dtype=float))[:, :prediction_days]
+        if predictions.shape[1] < prediction_days:
+            raise ValueError(f"Expected {prediction_days} predictions, got {predictions.shape[1]}")
+        dates = np.datetime_as_string(forecast_calendar(prediction_days, start), unit='D').tolist()
+        labels = ACTIONS[weekly_actions(predictions)].tolist()
+        trends = overall_trends(predictions, prediction_days).tolist()
+        closes = predictions.tolist()
+
+        day_quantiles = None
+        if quantiles is not None:
+            # (forecasts, days, quantiles), so each day's values zip with the names
+            names = [f"{q:g}" for q in quantiles]
+            values = np.asarray(bands, dtype=float).reshape(len(tickers), len(quantiles), -1)
+            values = values[:, :, :prediction_days].transpose(0, 2, 1).tolist()
+            day_quantiles = [[dict(zip(names, day)) for day in forecast_values] for forecast_values in values]
+
+        responses = []
+        for i, ticker in enumerate(tickers):
+            rows = [{'date': date, 'predicted_close': price, 'action': action}
+                    for date, price, action in zip(dates, closes[i], labels[i])]
+            if day_quantiles is not None:
+                for row, row_quantiles in zip(rows, day_quantiles[i]):
+                    row['quantiles'] = row_quantiles
+            responses.append({
+                'symbol': ticker,
+                'current_price': current_prices[i],
+                'predictions': rows,
+                'overall_trend': trends[i]
+            })
+        return responses
+
+def build_response(ticker, current_price, predictions, prediction_days, quantiles=None, bands=None):
+    return build_responses([ticker], [current_price], [predictions[:prediction_days]], prediction_days,
+                           quantiles=quantiles, bands=None if bands is None else [bands])[0]
+
+def parse_quantiles(value):
+    # Sorted quantiles from a list of numbers in (0, 1), always including the
+    # median, which drives the actions and predicted_close
+    if not isinstance(value, list) or not value:
+        raise ValueError("'quantiles' must be a non-empty list of numbers between 0 and 1")
+    if len(value) > MAX_QUANTILES:
+        raise ValueError(f"At most {MAX_QUANTILES} quantiles can be requested")
+    quantiles = set()
+    for q in value:
+        if isinstance(q, bool) or not isinstance(q, (int, float)) or not 0 < q < 1:
+            raise ValueError(f"Invalid quantile: {q!r}")
+        quantiles.add(float(q))
+    quantiles.add(0.5)
+    return sorted(quantiles)
+
+def parse_batch_request(data, max_symbols=MAX_BATCH_SYMBOLS):
+    # Accepts {"requests": [{"symbol": ..., "current_price": ..., "prediction_days": ...}, ...]}
+    # where entries may also be bare symbols, plus an optional top-level
+    # prediction_days used as the default horizon
+    if not isinstance(data, dict) or not isinstance(data.get('requests'), list) or not data['requests']:
+        raise ValueError("Request body must contain a non-empty 'requests' list")
+    if len(data['requests']) > max_symbols:
+        raise ValueError(f"At most {max_symbols} symbols can be requested at once")
+
+    default_days = batch_prediction_days(data.get('prediction_days', DEFAULT_PREDICTION_DAYS))
+    items = []
+    for entry in data['requests']:
+        if isinstance(entry, str):
+            entry = {'symbol': entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get('symbol'), str) or not entry['symbol']:
+            raise ValueError(f"Invalid batch entry: {entry!r}")
+        prediction_days = default_days
+        if 'prediction_days' in entry:
+            prediction_days = batch_prediction_days(entry['prediction_days'])
+        items.append({
+            'symbol': entry['symbol'],
+            'current_price': entry.get('current_price'),
+            'prediction_days': prediction_days,
+        })
+    return items
+
+def batch_prediction_days(value):
+    # A batch horizon must be a finite number (bools are ints in Python but
+    # not horizons), snapped to the allowed values
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not np.isfinite(value):
+        raise ValueError(f"Invalid prediction_days: {value!r}")
+    return snap_prediction_days(value)
+
+def forecast(model, ticker, frame, prediction_days, forecast_cache=None, model_version=None):
+    # Model output over the forecast horizon, memoized per latest bar date
+    # when a ForecastCache is given
+    if forecast_cache is not None:
+        last_date = frame['Date'].max()
+        predictions = forecast_cache.get(ticker, last_date, prediction_days, model_version)
+        if predictions is not None:
+            return predictions
+
+    with stage('inference'):
+        predictions = np.asarray(model.predict(frame)).reshape(-1)[:prediction_days]
+
+    if forecast_cache is not None:
+        forecast_cache.put(ticker, last_date, prediction_days, model_version, predictions)
+    return predictions
+
+# The AutoML forecaster takes its quantiles as an attribute, so setting them
+# and calling forecast_quantiles must not interleave across threads
+_quantile_lock = threading.Lock()
+
+def quantile_forecaster(model):
+    # The object behind an MLflow pyfunc model that implements
+    # forecast_quantiles (the AutoML forecasting pipeline), or None
+    candidates = [model, getattr(model, '_model_impl', None)]
+    candidates += [getattr(candidates[1], name, None) for name in ('model', '_model', 'fitted_model')]
+    for candidate in candidates:
+        if candidate is not None and callable(getattr(candidate, 'forecast_quantiles', None)):
+            return candidate
+    return None
+
+def forecast_quantiles(model, ticker, frame, prediction_days, quantiles, forecast_cache=None,
+                       model_version=None):
+    # (len(quantiles), prediction_days) array from one forecast_quantiles
+    # call, memoized like forecast
+    cache_version = f"{model_version}|q={','.join(f'{q:g}' for q in quantiles)}"
+    if forecast_cache is not None:
+        last_date = frame['Date'].max()
+        bands = forecast_cache.get(ticker, last_date, prediction_days, cache_version)
+        if bands is not None:
+            return bands.reshape(len(quantiles), -1)
+
+    forecaster = quantile_forecaster(model)
+    if forecaster is None:
+        raise NotImplementedError("The loaded model does not support quantile forecasts")
+    with stage('inference'), _quantile_lock:
+        forecaster.quantiles = list(quantiles)
+        result = forecaster.forecast_quantiles(frame, ignore_data_errors=True)
+    # One column per quantile next to the time and grain columns
+    bands = result[list(quantiles)].to_numpy(dtype=float).T[:, :prediction_days]
+    if bands.shape[1] < prediction_days:
+        raise ValueError(f"Model returned {bands.shape[1]} quantile forecasts for a "
+                         f"{prediction_days} day horizon")
+
+    if forecast_cache is not None:
+        forecast_cache.put(ticker, last_date, prediction_days, cache_version, bands)
+    return bands
+
+def predict_stacked(model, frames):
+    # One model call over the frames stacked on top of each other; the
+    # forecaster treats each Ticker as its own grain and returns one value per
+    # input row, which is split back per ticker
+    with stage('assemble'):
+        stacked = pd.concat(list(frames.values()), ignore_index=True)
+    with stage('inference'):
+        predictions = np.asarray(model.predict(stacked)).reshape(-1)
+    if len(predictions) != len(stacked):
+        raise ValueError(f"Model returned {len(predictions)} predictions for {len(stacked)} rows")
+
+    results = {}
+    offset = 0
+    for ticker, frame in frames.items():
+        results[ticker] = predictions[offset:offset + len(frame)]
+        offset += len(frame)
+    return results
+
+def predict_batch(model, items, get_data, forecast_cache=None, model_version=None):
+    # Returns (results, errors); a symbol whose data or forecast fails is
+    # reported in errors without failing the rest of the batch
+    errors = []
+    frames = {}
+    for item in items:
+        symbol = item['symbol']
+        if symbol in frames:
+            continue
+        try:
+            frames[symbol] = get_data(symbol)
+        except Exception as e:
+            errors.append({'symbol': symbol, 'error': str(e)})
+
+    # Serve what we can from the forecast cache and score only the rest
+    cached = {}
+    if forecast_cache is not None:
+        for item in items:
+            symbol, prediction_days = item['symbol'], item['prediction_days']
+            if symbol in frames:
+                predictions = forecast_cache.get(symbol, frames[symbol]['Date'].max(), prediction_days,
+                                                 model_version)
+                if predictions is not None:
+                    cached[(symbol, prediction_days)] = predictions
+    to_score = {symbol: frame for symbol, frame in frames.items()
+                if any(item['symbol'] == symbol and (symbol, item['prediction_days']) not in cached
+                       for item in items)}
+
+    predictions = {}
+    if to_score:
+        try:
+            predictions = predict_stacked(model, to_score)
+        except Exception as e:
+            print(f"Batch prediction failed ({e}), scoring symbols one at a time")
+            for symbol, frame in to_score.items():
+                try:
+                    with stage('inference'):
+                        predictions[symbol] = np.asarray(model.predict(frame)).reshape(-1)
+                except Exception as symbol_error:
+                    errors.append({'symbol': symbol, 'error': str(symbol_error)})
+
+    # Build the responses one horizon at a time, keeping the request order
+    scored = {}
+    for index, item in enumerate(items):
+        symbol = item['symbol']
+        prediction_days = item['prediction_days']
+        if (symbol, prediction_days) in cached:
+            symbol_predictions = cached[(symbol, prediction_days)]
+        elif symbol in predictions:
+            symbol_predictions = predictions[symbol][:prediction_days]
+            if len(symbol_predictions) < prediction_days:
+                errors.append({'symbol': symbol, 'error': f"Model returned {len(predictions[symbol])} "
+                                                         f"predictions for a {prediction_days} day horizon"})
+                continue
+            if forecast_cache is not None:
+                forecast_cache.put(symbol, frames[symbol]['Date'].max(), prediction_days, model_version,
+                                   symbol_predictions)
+        else:
+            continue
+        scored.setdefault(prediction_days, []).append((index, item, symbol_predictions))
+
+    results = {}
+    for prediction_days, group in scored.items():
+        responses = build_responses([item['symbol'] for _, item, _ in group],
+                                    [item['current_price'] for _, item, _ in group],
+                                    np.stack([p for _, _, p in group]), prediction_days)
+        results.update(zip([index for index, _, _ in group], responses))
+    return [results[index] for index in sorted(results)], errors
+
+def response_records(response):
+    # NDJSON records for one /predict response: one per forecast day, then a
+    # summary closing the symbol
+    symbol = response['symbol']
+    for row in response['predictions']:
+        yield {'type': 'prediction', 'symbol': symbol, **row}
+    yield {'type': 'summary', 'symbol': symbol, 'current_price': response['current_price'],
+           'overall_trend': response['overall_trend']}
+
+def stream_batch(model, items, get_data, forecast_cache=None, model_version=None,
+                 chunk_size=STREAM_CHUNK_SYMBOLS):
+    # predict_batch over chunk_size symbols at a time, yielding each chunk's
+    # records before the next chunk is fetched and scored
+    for start in range(0, len(items), chunk_size):
+        results, errors = predict_batch(model, items[start:start + chunk_size], get_data,
+                                        forecast_cache, model_version)
+        for error in errors:
+            yield {'type': 'error', **error}
+        for response in results:
+            yield from response_records(response)
@@ -0,0 +1,60 @@
+#gunicorn.conf.py
+import os
+import time
+import shutil
+import signal
+import tempfile
+import threading
+import multiprocessing
+
+bind = os.getenv('BIND', '0.0.0.0:5000')
+workers = int(os.getenv('WEB_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.getenv('WEB_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.getenv('WEB_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30))
+
+# Import wsgi.py (and load the model) in the master before forking
+preload_app = True
+
+# Workers add their latency histograms to files in METRICS_DIR, so /metrics
+# reports the totals of every worker whichever one serves the scrape. Without
+# a METRICS_DIR, one is created for this server and removed when it exits.
+# Set before the app is preloaded, and only on the first load of this file
+# (it is read again on HUP).
+METRICS_DIR_PREFIX = 'trading-bot-metrics-'
+if not os.getenv('METRICS_DIR'):
+    os.environ['METRICS_DIR'] = tempfile.mkdtemp(prefix=METRICS_DIR_PREFIX)
+
+# How often the master checks for a new model artifact; 0 disables
+MODEL_WATCH_SECONDS = int(os.getenv('MODEL_WATCH_SECONDS', 60))
+
+def when_ready(server):
+    if MODEL_WATCH_SECONDS <= 0:
+        return
+    import wsgi
+
+    def watch():
+        while True:
+            time.sleep(MODEL_WATCH_SECONDS)
+            if wsgi.service.model_handle.has_update():
+                server.log.info("New model artifact found, reloading workers")
+                os.kill(os.getpid(), signal.SIGHUP)
+
+    threading.Thread(target=watch, name='model-watch', daemon=True).start()
+
+def on_reload(server):
+    # HUP (from the watcher or `kill -HUP <master pid>`): load the new model
+    # in the master before gunicorn forks the replacement workers, then let
+    # the old workers finish their requests and exit
+    import wsgi
+    wsgi.service.model_handle.reload()
+
+def post_worker_init(worker):
+    import wsgi
+    wsgi.start_worker()
+
+def on_exit(server):
+    metrics_dir = os.environ['METRICS_DIR']
+    if os.path.basename(metrics_dir).startswith(METRICS_DIR_PREFIX):
+        shutil.rmtree(metrics_dir, ignore_errors=True)
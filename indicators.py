@@ -0,0 +1,360 @@
+#indicators.py
+# NumPy implementation of the technical indicators the model is trained on.
+#
+# Indicators are computed over a (time x ticker) panel of closing prices, so the
+# whole ticker universe is processed at once, and IndicatorState carries the
+# EMA / Wilder / rolling-window state forward so new bars can be added in O(1)
+# per bar. The batch and streaming paths perform the same floating point
+# operations in the same order, so appending bars one at a time gives
+# bit-identical values to a full recompute.
+#
+# Output follows the pandas_ta 0.3.14b0 defaults the model was trained with
+# (RSI uses Wilder's RMA, EMAs are seeded with the SMA of their first `length`
+# values, Bollinger Bands use the population standard deviation). Against the
+# ta.rsi / ta.macd / ta.bbands / ta.sma output stored in
+# notebooks/stock_data_with_all_indicators.csv every value past the warm-up
+# agrees to within 1e-7 of max(|value|, 1), which is the precision of the CSV.
+#
+# A NaN close marks a ticker with no bar at that time step. It leaves that
+# ticker's state untouched and its output row NaN, which is equivalent to
+# computing each ticker over its own dates only.
+import numpy as np
+import pandas as pd
+
+RSI_LENGTH = 14
+MACD_FAST = 12
+MACD_SLOW = 26
+MACD_SIGNAL = 9
+BB_LENGTH = 20
+BB_STD = 2.0
+
+INDICATOR_COLUMNS = ['RSI', 'MACD_12_26_9', 'MACDh_12_26_9', 'MACDs_12_26_9',
+                     'BBL_20_2.0', 'BBM_20_2.0', 'BBU_20_2.0', 'BBB_20_2.0', 'BBP_20_2.0', 'MA']
+
+# Number of bars before every indicator has a value
+WARMUP_PERIOD = max(RSI_LENGTH + 1, MACD_SLOW + MACD_SIGNAL - 1, BB_LENGTH)
+
+# Version of the IndicatorState records; bump it when the parameters above or
+# the state layout change so that persisted states are rebuilt, not reused
+STATE_VERSION = 1
+
+_EPSILON = np.finfo(float).eps
+_RMA_DECAY = 1.0 - 1.0 / RSI_LENGTH
+_FAST_ALPHA = 2.0 / (MACD_FAST + 1)
+_SLOW_ALPHA = 2.0 / (MACD_SLOW + 1)
+_SIGNAL_ALPHA = 2.0 / (MACD_SIGNAL + 1)
+
+
+def _rsi(gain_numerator, loss_numerator, denominator):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_gain = gain_numerator / denominator
+        avg_loss = loss_numerator / denominator
+        return 100.0 * avg_gain / (avg_gain + avg_loss)
+
+
+def _bands(window_sum, window_squares, close):
+    # window_sum / window_squares are the sequential sums over the last
+    # BB_LENGTH closes and of their squared deviations from the mean
+    mid = window_sum / BB_LENGTH
+    std = np.sqrt(window_squares / BB_LENGTH)
+    lower = mid - BB_STD * std
+    upper = mid + BB_STD * std
+    band_range = upper - lower
+    band_range = np.where(band_range == 0, _EPSILON, band_range)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        bandwidth = 100.0 * band_range / mid
+        percent = (close - lower) / band_range
+    return lower, mid, upper, bandwidth, percent
+
+
+class _Ema:
+    # Exponential moving average seeded with the simple average of the first
+    # `length` values, as pandas_ta's ema() does by default
+
+    def __init__(self, length, alpha, n):
+        self.length = length
+        self.alpha = alpha
+        self.count = np.zeros(n, dtype=np.int64)
+        self.total = np.zeros(n)
+        self.value = np.full(n, np.nan)
+
+    def update(self, x, valid):
+        self.count = self.count + valid
+        seeding = valid & (self.count <= self.length)
+        self.total = np.where(seeding, self.total + np.where(seeding, x, 0.0), self.total)
+        smoothed = (1.0 - self.alpha) * self.value + self.alpha * x
+        self.value = np.where(valid & (self.count == self.length), self.total / self.length,
+                              np.where(valid & (self.count > self.length), smoothed, self.value))
+        return np.where(valid & (self.count >= self.length), self.value, np.nan)
+
+
+class IndicatorState:
+    # Indicator state for n tickers after the last bar seen
+
+    def __init__(self, n_tickers=1):
+        n = n_tickers
+        self.n_tickers = n
+        self.bars = np.zeros(n, dtype=np.int64)
+        self.prev_close = np.full(n, np.nan)
+        # Wilder's RMA as pandas_ta's rma(): an adjusted exponentially weighted
+        # mean, kept as numerator / denominator
+        self.changes = np.zeros(n, dtype=np.int64)
+        self.gain_numerator = np.zeros(n)
+        self.loss_numerator = np.zeros(n)
+        self.denominator = np.zeros(n)
+        self.fast = _Ema(MACD_FAST, _FAST_ALPHA, n)
+        self.slow = _Ema(MACD_SLOW, _SLOW_ALPHA, n)
+        self.signal = _Ema(MACD_SIGNAL, _SIGNAL_ALPHA, n)
+        # Ring buffer of the last BB_LENGTH closes; bar k lives in slot k % BB_LENGTH
+        self.window = np.zeros((BB_LENGTH, n))
+        self._columns = np.arange(n)
+
+    def update(self, close):
+        # close holds one bar per ticker. Returns an (n_tickers, 10) array
+        # ordered like INDICATOR_COLUMNS.
+        close = np.asarray(close, dtype=float).reshape(self.n_tickers)
+        valid = np.isfinite(close)
+        out = np.full((self.n_tickers, len(INDICATOR_COLUMNS)), np.nan)
+
+        # RSI
+        change = close - self.prev_close
+        has_change = valid & np.isfinite(change)
+        self.changes = self.changes + has_change
+        self.gain_numerator = np.where(
+            has_change, _RMA_DECAY * self.gain_numerator + np.maximum(change, 0.0), self.gain_numerator)
+        self.loss_numerator = np.where(
+            has_change, _RMA_DECAY * self.loss_numerator + np.maximum(-change, 0.0), self.loss_numerator)
+        self.denominator = np.where(has_change, _RMA_DECAY * self.denominator + 1.0, self.denominator)
+        rsi = _rsi(self.gain_numerator, self.loss_numerator, self.denominator)
+        out[:, 0] = np.where(has_change & (self.changes >= RSI_LENGTH), rsi, np.nan)
+        self.prev_close = np.where(valid, close, self.prev_close)
+
+        # MACD, with the signal line starting at the first valid MACD value
+        macd = self.fast.update(close, valid) - self.slow.update(close, valid)
+        signal = self.signal.update(macd, np.isfinite(macd))
+        out[:, 1] = macd
+        out[:, 2] = macd - signal
+        out[:, 3] = signal
+
+        # Bollinger Bands and the moving average share the 20-bar window
+        slot = self.bars % BB_LENGTH
+        self.window[slot[valid], self._columns[valid]] = close[valid]
+        self.bars = self.bars + valid
+        full = valid & (self.bars >= BB_LENGTH)
+        if full.any():
+            oldest = self.bars - BB_LENGTH
+            window = [self.window[(oldest + j) % BB_LENGTH, self._columns] for j in range(BB_LENGTH)]
+            window_sum = window[0]
+            for value in window[1:]:
+                window_sum = window_sum + value
+            mid = window_sum / BB_LENGTH
+            window_squares = (window[0] - mid) ** 2
+            for value in window[1:]:
+                window_squares = window_squares + (value - mid) ** 2
+            bands = _bands(window_sum, window_squares, close)
+            for i, band in enumerate(bands):
+                out[:, 4 + i] = np.where(full, band, np.nan)
+            out[:, 9] = out[:, 5]
+
+        return out
+
+    def is_empty(self):
+        return not self.bars.any()
+
+    def to_records(self):
+        # One plain dict per ticker for storing as JSON or BSON; Python floats
+        # round-trip exactly through both, so a restored state continues
+        # bit-identically
+        records = []
+        for i in range(self.n_tickers):
+            record = {
+                'version': STATE_VERSION,
+                'bars': int(self.bars[i]),
+                'prev_close': float(self.prev_close[i]),
+                'changes': int(self.changes[i]),
+                'gain_numerator': float(self.gain_numerator[i]),
+                'loss_numerator': float(self.loss_numerator[i]),
+                'denominator': float(self.denominator[i]),
+                'window': self.window[:, i].tolist(),
+            }
+            for name in ('fast', 'slow', 'signal'):
+                ema = getattr(self, name)
+                record[name] = {'count': int(ema.count[i]), 'total': float(ema.total[i]),
+                                'value': float(ema.value[i])}
+            records.append(record)
+        return records
+
+    @classmethod
+    def from_records(cls, records):
+        # State for len(records) tickers from to_records output
+        state = cls(len(records))
+        for i, record in enumerate(records):
+            if record.get('version') != STATE_VERSION:
+                raise ValueError(f"Indicator state version {record.get('version')} is not {STATE_VERSION}")
+            state.bars[i] = record['bars']
+            state.prev_close[i] = record['prev_close']
+            state.changes[i] = record['changes']
+            state.gain_numerator[i] = record['gain_numerator']
+            state.loss_numerator[i] = record['loss_numerator']
+            state.denominator[i] = record['denominator']
+            state.window[:, i] = record['window']
+            for name in ('fast', 'slow', 'signal'):
+                ema = getattr(state, name)
+                ema.count[i] = record[name]['count']
+                ema.total[i] = record[name]['total']
+                ema.value[i] = record[name]['value']
+        return state
+
+
+def _compute_compacted(x, n):
+    # x is a (bars x ticker) array where column i holds ticker i's n[i] valid
+    # closes at the top. Returns the indicators in the same layout together
+    # with the resulting state.
+    T, N = x.shape
+    out = np.full((T, N, len(INDICATOR_COLUMNS)), np.nan)
+    state = IndicatorState(N)
+    if T == 0:
+        return out, state
+    x = np.where(np.arange(T)[:, None] < n, x, 0.0)
+
+    # RSI numerators and the MACD EMAs are first-order recursions, advanced
+    # together one bar at a time across all tickers
+    change = np.zeros_like(x)
+    change[1:] = x[1:] - x[:-1]
+    inputs = np.empty((T, 4, N))
+    inputs[:, 0] = np.maximum(change, 0.0)
+    inputs[:, 1] = np.maximum(-change, 0.0)
+    inputs[:, 2] = _FAST_ALPHA * x
+    inputs[:, 3] = _SLOW_ALPHA * x
+    decay = np.array([_RMA_DECAY, _RMA_DECAY, 1.0 - _FAST_ALPHA, 1.0 - _SLOW_ALPHA])[:, None]
+    totals = np.cumsum(x, axis=0)
+
+    values = np.full((T, 4, N), np.nan)
+    denominators = np.zeros(T)
+    current = np.zeros((4, N))
+    current[2:] = np.nan
+    denominator = 0.0
+    for k in range(1, T):
+        current = decay * current + inputs[k]
+        denominator = _RMA_DECAY * denominator + 1.0
+        if k == MACD_FAST - 1:
+            current[2] = totals[k] / MACD_FAST
+        if k == MACD_SLOW - 1:
+            current[3] = totals[k] / MACD_SLOW
+        values[k] = current
+        denominators[k] = denominator
+
+    rsi = _rsi(values[:, 0], values[:, 1], denominators[:, None])
+    rsi[:RSI_LENGTH] = np.nan
+    out[:, :, 0] = rsi
+
+    fast = values[:, 2]
+    slow = values[:, 3]
+    fast[:MACD_FAST - 1] = np.nan
+    slow[:MACD_SLOW - 1] = np.nan
+    macd = fast - slow
+
+    signal = np.full((T, N), np.nan)
+    first = MACD_SLOW - 1
+    if T > first + MACD_SIGNAL - 1:
+        seed_at = first + MACD_SIGNAL - 1
+        signal_totals = np.cumsum(macd[first:seed_at + 1], axis=0)
+        current = signal_totals[-1] / MACD_SIGNAL
+        signal[seed_at] = current
+        for k in range(seed_at + 1, T):
+            current = (1.0 - _SIGNAL_ALPHA) * current + _SIGNAL_ALPHA * macd[k]
+            signal[k] = current
+    out[:, :, 1] = macd
+    out[:, :, 2] = macd - signal
+    out[:, :, 3] = signal
+
+    # Rolling windows, summed oldest to newest as in the streaming update
+    if T >= BB_LENGTH:
+        M = T - BB_LENGTH + 1
+        window_sum = x[0:M]
+        for j in range(1, BB_LENGTH):
+            window_sum = window_sum + x[j:j + M]
+        mid = window_sum / BB_LENGTH
+        window_squares = (x[0:M] - mid) ** 2
+        for j in range(1, BB_LENGTH):
+            window_squares = window_squares + (x[j:j + M] - mid) ** 2
+        bands = _bands(window_sum, window_squares, x[BB_LENGTH - 1:])
+        for i, band in enumerate(bands):
+            out[BB_LENGTH - 1:, :, 4 + i] = band
+        out[:, :, 9] = out[:, :, 5]
+
+    # State after each ticker's last bar
+    last = np.maximum(n - 1, 0)
+    columns = np.arange(N)
+    has_bars = n > 0
+    state.bars = n.astype(np.int64)
+    state.prev_close = np.where(has_bars, x[last, columns], np.nan)
+    state.changes = np.maximum(n - 1, 0)
+    state.gain_numerator = np.where(n > 1, values[last, 0, columns], 0.0)
+    state.loss_numerator = np.where(n > 1, values[last, 1, columns], 0.0)
+    state.denominator = np.where(n > 1, denominators[last], 0.0)
+    for ema, row, length in ((state.fast, 2, MACD_FAST), (state.slow, 3, MACD_SLOW)):
+        ema.count = n.astype(np.int64)
+        ema.total = totals[np.minimum(n, length) - 1, columns] if T else ema.total
+        ema.total = np.where(has_bars, ema.total, 0.0)
+        ema.value = np.where(n >= length, values[last, row, columns], np.nan)
+    signal_count = np.maximum(n - first, 0)
+    state.signal.count = signal_count.astype(np.int64)
+    if signal_count.any():
+        seed_totals = np.cumsum(np.nan_to_num(macd[first:first + MACD_SIGNAL]), axis=0)
+        seeded = np.minimum(signal_count, MACD_SIGNAL) - 1
+        state.signal.total = np.where(signal_count > 0, seed_totals[np.maximum(seeded, 0), columns], 0.0)
+    state.signal.value = np.where(signal_count >= MACD_SIGNAL, signal[last, columns], np.nan)
+    for j in range(BB_LENGTH):
+        # Bar k = n - BB_LENGTH + j lives in slot k % BB_LENGTH
+        k = n - BB_LENGTH + j
+        present = k >= 0
+        state.window[k[present] % BB_LENGTH, columns[present]] = x[k[present], columns[present]]
+
+    return out, state
+
+
+def compute_panel(close, state=None):
+    # close is a (time x ticker) array; returns a (time x ticker x 10) array
+    # and the state after the last bar, ready for streaming updates
+    close = np.asarray(close, dtype=float)
+    if close.ndim == 1:
+        close = close[:, None]
+    T, N = close.shape
+
+    if state is not None and not state.is_empty():
+        # Continue from an existing state one bar at a time
+        out = np.empty((T, N, len(INDICATOR_COLUMNS)))
+        for t in range(T):
+            out[t] = state.update(close[t])
+        return out, state
+
+    # Move each ticker's valid bars to the top of its column so every ticker
+    # starts at bar 0, compute, then scatter the results back
+    valid = np.isfinite(close)
+    n = valid.sum(axis=0)
+    order = np.argsort(~valid, axis=0, kind='stable')
+    compacted = np.take_along_axis(close, order, axis=0)
+    values, state = _compute_compacted(compacted, n)
+
+    out = np.full((T, N, len(INDICATOR_COLUMNS)), np.nan)
+    present = np.arange(T)[:, None] < n
+    columns = np.broadcast_to(np.arange(N), (T, N))
+    out[order[present], columns[present]] = values[present]
+    return out, state
+
+
+def compute_indicators(close, state=None):
+    # Single-ticker convenience wrapper: takes a Series of closes and returns
+    # a DataFrame with the pandas_ta column names on the same index
+    values, state = compute_panel(close.to_numpy(dtype=float), state)
+    return pd.DataFrame(values[:, 0, :], index=close.index, columns=INDICATOR_COLUMNS), state
+
+
+def compute_indicators_frame(prices, state=None):
+    # Panel convenience wrapper: takes a (Date x Ticker) DataFrame of closes
+    # and returns a long DataFrame indexed by (Date, Ticker)
+    values, state = compute_panel(prices.to_numpy(dtype=float), state)
+    index = pd.MultiIndex.from_product([prices.index, prices.columns], names=['Date', 'Ticker'])
+    frame = pd.DataFrame(values.reshape(-1, len(INDICATOR_COLUMNS)), index=index, columns=INDICATOR_COLUMNS)
+    return frame, state
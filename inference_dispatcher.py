@@ -0,0 +1,160 @@
+#inference_dispatcher.py
+import os
+import time
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from forecasting import predict_stacked
+from instrumentation import INFERENCE_BATCH_SIZE, observe_stage
+from model_loader import ModelNotReady
+
+# Concurrent /predict calls are collected for up to INFERENCE_BATCH_WINDOW_MS
+# (or until INFERENCE_BATCH_MAX frames are waiting) and scored in one model
+# call. At most INFERENCE_QUEUE_MAX frames may wait; beyond that requests are
+# turned away instead of queueing without bound.
+INFERENCE_BATCHING = os.getenv('INFERENCE_BATCHING', 'false').lower() == 'true'
+INFERENCE_BATCH_WINDOW_MS = float(os.getenv('INFERENCE_BATCH_WINDOW_MS', 10))
+INFERENCE_BATCH_MAX = int(os.getenv('INFERENCE_BATCH_MAX', 32))
+INFERENCE_QUEUE_MAX = int(os.getenv('INFERENCE_QUEUE_MAX', 256))
+INFERENCE_TIMEOUT_SECONDS = float(os.getenv('INFERENCE_TIMEOUT_SECONDS', 30))
+
+
+class DispatcherBusy(Exception):
+    pass
+
+
+class InferenceDispatcher:
+    # Stands in for the model in forecasting.forecast: predict(frame) queues
+    # the frame and blocks until the dispatcher thread has scored it as part
+    # of a batch stacked by Ticker. get_model is called per batch, so a
+    # reloaded model is picked up by the next batch.
+
+    def __init__(self, get_model, window_ms=INFERENCE_BATCH_WINDOW_MS, max_batch=INFERENCE_BATCH_MAX,
+                 max_queue=INFERENCE_QUEUE_MAX, timeout_seconds=INFERENCE_TIMEOUT_SECONDS):
+        self.get_model = get_model
+        self.window_seconds = window_ms / 1000
+        self.max_batch = max_batch
+        self.timeout_seconds = timeout_seconds
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.frames = 0
+        self.rejected = 0
+        self.cancelled = 0
+
+    def _ensure_started(self):
+        # Started on first use and again in a forked worker, where the
+        # parent's thread no longer exists
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue(maxsize=self._queue.maxsize)
+                self._thread = threading.Thread(target=self._run, name='inference-dispatcher', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def submit(self, frame):
+        # Future of the model output for frame, which must hold one Ticker
+        self._ensure_started()
+        future = Future()
+        try:
+            self._queue.put_nowait((frame['Ticker'].iloc[0], frame, future, time.perf_counter()))
+        except queue.Full:
+            self.rejected += 1
+            raise DispatcherBusy(f"Inference queue is full ({self._queue.maxsize} waiting)")
+        return future
+
+    def predict(self, frame):
+        future = self.submit(frame)
+        try:
+            return future.result(timeout=self.timeout_seconds)
+        except FutureTimeoutError:
+            # The caller answers 503, so a frame that is still queued is
+            # dropped rather than scored for nobody
+            if future.cancel():
+                self.cancelled += 1
+            raise
+
+    def _collect(self):
+        # Blocks for the first frame, then gathers more until the window
+        # closes or the batch is full
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.window_seconds
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        pending = []
+        while True:
+            if pending:
+                batch, pending = pending, []
+            else:
+                batch = self._collect()
+
+            # A Ticker is one grain of the stacked call, so a second frame for
+            # a ticker already in the batch goes in the next one. Futures only
+            # start running here, so frames whose caller timed out while they
+            # waited (cancelled futures) are skipped, deferred ones included.
+            frames = {}
+            waiting = {}
+            for ticker, frame, future, queued_at in batch:
+                if future.cancelled():
+                    continue
+                if ticker in frames:
+                    pending.append((ticker, frame, future, queued_at))
+                    continue
+                if not future.set_running_or_notify_cancel():
+                    continue
+                observe_stage('queue', time.perf_counter() - queued_at)
+                frames[ticker] = frame
+                waiting[ticker] = future
+            if frames:
+                self._score(frames, waiting)
+
+    def _score(self, frames, waiting):
+        self.batches += 1
+        self.frames += len(frames)
+        INFERENCE_BATCH_SIZE.observe((), len(frames))
+        try:
+            model = self.get_model()
+            if len(frames) == 1:
+                ticker, frame = next(iter(frames.items()))
+                waiting[ticker].set_result(model.predict(frame))
+                return
+            results = predict_stacked(model, frames)
+        except Exception as e:
+            if len(frames) == 1 or isinstance(e, ModelNotReady):
+                for future in waiting.values():
+                    if not future.done():
+                        future.set_exception(e)
+                return
+            # One bad frame fails the stacked call; score one at a time so
+            # only its own request sees the error
+            print(f"Batched inference failed ({e}), scoring {len(frames)} frames one at a time")
+            for ticker, frame in frames.items():
+                try:
+                    waiting[ticker].set_result(model.predict(frame))
+                except Exception as frame_error:
+                    waiting[ticker].set_exception(frame_error)
+            return
+        for ticker, future in waiting.items():
+            future.set_result(results[ticker])
+
+    def stats(self):
+        return {
+            'queued': self._queue.qsize(),
+            'batches': self.batches,
+            'frames': self.frames,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+        }
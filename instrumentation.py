@@ -0,0 +1,268 @@
+#instrumentation.py
+import os
+import json
+import mmap
+import time
+import glob
+import random
+import bisect
+import struct
+import cProfile
+import threading
+from contextlib import contextmanager
+from flask import Response, g, request
+
+# 'debug' also prints the per-request data dumps (frame heads, raw model output)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info').lower()
+DEBUG_LOGGING = LOG_LEVEL == 'debug'
+
+# Upper bounds of the latency histogram buckets, in seconds
+METRICS_BUCKETS = [float(b) for b in os.getenv(
+    'METRICS_BUCKETS', '0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60,300').split(',')]
+
+# With several worker processes, each one adds its observations to its own
+# file in METRICS_DIR and /metrics sums every file, so a scrape gets the same
+# totals whichever worker serves it (gunicorn.conf.py sets this up). Unset,
+# histograms are kept in memory for the one process.
+METRICS_DIR = os.getenv('METRICS_DIR')
+
+# Per-request cProfile: PROFILE_ENABLED lets clients ask for it with an
+# X-Profile: 1 header, and PROFILE_SAMPLE_RATE profiles that fraction of
+# requests on its own. Profiles are written to PROFILE_DIR for pstats/snakeviz.
+PROFILE_ENABLED = os.getenv('PROFILE_ENABLED', 'false').lower() == 'true'
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', 0))
+PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+
+
+class Histogram:
+    # Prometheus-style histogram with one series per label tuple
+
+    def __init__(self, name, help_text, label_names, buckets=METRICS_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = sorted(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+        if METRICS_DIR:
+            metrics_file().observe(self.name, labels, index, value)
+
+    def render(self, series=None):
+        # series maps label tuples to [bucket counts, sum]; by default this
+        # process's own
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        if series is None:
+            with self._lock:
+                series = {labels: [list(counts), total] for labels, (counts, total) in self._series.items()}
+        series = sorted((labels, counts, total) for labels, (counts, total) in series.items())
+        for labels, counts, total in series:
+            label_text = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels))
+            prefix = label_text + ',' if label_text else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + [float('inf')], counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{{{prefix}le="{le}"}} {cumulative}')
+            suffix = f'{{{label_text}}}' if label_text else ''
+            lines.append(f'{self.name}_sum{suffix} {total!r}')
+            lines.append(f'{self.name}_count{suffix} {cumulative}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class MetricsFile:
+    # One process's histogram values in METRICS_DIR, like prometheus_client's
+    # multiprocess mode: an mmap holding the bytes used, then records of
+    # (key length, JSON key [name, labels, bucket index or "sum"], float64)
+    # padded so every value is 8-byte aligned. Only the owning process writes
+    # it; other workers read it when they serve /metrics. Files of exited
+    # workers are kept, so the totals never go backwards.
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < self.INITIAL_SIZE:
+            self._file.truncate(self.INITIAL_SIZE)
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('<Q', self._map, 0)[0] or 8
+        self._offsets = {}
+        for (name, labels, index), offset in _metrics_records(self._map, self._used):
+            self._offsets[(name, tuple(labels), index)] = offset
+
+    def observe(self, name, labels, index, value):
+        with self._lock:
+            self._add((name, labels, index), 1)
+            self._add((name, labels, 'sum'), value)
+
+    def _add(self, key, amount):
+        offset = self._offsets.get(key)
+        if offset is None:
+            offset = self._offsets[key] = self._append(json.dumps([key[0], list(key[1]), key[2]]).encode())
+        struct.pack_into('<d', self._map, offset, struct.unpack_from('<d', self._map, offset)[0] + amount)
+
+    def _append(self, encoded):
+        padded = len(encoded) + (-(4 + len(encoded)) % 8)
+        size = 4 + padded + 8
+        if self._used + size > len(self._map):
+            self._map.close()
+            self._file.truncate(max(2 * os.fstat(self._file.fileno()).st_size, self._used + size))
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        struct.pack_into('<I', self._map, self._used, len(encoded))
+        self._map[self._used + 4:self._used + 4 + len(encoded)] = encoded
+        offset = self._used + 4 + padded
+        struct.pack_into('<d', self._map, offset, 0.0)
+        # Readers only look at records within the used size, so it is
+        # published once the record is complete
+        self._used += size
+        struct.pack_into('<Q', self._map, 0, self._used)
+        return offset
+
+
+def _metrics_records(data, used):
+    # (key, value offset) of every record in a metrics file
+    position = 8
+    while position < used:
+        length = struct.unpack_from('<I', data, position)[0]
+        key = json.loads(bytes(data[position + 4:position + 4 + length]))
+        position += 4 + length + (-(4 + length) % 8)
+        yield key, position
+        position += 8
+
+
+_metrics_file = None
+_metrics_file_lock = threading.Lock()
+
+
+def metrics_file():
+    # This process's MetricsFile, opened again in a forked worker so it never
+    # writes to its parent's file
+    global _metrics_file
+    if _metrics_file is None or _metrics_file.path != _metrics_path():
+        with _metrics_file_lock:
+            if _metrics_file is None or _metrics_file.path != _metrics_path():
+                os.makedirs(METRICS_DIR, exist_ok=True)
+                _metrics_file = MetricsFile(_metrics_path())
+    return _metrics_file
+
+
+def _metrics_path():
+    return os.path.join(METRICS_DIR, f"histograms_{os.getpid()}.db")
+
+
+def collect_metrics_dir(directory):
+    # {histogram name: {labels: [bucket counts by index, sum]}} summed over
+    # every process's file
+    merged = {}
+    for path in glob.glob(os.path.join(directory, 'histograms_*.db')):
+        with open(path, 'rb') as f:
+            data = f.read()
+        if len(data) < 8:
+            continue
+        used = min(struct.unpack_from('<Q', data, 0)[0], len(data))
+        for (name, labels, index), offset in _metrics_records(data, used):
+            value = struct.unpack_from('<d', data, offset)[0]
+            series = merged.setdefault(name, {}).setdefault(tuple(labels), [{}, 0.0])
+            if index == 'sum':
+                series[1] += value
+            else:
+                series[0][index] = series[0].get(index, 0) + int(value)
+    return merged
+
+
+STAGE_SECONDS = Histogram('trading_stage_seconds', 'Time spent in each stage of serving a prediction.',
+                          ('stage',))
+REQUEST_SECONDS = Histogram('trading_request_seconds', 'HTTP request latency by endpoint and status.',
+                            ('endpoint', 'method', 'status'))
+INFERENCE_BATCH_SIZE = Histogram('trading_inference_batch_size', 'Frames scored per batched model call.',
+                                 (), buckets=[1, 2, 4, 8, 16, 32, 64, 128, 256])
+
+
+@contextmanager
+def stage(name):
+    # Times the block into trading_stage_seconds{stage=name}: refresh, fetch,
+    # assemble, queue, inference, postprocess or serialize
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe((name,), time.perf_counter() - started)
+
+
+def observe_stage(name, seconds):
+    STAGE_SECONDS.observe((name,), seconds)
+
+
+def render_metrics():
+    histograms = [STAGE_SECONDS, REQUEST_SECONDS, INFERENCE_BATCH_SIZE]
+    lines = []
+    if METRICS_DIR:
+        merged = collect_metrics_dir(METRICS_DIR)
+        for histogram in histograms:
+            series = {labels: [[counts.get(i, 0) for i in range(len(histogram.buckets) + 1)], total]
+                      for labels, (counts, total) in merged.get(histogram.name, {}).items()}
+            lines += histogram.render(series)
+    else:
+        for histogram in histograms:
+            lines += histogram.render()
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_response():
+    # Prometheus text exposition format
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+
+def _start_request():
+    g.request_started = time.perf_counter()
+    wanted = PROFILE_ENABLED and request.headers.get('X-Profile') == '1'
+    if wanted or (PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+
+def _finish_request(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        # Streamed bodies are produced after this point, so for NDJSON the
+        # profile covers the work up to the first byte
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                                         f"{request.endpoint or 'unknown'}-{time.time_ns() % 10**9:09d}.prof")
+        profiler.dump_stats(path)
+        response.headers['X-Profile-Output'] = path
+
+    started = g.pop('request_started', None)
+    if started is not None and request.endpoint != 'metrics':
+        REQUEST_SECONDS.observe((request.endpoint or 'unknown', request.method, str(response.status_code)),
+                                time.perf_counter() - started)
+    return response
+
+
+def _teardown_request(exc):
+    # A request that failed before after_request must not leave its thread
+    # profiling
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def instrument_app(app):
+    # Request latency histograms and the optional profiler for every route
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_teardown_request)
@@ -0,0 +1,185 @@
+#local_models.py
+import pickle
+import numpy as np
+
+# Per-ticker forecasters trained offline by train.py. This module is copied
+# into the exported MLflow artifact (code/local_models.py) and named as its
+# loader_module, so it must only depend on NumPy and pandas.
+
+# feature_cache.NUMERIC_COLUMNS, repeated so the artifact does not need the
+# service modules
+COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume',
+           'RSI', 'MACD_12_26_9', 'MACDh_12_26_9', 'MACDs_12_26_9',
+           'BBL_20_2.0', 'BBM_20_2.0', 'BBU_20_2.0', 'BBB_20_2.0', 'BBP_20_2.0', 'MA']
+CLOSE = COLUMNS.index('Close')
+RSI = COLUMNS.index('RSI')
+MACD_HIST = COLUMNS.index('MACDh_12_26_9')
+BB_WIDTH = COLUMNS.index('BBB_20_2.0')
+BB_POSITION = COLUMNS.index('BBP_20_2.0')
+MA = COLUMNS.index('MA')
+
+
+def log_returns(closes):
+    return np.diff(np.log(closes))
+
+
+def ridge(X, Y, alpha):
+    # Ridge regression on standardized X with an unpenalized intercept; Y may
+    # hold several targets, one per column
+    mean = X.mean(axis=0)
+    std = X.std(axis=0)
+    std[std == 0] = 1.0
+    Z = (X - mean) / std
+    intercept = Y.mean(axis=0)
+    coef = np.linalg.solve(Z.T @ Z + alpha * np.eye(Z.shape[1]), Z.T @ (Y - intercept))
+    return {'mean': mean, 'std': std, 'coef': coef, 'intercept': intercept}
+
+
+def ridge_predict(model, X):
+    return (X - model['mean']) / model['std'] @ model['coef'] + model['intercept']
+
+
+# Every candidate is a pair of functions over `values`, the bars of one
+# ticker shaped (bars, len(COLUMNS)) in Date order with a finite Close:
+#   fit(values, horizon) -> params
+#   forecast(params, values, horizon) -> (horizon,) closes after the last bar
+# fit raises ValueError when values is too short to fit.
+
+def fit_naive(values, horizon):
+    return {}
+
+
+def forecast_naive(params, values, horizon):
+    return np.full(horizon, values[-1, CLOSE])
+
+
+def fit_drift(values, horizon, lookback=60):
+    # Mean log return over the last lookback bars
+    returns = log_returns(values[-lookback - 1:, CLOSE])
+    return {'mu': float(returns.mean()) if len(returns) else 0.0}
+
+
+def forecast_drift(params, values, horizon):
+    return values[-1, CLOSE] * np.exp(params['mu'] * np.arange(1, horizon + 1))
+
+
+def lagged(returns, lags):
+    # Row t holds the `lags` returns before returns[lags + t], most recent first
+    n = len(returns)
+    return np.column_stack([returns[lags - k - 1:n - k - 1] for k in range(lags)])
+
+
+def fit_ar(values, horizon, lags=5, alpha=10.0):
+    # Ridge AR(lags) on log returns, applied recursively when forecasting
+    returns = log_returns(values[:, CLOSE])
+    if len(returns) < lags * 4:
+        raise ValueError(f"AR({lags}) needs at least {lags * 4 + 1} bars, got {len(values)}")
+    return {'lags': lags, 'model': ridge(lagged(returns, lags), returns[lags:, None], alpha)}
+
+
+def forecast_ar(params, values, horizon):
+    lags = params['lags']
+    recent = log_returns(values[-lags - 1:, CLOSE])[::-1]
+    if len(recent) < lags:
+        recent = np.concatenate([recent, np.zeros(lags - len(recent))])
+    path = np.empty(horizon)
+    for step in range(horizon):
+        path[step] = ridge_predict(params['model'], recent[None, :])[0, 0]
+        recent = np.concatenate([[path[step]], recent[:-1]])
+    return values[-1, CLOSE] * np.exp(np.cumsum(path))
+
+
+def indicator_features(values):
+    # Scale-free features of every bar: RSI, MACD histogram and Bollinger
+    # width and position, distance from the moving average, and the last 1
+    # and 5 bar log returns
+    close = values[:, CLOSE]
+    return1 = np.full(len(close), np.nan)
+    return5 = np.full(len(close), np.nan)
+    return1[1:] = np.log(close[1:] / close[:-1])
+    return5[5:] = np.log(close[5:] / close[:-5])
+    return np.column_stack([
+        values[:, RSI] / 100,
+        values[:, MACD_HIST] / close,
+        values[:, BB_WIDTH] / 100,
+        values[:, BB_POSITION],
+        close / values[:, MA] - 1,
+        return1,
+        return5,
+    ])
+
+
+def fit_indicators(values, horizon, alpha=10.0):
+    # One ridge regression per forecast step (solved together) from the
+    # indicators at a bar to the log return 1..horizon bars later, as in the
+    # linear regression notebook but without leaking future bars
+    close = values[:, CLOSE]
+    features = indicator_features(values)[:len(values) - horizon]
+    future = np.arange(len(features))[:, None] + np.arange(1, horizon + 1)
+    targets = np.log(close[future] / close[:len(features), None])
+    usable = np.isfinite(features).all(axis=1) & np.isfinite(targets).all(axis=1)
+    if usable.sum() < features.shape[1] * 4:
+        raise ValueError(f"Not enough bars with indicators to fit ({usable.sum()} usable)")
+    return {'model': ridge(features[usable], targets[usable], alpha)}
+
+
+def forecast_indicators(params, values, horizon):
+    features = indicator_features(values[-6:])[-1]
+    if not np.isfinite(features).all():
+        raise ValueError("The last bar is missing indicators")
+    returns = ridge_predict(params['model'], features[None, :])[0]
+    # Steps past the fitted horizon hold the last forecast
+    steps = np.minimum(np.arange(horizon), len(returns) - 1)
+    return values[-1, CLOSE] * np.exp(returns[steps])
+
+
+CANDIDATES = {
+    'naive': (fit_naive, forecast_naive),
+    'drift': (fit_drift, forecast_drift),
+    'ar': (fit_ar, forecast_ar),
+    'indicators': (fit_indicators, forecast_indicators),
+}
+
+
+def fit_forecast(candidate, values, horizon):
+    fit, forecast = CANDIDATES[candidate]
+    return forecast(fit(values, horizon), values, horizon)
+
+
+class LocalForecaster:
+    # The pyfunc model of an exported artifact: the chosen candidate and its
+    # fitted params for every trained ticker. Tickers it was not trained on
+    # are forecast by `fallback`, fitted on the input frame itself.
+
+    def __init__(self, models, horizon, fallback='drift', summary=None):
+        self.models = models  # ticker -> {'candidate': ..., 'params': ...}
+        self.horizon = horizon
+        self.fallback = fallback
+        self.summary = summary or {}
+
+    def forecast(self, ticker, values, horizon):
+        entry = self.models.get(ticker)
+        if entry is None:
+            return fit_forecast(self.fallback, values, horizon)
+        return CANDIDATES[entry['candidate']][1](entry['params'], values, horizon)
+
+    def predict(self, model_input, params=None):
+        # One value per input row, like the AutoML forecaster: the rows of
+        # each Ticker get the forecast for as many bars after its last bar
+        frame = model_input.reindex(columns=['Date', 'Ticker'] + COLUMNS)
+        output = np.empty(len(frame))
+        for ticker, rows in frame.groupby('Ticker', sort=False).indices.items():
+            group = frame.iloc[rows]
+            order = np.argsort(group['Date'].to_numpy(), kind='stable')
+            values = group[COLUMNS].to_numpy(dtype=float)[order]
+            values = values[np.isfinite(values[:, CLOSE])]
+            if not len(values):
+                raise ValueError(f"No closes for {ticker}")
+            output[rows[order]] = self.forecast(ticker, values, len(rows))
+        return output
+
+
+def _load_pyfunc(path):
+    # Entry point mlflow.pyfunc.load_model calls with the artifact's model.pkl
+    with open(path, 'rb') as f:
+        return pickle.load(f)
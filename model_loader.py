@@ -0,0 +1,295 @@
+#model_loader.py
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import traceback
+
+# Model artifacts are looked up locally first so the services start without
+# the network. Azure ML is only contacted when no local artifact exists (or
+# MODEL_SOURCE=azureml), and its download is kept in MODEL_CACHE_DIR with
+# the same <name>/<version>/mlflow-model layout as a deployment mount.
+MODEL_NAME = os.getenv('MODEL_NAME', 'Time-Series-Prophet-Model')
+MODEL_SOURCE = os.getenv('MODEL_SOURCE', 'auto')  # auto | local | azureml
+MODEL_PATH = os.getenv('MODEL_PATH')
+MODEL_CACHE_DIR = os.getenv('MODEL_CACHE_DIR', 'azureml-models')
+MODEL_FALLBACK_PATH = os.getenv('MODEL_FALLBACK_PATH', 'mlflow-model')
+MODEL_LOAD_MODE = os.getenv('MODEL_LOAD_MODE', 'background')  # background | eager
+
+# sha256sum-format manifest written next to the MLmodel file
+CHECKSUM_FILE = 'checksums.sha256'
+
+
+class ModelNotReady(Exception):
+    pass
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def artifact_files(model_dir):
+    files = []
+    for root, _, names in os.walk(model_dir):
+        for name in names:
+            path = os.path.relpath(os.path.join(root, name), model_dir)
+            if name != CHECKSUM_FILE and '__pycache__' not in path:
+                files.append(path.replace(os.sep, '/'))
+    return sorted(files)
+
+
+def write_checksums(model_dir):
+    lines = [f"{file_sha256(os.path.join(model_dir, path))}  {path}" for path in artifact_files(model_dir)]
+    with open(os.path.join(model_dir, CHECKSUM_FILE), 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+
+def verify_checksums(model_dir):
+    # Returns False when there is no manifest yet; raises ChecksumMismatch
+    # when a file is missing or its contents changed
+    manifest = os.path.join(model_dir, CHECKSUM_FILE)
+    if not os.path.exists(manifest):
+        return False
+    with open(manifest) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            expected, path = line.rstrip('\n').split('  ', 1)
+            full_path = os.path.join(model_dir, path)
+            if not os.path.exists(full_path):
+                raise ChecksumMismatch(f"{full_path} is missing")
+            if file_sha256(full_path) != expected:
+                raise ChecksumMismatch(f"{full_path} does not match its checksum")
+    return True
+
+
+def find_mlmodel_dir(path):
+    # The directory holding the MLmodel file, at or below path
+    for root, _, names in os.walk(path):
+        if 'MLmodel' in names:
+            return root
+    return None
+
+
+def cached_versions(name=MODEL_NAME, cache_dir=MODEL_CACHE_DIR):
+    # Versions of name in the cache, newest first
+    model_root = os.path.join(cache_dir, name)
+    if not os.path.isdir(model_root):
+        return []
+    versions = [v for v in os.listdir(model_root) if os.path.isdir(os.path.join(model_root, v))]
+    return sorted(versions, key=lambda v: (not v.isdigit(), -int(v) if v.isdigit() else 0, v))
+
+
+def find_local_model(name=MODEL_NAME, cache_dir=MODEL_CACHE_DIR):
+    # (path, version) of the best local artifact, or (None, None)
+    if MODEL_PATH:
+        return find_mlmodel_dir(MODEL_PATH), None
+    for version in cached_versions(name, cache_dir):
+        path = find_mlmodel_dir(os.path.join(cache_dir, name, version))
+        if path:
+            return path, version
+    if os.path.isdir(MODEL_FALLBACK_PATH):
+        return find_mlmodel_dir(MODEL_FALLBACK_PATH), None
+    return None, None
+
+
+def download_model(name=MODEL_NAME, cache_dir=MODEL_CACHE_DIR):
+    # Fetch the latest registered version from Azure ML into the cache
+    from azureml.core import Workspace, Model
+
+    ws = Workspace.from_config()
+    print("Workspace configuration succeeded")
+    model = Model(ws, name)
+    version = str(model.version)
+    target = os.path.join(cache_dir, name, version)
+    cached = find_mlmodel_dir(target) if os.path.isdir(target) else None
+    if cached:
+        try:
+            if verify_checksums(cached):
+                print(f"Model '{name}' version {version} already cached at {cached}")
+                return cached, version
+        except ChecksumMismatch as e:
+            print(f"Discarding cached model: {e}")
+        shutil.rmtree(target)
+
+    # Download next to the cache and move into place so a crash mid-download
+    # never leaves a partial artifact where find_local_model would pick it up
+    os.makedirs(os.path.join(cache_dir, name), exist_ok=True)
+    staging = tempfile.mkdtemp(dir=os.path.join(cache_dir, name), prefix=f".{version}-")
+    try:
+        model.download(target_dir=staging, exist_ok=True)
+        model_dir = find_mlmodel_dir(staging)
+        if model_dir is None:
+            raise FileNotFoundError(f"No MLmodel file in the download of '{name}' version {version}")
+        write_checksums(model_dir)
+        os.replace(staging, target)
+    finally:
+        if os.path.isdir(staging):
+            shutil.rmtree(staging)
+    return find_mlmodel_dir(target), version
+
+
+def resolve_model_path(name=MODEL_NAME, source=MODEL_SOURCE, cache_dir=MODEL_CACHE_DIR):
+    # (path, version) of a checksum-validated artifact for name
+    if source != 'azureml':
+        path, version = find_local_model(name, cache_dir)
+        if path:
+            if not verify_checksums(path):
+                # First use of this artifact: record its checksums so later
+                # starts detect a truncated or modified copy
+                try:
+                    write_checksums(path)
+                except OSError as e:
+                    print(f"Could not write checksums for {path}: {e}")
+            return path, version
+        if source == 'local':
+            raise FileNotFoundError(f"No local artifact for model '{name}' (set MODEL_PATH or MODEL_CACHE_DIR)")
+    return download_model(name, cache_dir)
+
+
+def artifact_fingerprint(path):
+    # Identifies an artifact by location and checksum manifest, so a new
+    # version directory or a re-downloaded artifact reads as a change
+    manifest = os.path.join(path, CHECKSUM_FILE)
+    checksums = None
+    if os.path.exists(manifest):
+        with open(manifest) as f:
+            checksums = f.read()
+    return os.path.abspath(path), checksums
+
+
+def load_model(path):
+    import mlflow.pyfunc
+
+    return mlflow.pyfunc.load_model(path)
+
+
+def model_version_of(loaded_model, fallback):
+    # MLflow models carry a uuid in their MLmodel metadata
+    metadata = getattr(loaded_model, 'metadata', None)
+    return getattr(metadata, 'model_uuid', None) or fallback
+
+
+class ModelHandle:
+    # Loads the model once, either inline or on a warm-up thread, and tells
+    # callers whether it is ready
+
+    def __init__(self, name=MODEL_NAME, source=MODEL_SOURCE, cache_dir=MODEL_CACHE_DIR):
+        self.name = name
+        self.source = source
+        self.cache_dir = cache_dir
+        self.model = None
+        self.version = None
+        self.path = None
+        self.fingerprint = None
+        self.error = None
+        self.resolve_seconds = None
+        self.load_seconds = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _load_artifact(self):
+        started = time.perf_counter()
+        path, version = resolve_model_path(self.name, self.source, self.cache_dir)
+        resolve_seconds = time.perf_counter() - started
+        fingerprint = artifact_fingerprint(path)
+        if fingerprint == self.fingerprint:
+            return False
+
+        started = time.perf_counter()
+        model = load_model(path)
+        self.load_seconds = time.perf_counter() - started
+        self.resolve_seconds = resolve_seconds
+
+        self.model = model
+        self.version = model_version_of(model, f"{self.name}:{version or 'local'}")
+        self.path = path
+        self.fingerprint = fingerprint
+        self.error = None
+        print(f"Model '{self.name}' loaded successfully from {path} "
+              f"in {self.resolve_seconds + self.load_seconds:.2f}s")
+        return True
+
+    def load(self):
+        with self._lock:
+            if self._ready.is_set():
+                return self.model
+            try:
+                self._load_artifact()
+                self._ready.set()
+                return self.model
+            except Exception as e:
+                self.error = str(e)
+                print(f"Error loading model: {e}")
+                print("Traceback:")
+                traceback.print_exc()
+                raise
+
+    def reload(self):
+        # Load whatever artifact resolve_model_path picks now, if it differs
+        # from the loaded one. Returns True when the model was replaced; on
+        # failure the current model stays in place.
+        with self._lock:
+            try:
+                changed = self._load_artifact()
+            except Exception as e:
+                print(f"Model reload failed, keeping {self.path}: {e}")
+                return False
+            self._ready.set()
+            return changed
+
+    def has_update(self):
+        # True when resolve_model_path now picks a different artifact than
+        # the loaded one
+        try:
+            path, _ = resolve_model_path(self.name, self.source, self.cache_dir)
+            return artifact_fingerprint(path) != self.fingerprint
+        except Exception as e:
+            print(f"Could not check for a new model: {e}")
+            return False
+
+    def start(self, mode=MODEL_LOAD_MODE):
+        # eager loads before returning and fails startup on error; background
+        # lets the service come up and answer readiness probes meanwhile
+        if mode == 'eager':
+            self.load()
+            return
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._warm_up, name='model-warmup', daemon=True)
+            self._thread.start()
+
+    def _warm_up(self):
+        try:
+            self.load()
+        except Exception:
+            pass
+
+    def is_ready(self):
+        return self._ready.is_set()
+
+    def get(self):
+        if not self._ready.is_set():
+            raise ModelNotReady(self.error or f"Model '{self.name}' is still loading")
+        return self.model
+
+    def status(self):
+        return {
+            'ready': self.is_ready(),
+            'model': self.name,
+            'version': self.version,
+            'path': self.path,
+            'resolve_seconds': self.resolve_seconds,
+            'load_seconds': self.load_seconds,
+            'error': self.error,
+        }
@@ -1,75 +1,68 @@
-import os
 from flask import Flask, request, jsonify
-from azureml.core import Workspace, Model
-import pandas as pd
-import numpy as np
-from datetime import datetime, timedelta
-from pymongo import MongoClient
-import mlflow
+from functools import partial
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from database import bootstrap_indexes
 import traceback
 from dotenv import load_dotenv
 from pandas.tseries.offsets import BDay
+from feature_cache import FeatureCache
+from feature_store import FEATURE_STORE, feature_store_from_env
+from forecast_cache import forecast_cache_from_env
+from model_loader import ModelHandle
+from inference_dispatcher import INFERENCE_BATCHING, InferenceDispatcher, DispatcherBusy
+from fast_json import FastJSONProvider, wants_ndjson, ndjson_response
+from instrumentation import DEBUG_LOGGING, instrument_app, metrics_response, stage
+from forecasting import (snap_prediction_days, build_response, forecast, forecast_quantiles, parse_quantiles,
+                         parse_batch_request, predict_batch, stream_batch, response_records,
+                         MAX_BATCH_SYMBOLS, MAX_STREAM_SYMBOLS)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
+instrument_app(app)
 
-# MongoDB setup
-mongo_uri = os.getenv('MONGO_URI')
-client = MongoClient(mongo_uri)
-db = client.get_default_database()
-model_data_collection = db['model_ready_data']
-
-# Load Azure ML workspace
-try:
-    ws = Workspace.from_config()
-    print("Workspace configuration succeeded")
-except Exception as e:
-    print(f"Error loading workspace configuration: {e}")
-    raise
-
-# Load the model
-try:
-    model_name = "Time-Series-Prophet-Model"  # Replace with your actual model name
-    model = Model(ws, model_name)
-    model_path = model.download(exist_ok=True)
-    loaded_model = mlflow.pyfunc.load_model(model_path)
-    print(f"Model '{model_name}' loaded successfully")
-except Exception as e:
-    print(f"Error loading model: {e}")
-    print("Traceback:")
-    traceback.print_exc()
-    raise
+# Feature store setup: MongoDB or the local Arrow/Parquet files
+feature_store = feature_store_from_env()
+if FEATURE_STORE == 'mongo':
+    bootstrap_indexes()
+
+# Load the model from the local artifact cache (Azure ML only when there is
+# none); in background mode requests get a 503 until the warm-up finishes
+model_handle = ModelHandle()
+model_handle.start()
+
+# Hot cache of the latest bars per ticker; entries expire after
+# FEATURE_CACHE_TTL_SECONDS so bars written by data_handler.py are picked up
+feature_cache = FeatureCache(feature_store.window_loader())
+
+# Memoized model output per ticker, latest bar date, horizon and model version
+forecast_cache = forecast_cache_from_env()
+
+# Optional micro-batching: concurrent /predict calls share one model call
+inference_dispatcher = InferenceDispatcher(model_handle.get) if INFERENCE_BATCHING else None
 
 def get_prediction_data(symbol, days=30):
     end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
     start_date = end_date - BDay(days)  # This will give us the last 30 business days
-    
-    data = list(model_data_collection.find({
-        'Ticker': symbol,
-        'Date': {'$gte': start_date, '$lte': end_date}
-    }).sort('Date', 1))
-
-    df = pd.DataFrame(data)
-    
+
+    # All required columns are present, missing values are NaN
+    df = feature_cache.get_frame(symbol, start_date, end_date)
+
     if df.empty:
         raise ValueError(f"No data available for {symbol} in the specified date range")
-    
-    # Ensure all required columns are present
-    required_columns = ['Date', 'Open', 'High', 'Low', 'Close', 'Volume', 'Ticker', 
-                        'RSI', 'MACD_12_26_9', 'MACDh_12_26_9', 'MACDs_12_26_9', 
-                        'BBL_20_2.0', 'BBM_20_2.0', 'BBU_20_2.0', 'BBB_20_2.0', 'BBP_20_2.0', 'MA']
-    
-    for col in required_columns:
-        if col not in df.columns:
-            df[col] = np.nan
-    
-    print(f"Fetched {len(df)} rows of data for {symbol}")
+
+    if DEBUG_LOGGING:
+        print(f"Fetched {len(df)} rows of data for {symbol}")
     return df
 
 @app.route('/api/v1/trading/predict', methods=['POST'])
 def predict():
+    if not model_handle.is_ready():
+        return jsonify({'error': 'Model is not ready', **model_handle.status()}), 503
+
     try:
         data = request.json
         ticker = data['symbol']
@@ -77,8 +70,13 @@ def predict():
         prediction_days = data.get('prediction_days', 30)  # Default to 30 days
 
         # Ensure prediction_days is one of the allowed values
-        allowed_days = [7, 14, 21, 28, 35, 42, 49, 56]
-        prediction_days = min(allowed_days, key=lambda x: abs(x - prediction_days))
+        prediction_days = snap_prediction_days(prediction_days)
+
+        # Optional prediction bands, e.g. "quantiles": [0.05, 0.95]
+        try:
+            quantiles = parse_quantiles(data['quantiles']) if data.get('quantiles') is not None else None
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         print(f"Received request for {ticker}, current price: {current_price}, prediction days: {prediction_days}")
 
@@ -87,60 +85,45 @@ def predict():
         if len(prediction_data) < 20:  # Assuming we need at least 20 data points for a reliable prediction
             raise ValueError(f"Insufficient data for prediction. Only {len(prediction_data)} data points available.")
 
-        print(f"Prediction data shape: {prediction_data.shape}")
-        print(f"Prediction data columns: {prediction_data.columns}")
-        print(f"Prediction data head:\n{prediction_data.head()}")
-        print(f"Prediction data tail:\n{prediction_data.tail()}")
-
-        predictions = loaded_model.predict(prediction_data)
+        if DEBUG_LOGGING:
+            print(f"Prediction data shape: {prediction_data.shape}")
+            print(f"Prediction data columns: {prediction_data.columns}")
+            print(f"Prediction data head:\n{prediction_data.head()}")
+            print(f"Prediction data tail:\n{prediction_data.tail()}")
+
+        # Reuse the forecast for this bar date if we have it
+        bands = None
+        if quantiles is None:
+            scorer = inference_dispatcher or model_handle.model
+            predictions = forecast(scorer, ticker, prediction_data, prediction_days,
+                                   forecast_cache, model_handle.version)
+        else:
+            # Every quantile from one forecast_quantiles pass; the median is
+            # the point forecast the actions are based on
+            bands = forecast_quantiles(model_handle.model, ticker, prediction_data, prediction_days,
+                                       quantiles, forecast_cache, model_handle.version)
+            predictions = bands[quantiles.index(0.5)]
         
-        print(f"Raw predictions: {predictions}")
+        if DEBUG_LOGGING:
+            print(f"Raw predictions: {predictions}")
 
         if len(predictions) == 0:
             raise ValueError("Model returned no predictions")
 
-        forecast_dates = [datetime.now().date() + timedelta(days=i) for i in range(1, prediction_days + 1)]
-        
-        processed_predictions = []
-        for i in range(0, prediction_days, 7):
-            week_predictions = predictions[i:i+7]
-            week_dates = forecast_dates[i:i+7]
-            
-            if len(week_predictions) == 0:
-                continue  # Skip this week if there are no predictions
-            
-            min_price = min(week_predictions)
-            max_price = max(week_predictions)
-            
-            for j, (date, price) in enumerate(zip(week_dates, week_predictions)):
-                if j < len(week_predictions):  # Ensure we don't go out of bounds
-                    if price == min_price:
-                        action = 'buy'
-                    elif price == max_price:
-                        action = 'sell'
-                    else:
-                        action = 'hold'
-                    
-                    processed_predictions.append({
-                        'date': date.strftime('%Y-%m-%d'),
-                        'predicted_close': float(price),
-                        'action': action
-                    })
-
-        if len(processed_predictions) == 0:
-            raise ValueError("No predictions were processed")
-
-        # Calculate overall trend
-        overall_trend = 'upward' if predictions[-1] > predictions[0] else 'downward'
-        
-        response = {
-            'symbol': ticker,
-            'current_price': current_price,
-            'predictions': processed_predictions,
-            'overall_trend': overall_trend
-        }
-        
-        return jsonify(response)
+        # Weekly buy/sell/hold labels and the overall trend
+        response = build_response(ticker, current_price, predictions, prediction_days, quantiles, bands)
+
+        if wants_ndjson(request):
+            return ndjson_response(response_records(response))
+        with stage('serialize'):
+            return jsonify(response)
+
+    except NotImplementedError as e:
+        return jsonify({'error': str(e)}), 501
+
+    except (DispatcherBusy, FutureTimeoutError) as e:
+        # Inference queue is full or too slow: ask the client to back off
+        return jsonify({'error': str(e) or 'Timed out waiting for inference'}), 503, {'Retry-After': '1'}
 
     except Exception as e:
         print(f"Error during prediction: {str(e)}")
@@ -156,5 +139,51 @@ def predict():
             }
         }), 500
 
+@app.route('/api/v1/trading/predict/batch', methods=['POST'])
+def predict_batch_route():
+    if not model_handle.is_ready():
+        return jsonify({'error': 'Model is not ready', **model_handle.status()}), 503
+
+    # With Accept: application/x-ndjson results are streamed chunk by chunk
+    stream = wants_ndjson(request)
+    try:
+        items = parse_batch_request(request.json, MAX_STREAM_SYMBOLS if stream else MAX_BATCH_SYMBOLS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    get_data = partial(get_prediction_data, days=60)
+    if stream:
+        print(f"Streaming batch request for {len(items)} symbols")
+        return ndjson_response(stream_batch(model_handle.model, items, get_data,
+                                            forecast_cache, model_handle.version))
+
+    try:
+        print(f"Received batch request for {len(items)} symbols")
+        results, errors = predict_batch(model_handle.model, items, get_data,
+                                        forecast_cache, model_handle.version)
+        with stage('serialize'):
+            return jsonify({'results': results, 'errors': errors})
+
+    except Exception as e:
+        print(f"Error during batch prediction: {str(e)}")
+        print("Traceback:")
+        traceback.print_exc()
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/v1/trading/ready', methods=['GET'])
+def ready():
+    # Readiness probe: 200 once the model has loaded
+    status = model_handle.status()
+    return jsonify(status), 200 if status['ready'] else 503
+
+@app.route('/api/v1/trading/cache', methods=['GET'])
+def cache_stats():
+    return jsonify({'feature_cache': feature_cache.stats(), 'forecast_cache': forecast_cache.stats()})
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    # Per-stage and per-endpoint latency histograms for Prometheus
+    return metrics_response()
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -0,0 +1,396 @@
+#predict_async.py
+# asyncio variant of predict-1.py for an ASGI server:
+#
+#   uvicorn predict_async:app --host 0.0.0.0 --port 5000 --workers 4
+#
+# Same routes and response bodies as predict-1.py. Feature cache misses are
+# awaited on motor (or run on a bounded I/O pool when motor is not
+# installed), so slow MongoDB round trips do not hold a thread. Model calls
+# run on a bounded inference pool, and every prediction request has a
+# deadline and is cancelled as soon as its client disconnects.
+import os
+import hmac
+import time
+import asyncio
+import threading
+import traceback
+from functools import partial
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from werkzeug.datastructures import MIMEAccept
+from werkzeug.http import parse_accept_header
+from database import bootstrap_indexes
+from data_handler import update_database, add_ingest_listener, feature_store
+from refresher import DataRefresher, serialized
+from feature_cache import FeatureCache
+from feature_store import FEATURE_STORE
+from forecast_cache import forecast_cache_from_env
+from model_loader import ModelHandle
+from inference_dispatcher import INFERENCE_BATCHING, InferenceDispatcher, DispatcherBusy
+from fast_json import dumps, prefers_ndjson
+from instrumentation import REQUEST_SECONDS, render_metrics, observe_stage, stage
+from forecasting import (snap_prediction_days, build_response, forecast, forecast_quantiles, parse_quantiles,
+                         parse_batch_request, predict_batch, response_records,
+                         MAX_BATCH_SYMBOLS, MAX_STREAM_SYMBOLS, STREAM_CHUNK_SYMBOLS)
+
+# Load environment variables
+load_dotenv()
+
+# Threads for blocking reads (Arrow files, or pymongo without motor)
+ASYNC_IO_WORKERS = int(os.getenv('ASYNC_IO_WORKERS', 16))
+# Threads running model calls, and how many calls may be queued or running
+# before requests get a 503
+ASYNC_INFERENCE_WORKERS = int(os.getenv('ASYNC_INFERENCE_WORKERS', 4))
+ASYNC_INFERENCE_MAX_PENDING = int(os.getenv('ASYNC_INFERENCE_MAX_PENDING', 64))
+# Deadline for a prediction request up to its first byte; past it the work is
+# cancelled and the client gets a 504
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('REQUEST_TIMEOUT_SECONDS', 30))
+
+
+class InferencePool:
+    # Thread pool for model calls that turns work away once max_pending calls
+    # are queued or running. A call cancelled before a thread picks it up is
+    # dropped from the queue.
+
+    def __init__(self, workers=ASYNC_INFERENCE_WORKERS, max_pending=ASYNC_INFERENCE_MAX_PENDING):
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='inference')
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    async def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise DispatcherBusy(f"Inference pool is full ({self.max_pending} pending)")
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return await asyncio.wrap_future(future)
+
+
+io_executor = ThreadPoolExecutor(max_workers=ASYNC_IO_WORKERS, thread_name_prefix='feature-io')
+inference_pool = InferencePool()
+
+# Background data refresh on its own thread, kept off the event loop; the
+# file lock keeps the refreshers of several uvicorn workers from overlapping
+refresh_interval = int(os.getenv('REFRESH_INTERVAL_SECONDS', 900))
+stale_after = int(os.getenv('REFRESH_STALE_AFTER_SECONDS', 2 * refresh_interval))
+admin_token = os.getenv('ADMIN_TOKEN')
+# (indicators on threads, since pool workers would re-import the main script)
+data_refresher = DataRefresher(serialized(partial(update_database, processes=False)), refresh_interval,
+                               stale_after)
+
+# Feature store setup: MongoDB or the local Arrow/Parquet files
+if FEATURE_STORE == 'mongo':
+    bootstrap_indexes()
+
+# Load the model from the local artifact cache (Azure ML only when there is
+# none); in background mode requests get a 503 until the warm-up finishes
+model_handle = ModelHandle()
+model_handle.start()
+
+# Hot cache of the latest bars per ticker, kept current by the refresher's
+# writes; misses go through window_loader, set once the event loop runs
+feature_cache = FeatureCache(feature_store.window_loader())
+add_ingest_listener(feature_cache.append)
+window_loader = None
+
+# Memoized model output, dropped for a ticker once a newer bar is ingested
+forecast_cache = forecast_cache_from_env()
+add_ingest_listener(forecast_cache.on_ingest)
+
+# Optional micro-batching: concurrent /predict calls share one model call
+inference_dispatcher = InferenceDispatcher(model_handle.get) if INFERENCE_BATCHING else None
+
+def json_response(obj, status_code=200, headers=None):
+    # Same bytes as Flask's jsonify: compact, sorted keys, trailing newline
+    return Response(dumps(obj, sort_keys=True) + '\n', status_code, headers, media_type='application/json')
+
+def wants_ndjson(request):
+    return prefers_ndjson(parse_accept_header(request.headers.get('accept'), MIMEAccept))
+
+def ndjson_response(records, headers=None):
+    # Streams one JSON line per record from an async generator; a failure
+    # after the first line is reported as a final error record
+    async def lines():
+        encoding = 0.0
+        try:
+            async for record in records:
+                started = time.perf_counter()
+                line = dumps(record) + '\n'
+                encoding += time.perf_counter() - started
+                yield line
+        except Exception as e:
+            print(f"Error while streaming: {e}")
+            yield dumps({'type': 'error', 'error': str(e)}) + '\n'
+        finally:
+            observe_stage('serialize', encoding)
+
+    return StreamingResponse(lines(), headers=headers, media_type='application/x-ndjson')
+
+async def wait_for_disconnect(request):
+    # Returns once the client has gone away; the body must already be read
+    while (await request.receive())['type'] != 'http.disconnect':
+        pass
+
+def guarded(handler):
+    # Runs handler with REQUEST_TIMEOUT_SECONDS to produce its response and
+    # cancels it as soon as the client disconnects. Model calls not yet
+    # started are dropped; one already running finishes on its thread.
+    async def endpoint(request):
+        await request.body()
+        work = asyncio.ensure_future(asyncio.wait_for(handler(request), REQUEST_TIMEOUT_SECONDS))
+        disconnect = asyncio.ensure_future(wait_for_disconnect(request))
+        try:
+            done, _ = await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            disconnect.cancel()
+            if not work.done():
+                work.cancel()
+        if work not in done:
+            print(f"Client disconnected, cancelled {request.url.path}")
+            # Nobody is left to read it
+            return Response(status_code=499)
+        try:
+            return work.result()
+        except asyncio.TimeoutError:
+            return json_response({'error': f"Request timed out after {REQUEST_TIMEOUT_SECONDS:g}s"}, 504)
+
+    endpoint.__name__ = handler.__name__
+    return endpoint
+
+async def get_prediction_data(symbol, days=60):
+    end_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_date = end_date - timedelta(days=days)
+
+    # Columns come back in the order the model expects
+    df = await feature_cache.get_frame_async(symbol, window_loader, start_date, end_date)
+
+    if df.empty:
+        raise ValueError(f"No data available for {symbol} in the specified date range")
+
+    return df
+
+async def prefetch(symbols):
+    # Feature frames for symbols fetched concurrently, as a get_data for
+    # predict_batch that raises a symbol's fetch error in its place
+    symbols = list(dict.fromkeys(symbols))
+    fetched = dict(zip(symbols, await asyncio.gather(*(get_prediction_data(symbol) for symbol in symbols),
+                                                     return_exceptions=True)))
+
+    def get_data(symbol):
+        frame = fetched[symbol]
+        if isinstance(frame, Exception):
+            raise frame
+        return frame
+
+    return get_data
+
+@guarded
+async def predict(request):
+    if not model_handle.is_ready():
+        return json_response({'error': 'Model is not ready', **model_handle.status()}, 503)
+
+    try:
+        data = await request.json()
+        ticker = data['symbol']
+        current_price = data['current_price']
+        prediction_days = data.get('prediction_days', 30)  # Default to 30 days
+
+        # Ensure prediction_days is one of the allowed values
+        prediction_days = snap_prediction_days(prediction_days)
+
+        # Optional prediction bands, e.g. "quantiles": [0.05, 0.95]
+        try:
+            quantiles = parse_quantiles(data['quantiles']) if data.get('quantiles') is not None else None
+        except ValueError as e:
+            return json_response({'error': str(e)}, 400)
+
+        print(f"Received request for {ticker}, current price: {current_price}, prediction days: {prediction_days}")
+
+        prediction_data = await get_prediction_data(ticker, days=60)
+
+        # Make predictions on the inference pool, reusing the forecast for
+        # this bar date if we have it
+        bands = None
+        if quantiles is None:
+            scorer = inference_dispatcher or model_handle.model
+            predictions = await inference_pool.run(forecast, scorer, ticker, prediction_data, prediction_days,
+                                                   forecast_cache, model_handle.version)
+        else:
+            bands = await inference_pool.run(forecast_quantiles, model_handle.model, ticker, prediction_data,
+                                             prediction_days, quantiles, forecast_cache, model_handle.version)
+            predictions = bands[quantiles.index(0.5)]
+
+        # Process predictions
+        response = build_response(ticker, current_price, predictions, prediction_days, quantiles, bands)
+        headers = {'X-Data-Stale': str(data_refresher.is_stale()).lower()}
+
+        if wants_ndjson(request):
+            async def records():
+                for record in response_records(response):
+                    yield record
+            return ndjson_response(records(), headers)
+        with stage('serialize'):
+            return json_response(response, headers=headers)
+
+    except NotImplementedError as e:
+        return json_response({'error': str(e)}, 501)
+
+    except (DispatcherBusy, FutureTimeoutError) as e:
+        # Inference is saturated or too slow: ask the client to back off
+        return json_response({'error': str(e) or 'Timed out waiting for inference'}, 503, {'Retry-After': '1'})
+
+    except Exception as e:
+        print(f"Error during prediction: {str(e)}")
+        print("Traceback:")
+        traceback.print_exc()
+        return json_response({'error': str(e)}, 500)
+
+@guarded
+async def predict_batch_route(request):
+    if not model_handle.is_ready():
+        return json_response({'error': 'Model is not ready', **model_handle.status()}, 503)
+
+    # With Accept: application/x-ndjson results are streamed chunk by chunk
+    stream = wants_ndjson(request)
+    try:
+        items = parse_batch_request(await request.json(), MAX_STREAM_SYMBOLS if stream else MAX_BATCH_SYMBOLS)
+    except ValueError as e:
+        return json_response({'error': str(e)}, 400)
+
+    headers = {'X-Data-Stale': str(data_refresher.is_stale()).lower()}
+    if stream:
+        print(f"Streaming batch request for {len(items)} symbols")
+
+        async def records():
+            # Each chunk is fetched concurrently, then scored in one call
+            for start in range(0, len(items), STREAM_CHUNK_SYMBOLS):
+                chunk = items[start:start + STREAM_CHUNK_SYMBOLS]
+                get_data = await prefetch(item['symbol'] for item in chunk)
+                results, errors = await inference_pool.run(predict_batch, model_handle.model, chunk, get_data,
+                                                           forecast_cache, model_handle.version)
+                for error in errors:
+                    yield {'type': 'error', **error}
+                for response in results:
+                    for record in response_records(response):
+                        yield record
+        return ndjson_response(records(), headers)
+
+    try:
+        print(f"Received batch request for {len(items)} symbols")
+        get_data = await prefetch(item['symbol'] for item in items)
+        results, errors = await inference_pool.run(predict_batch, model_handle.model, items, get_data,
+                                                   forecast_cache, model_handle.version)
+
+        with stage('serialize'):
+            return json_response({'results': results, 'errors': errors}, headers=headers)
+
+    except DispatcherBusy as e:
+        return json_response({'error': str(e)}, 503, {'Retry-After': '1'})
+
+    except Exception as e:
+        print(f"Error during batch prediction: {str(e)}")
+        print("Traceback:")
+        traceback.print_exc()
+        return json_response({'error': str(e)}, 500)
+
+async def ready(request):
+    # Readiness probe: 200 once the model has loaded
+    status = model_handle.status()
+    return json_response(status, 200 if status['ready'] else 503)
+
+async def cache_stats(request):
+    return json_response({'feature_cache': feature_cache.stats(), 'forecast_cache': forecast_cache.stats()})
+
+async def metrics(request):
+    # Per-stage and per-endpoint latency histograms for Prometheus
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4')
+
+async def refresh(request):
+    if request.method == 'GET':
+        return json_response(data_refresher.status())
+
+    # Denied unless an admin token is configured
+    if not admin_token:
+        return json_response({'error': 'Refresh is disabled: ADMIN_TOKEN is not set'}, 403)
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), admin_token):
+        return json_response({'error': 'Unauthorized'}, 401)
+
+    # Joins the in-flight refresh if one is already running
+    future = data_refresher.trigger()
+    if request.query_params.get('wait', 'false').lower() == 'true':
+        try:
+            await asyncio.wrap_future(future)
+        except Exception as e:
+            return json_response({'error': str(e), **data_refresher.status()}, 500)
+        return json_response(data_refresher.status())
+
+    return json_response(data_refresher.status(), 202)
+
+
+class RequestMetrics:
+    # ASGI middleware recording trading_request_seconds like
+    # instrumentation.instrument_app does for the Flask services
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        status = {'code': 500}
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status['code'] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router leaves the matched endpoint in scope
+            endpoint = getattr(scope.get('endpoint'), '__name__', 'unknown')
+            if endpoint != 'metrics':
+                REQUEST_SECONDS.observe((endpoint, scope['method'], str(status['code'])),
+                                        time.perf_counter() - started)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global window_loader
+    # Created on the running loop, which the motor client binds to
+    window_loader = feature_store.async_window_loader(io_executor)
+    if os.getenv('REFRESH_ENABLED', 'true').lower() == 'true':
+        data_refresher.start()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/api/v1/trading/predict', predict, methods=['POST']),
+        Route('/api/v1/trading/predict/batch', predict_batch_route, methods=['POST']),
+        Route('/api/v1/trading/ready', ready, methods=['GET']),
+        Route('/api/v1/trading/cache', cache_stats, methods=['GET']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/api/v1/trading/refresh', refresh, methods=['GET', 'POST']),
+    ],
+    middleware=[
+        Middleware(RequestMetrics),
+        Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*']),
+    ],
+    lifespan=lifespan,
+)
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, port=5000)
@@ -0,0 +1,115 @@
+#refresher.py
+import os
+import sys
+import time
+import tempfile
+import threading
+import traceback
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from instrumentation import observe_stage
+
+REFRESH_LOCK_PATH = os.getenv('REFRESH_LOCK_PATH', os.path.join(tempfile.gettempdir(), 'trading-bot-refresh.lock'))
+
+
+def serialized(fn, lock_path=REFRESH_LOCK_PATH):
+    # Every worker process runs its own refresher; the file lock makes them
+    # take turns, and the high-water marks leave little for all but the first
+    # to do. Windows has no flock, so there fn is returned as is and the
+    # service imports without fcntl.
+    if sys.platform == 'win32':
+        return fn
+    import fcntl
+
+    def run(*args, **kwargs):
+        with open(lock_path, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    return run
+
+
+class DataRefresher:
+    # Owns data refreshes for the prediction service: runs refresh_fn on a fixed
+    # cadence in a background thread and coalesces concurrent requests for a
+    # refresh onto the single in-flight run.
+
+    def __init__(self, refresh_fn, interval_seconds=900, stale_after_seconds=None):
+        self.refresh_fn = refresh_fn
+        self.interval_seconds = interval_seconds
+        self.stale_after_seconds = stale_after_seconds or 2 * interval_seconds
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='data-refresh')
+        self._lock = threading.Lock()
+        self._inflight = None
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Written only by the refresh worker, read lock-free by request handlers
+        self.last_success_at = None
+        self._last_success_monotonic = None
+        self.last_error = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='data-refresh-scheduler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._executor.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            future = self.trigger()
+            try:
+                future.result()
+            except Exception:
+                pass
+            self._stop.wait(self.interval_seconds)
+
+    def trigger(self):
+        # Return the in-flight refresh if there is one, otherwise start a new one
+        with self._lock:
+            if self._inflight is None or self._inflight.done():
+                self._inflight = self._executor.submit(self._refresh)
+            return self._inflight
+
+    def _refresh(self):
+        started = time.monotonic()
+        try:
+            self.refresh_fn()
+        except Exception as e:
+            observe_stage('refresh', time.monotonic() - started)
+            self.last_error = str(e)
+            print(f"Data refresh failed: {e}")
+            traceback.print_exc()
+            raise
+        observe_stage('refresh', time.monotonic() - started)
+        self.last_error = None
+        self.last_success_at = datetime.utcnow()
+        self._last_success_monotonic = time.monotonic()
+        print(f"Data refresh finished in {self._last_success_monotonic - started:.2f}s")
+
+    def is_stale(self):
+        last = self._last_success_monotonic
+        return last is None or time.monotonic() - last > self.stale_after_seconds
+
+    def is_refreshing(self):
+        inflight = self._inflight
+        return inflight is not None and not inflight.done()
+
+    def status(self):
+        return {
+            'last_success_at': self.last_success_at.isoformat() + 'Z' if self.last_success_at else None,
+            'last_error': self.last_error,
+            'stale': self.is_stale(),
+            'refreshing': self.is_refreshing(),
+            'interval_seconds': self.interval_seconds,
+        }
@@ -0,0 +1,27 @@
+#tests/conftest.py
+# The services import the feature store and the model at import time, so
+# they run here against mongomock and the benchmarks' stub forecaster
+import os
+import sys
+import importlib
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+os.environ['MONGO_URI'] = 'mongodb://localhost/trading_bot_test'
+os.environ['FEATURE_STORE'] = 'mongo'
+os.environ['REFRESH_ENABLED'] = 'false'
+os.environ['MODEL_LOAD_MODE'] = 'eager'
+os.environ['INFERENCE_BATCHING'] = 'false'
+
+from synthetic import StubForecaster, use_mongomock, use_stub_model
+
+use_mongomock()
+use_stub_model(StubForecaster(0))
+
+
+@pytest.fixture(params=['predict', 'predict-1'])
+def client(request):
+    return importlib.import_module(request.param).app.test_client()
@@ -0,0 +1,36 @@
+#tests/test_batch_request.py
+import pytest
+from forecasting import parse_batch_request
+
+BATCH_URL = '/api/v1/trading/predict/batch'
+
+INVALID_BODIES = [
+    {'requests': [{'symbol': 'AAPL', 'prediction_days': 'x'}]},
+    {'requests': [{'symbol': 'AAPL', 'prediction_days': None}]},
+    {'requests': [{'symbol': 'AAPL', 'prediction_days': True}]},
+    {'requests': ['AAPL'], 'prediction_days': 'x'},
+    {'requests': ['AAPL'], 'prediction_days': None},
+    {'requests': [{'symbol': ['AAPL']}]},
+    {'requests': [{'symbol': 7}]},
+    {'requests': [{'symbol': ''}]},
+    {'requests': [['AAPL']]},
+]
+
+
+@pytest.mark.parametrize('body', INVALID_BODIES)
+def test_invalid_batch_entries_raise_value_error(body):
+    with pytest.raises(ValueError):
+        parse_batch_request(body)
+
+
+@pytest.mark.parametrize('body', INVALID_BODIES)
+def test_invalid_batch_entries_are_bad_requests(client, body):
+    response = client.post(BATCH_URL, json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_batch_horizons_are_snapped():
+    items = parse_batch_request({'requests': ['AAPL', {'symbol': 'MSFT', 'prediction_days': 8.5}],
+                                 'prediction_days': 13})
+    assert [item['prediction_days'] for item in items] == [14, 7]
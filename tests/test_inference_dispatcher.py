@@ -0,0 +1,41 @@
+#tests/test_inference_dispatcher.py
+import threading
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import pandas as pd
+import pytest
+from inference_dispatcher import InferenceDispatcher
+
+
+class BlockingModel:
+    # Records the tickers it scores and holds the first call until released
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+        self.seen = []
+
+    def predict(self, frame):
+        self.seen.extend(frame['Ticker'].unique())
+        self.started.set()
+        self.release.wait(5)
+        return frame['Close'].to_numpy()
+
+
+def frame(ticker):
+    return pd.DataFrame({'Date': pd.bdate_range('2024-01-01', periods=3), 'Ticker': ticker, 'Close': 1.0})
+
+
+def test_timed_out_request_never_reaches_the_model():
+    model = BlockingModel()
+    dispatcher = InferenceDispatcher(lambda: model, window_ms=0, timeout_seconds=0.1)
+
+    # The dispatcher thread is busy scoring AAA while BBB waits and times out
+    first = dispatcher.submit(frame('AAA'))
+    assert model.started.wait(5)
+    with pytest.raises(FutureTimeoutError):
+        dispatcher.predict(frame('BBB'))
+    model.release.set()
+
+    first.result(5)
+    dispatcher.submit(frame('CCC')).result(5)
+    assert model.seen == ['AAA', 'CCC']
+    assert dispatcher.stats()['cancelled'] == 1
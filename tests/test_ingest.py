@@ -0,0 +1,42 @@
+#tests/test_ingest.py
+import data_handler
+from synthetic import price_source
+
+
+def flaky_source(empty_once):
+    # price_source that leaves the symbols in empty_once out of their first
+    # response, as yf.download does for a symbol that failed
+    source = price_source(1)
+    requests = []
+
+    def download(symbols, start_date, end_date):
+        requests.append(list(symbols))
+        prices = source(symbols, start_date, end_date)
+        if len(requests) == 1:
+            for symbol in empty_once:
+                prices[symbol] = prices[symbol].iloc[:0]
+        return prices
+    return download, requests
+
+
+def test_symbols_without_bars_are_retried(monkeypatch):
+    monkeypatch.setattr(data_handler, 'DOWNLOAD_BACKOFF_SECONDS', 0)
+    download, requests = flaky_source(['BBB'])
+    prices = data_handler.download_with_retry(['AAA', 'BBB'], '2024-01-01', '2024-02-01', download)
+    assert requests == [['AAA', 'BBB'], ['BBB']]
+    assert sorted(prices) == ['AAA', 'BBB'] and not prices['BBB'].empty
+
+
+def test_weekend_ranges_are_not_retried(monkeypatch):
+    monkeypatch.setattr(data_handler, 'DOWNLOAD_BACKOFF_SECONDS', 0)
+    download, requests = flaky_source(['AAA'])
+    prices = data_handler.download_with_retry(['AAA'], '2024-01-06', '2024-01-08', download)
+    assert requests == [['AAA']] and prices == {}
+
+
+def test_pipeline_ingests_every_batch(monkeypatch):
+    monkeypatch.setattr(data_handler, 'DOWNLOAD_BATCH_SIZE', 1)
+    symbols = ['PIPE1', 'PIPE2', 'PIPE3']
+    assert data_handler.update_database(tickers=symbols, price_source=price_source(1), processes=False) == 3
+    marks = data_handler.get_high_water_marks(symbols)
+    assert all(marks[symbol] is not None for symbol in symbols)
@@ -0,0 +1,34 @@
+#tests/test_instrumentation.py
+import multiprocessing
+import re
+import pytest
+import instrumentation
+
+
+def request_count(text, endpoint):
+    match = re.search(rf'trading_request_seconds_count{{endpoint="{endpoint}",method="GET",status="200"}} (\d+)',
+                      text)
+    return int(match.group(1)) if match else 0
+
+
+def observe_requests(count):
+    for _ in range(count):
+        instrumentation.REQUEST_SECONDS.observe(('ready', 'GET', '200'), 0.01)
+
+
+def test_metrics_add_up_every_worker(tmp_path, monkeypatch):
+    monkeypatch.setattr(instrumentation, 'METRICS_DIR', str(tmp_path))
+    observe_requests(3)
+    workers = [multiprocessing.get_context('fork').Process(target=observe_requests, args=(n,)) for n in (5, 7)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    assert all(worker.exitcode == 0 for worker in workers)
+
+    # The exited workers' observations still count
+    text = instrumentation.render_metrics()
+    assert request_count(text, 'ready') == 15
+    total = re.search(r'trading_request_seconds_sum{endpoint="ready",method="GET",status="200"} (\S+)', text)
+    assert float(total.group(1)) == pytest.approx(0.15)
+    assert len(list(tmp_path.glob('histograms_*.db'))) == 3
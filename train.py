@@ -0,0 +1,407 @@
+#train.py
+import os
+import sys
+import json
+import time
+import uuid
+import pickle
+import shutil
+import hashlib
+import argparse
+import platform
+import tempfile
+from datetime import datetime
+from urllib.parse import quote
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import local_models
+from local_models import CANDIDATES, COLUMNS, CLOSE, LocalForecaster
+from model_loader import MODEL_CACHE_DIR, cached_versions, file_sha256, write_checksums
+
+# Offline training of the local per-ticker forecasters in local_models. The
+# features are loaded once into a (bars, tickers, columns) panel in shared
+# memory; every ticker is then scored by rolling-origin cross-validation on
+# a process pool: at each of the last `folds` origins (`step` bars apart)
+# every candidate is fitted on all bars up to the origin and forecasts the
+# next `horizon` bars. The candidate with the lowest mean absolute percentage
+# error is refitted on the whole history. Results are cached per ticker,
+# keyed by a hash of its bars, the settings and the model code, so a rerun
+# only trains the tickers whose data changed.
+DEFAULT_CSV = os.path.join('notebooks', 'stock_data_with_all_indicators.csv')
+TRAIN_WORKERS = int(os.getenv('TRAIN_WORKERS', os.cpu_count() or 1))
+TRAIN_CACHE_DIR = os.getenv('TRAIN_CACHE_DIR', os.path.join('data', 'train-cache'))
+TRAIN_MODEL_NAME = os.getenv('TRAIN_MODEL_NAME', 'Local-Forecast-Model')
+
+
+def load_csv_features(paths):
+    # Long frame with Date, Ticker and COLUMNS from the notebook CSVs; a
+    # (Ticker, Date) present in several files is taken from the first one
+    from feature_store import parse_dates
+
+    frames = []
+    for path in paths:
+        frame = pd.read_csv(path)
+        if not {'Date', 'Ticker', 'Close'} <= set(frame.columns):
+            print(f"Skipping {path}: it needs Date, Ticker and Close columns")
+            continue
+        frame['Date'] = parse_dates(frame['Date'])
+        frames.append(frame.reindex(columns=['Date', 'Ticker'] + COLUMNS))
+    if not frames:
+        return pd.DataFrame(columns=['Date', 'Ticker'] + COLUMNS)
+    return pd.concat(frames, ignore_index=True).drop_duplicates(['Ticker', 'Date'], keep='first')
+
+
+def load_store_features(store, tickers):
+    # Every stored bar of tickers, read through the feature store's loader
+    load = store.window_loader()
+    frames = [load(ticker, None).to_frame() for ticker in tickers]
+    return pd.concat(frames, ignore_index=True).reindex(columns=['Date', 'Ticker'] + COLUMNS)
+
+
+def feature_panel(history):
+    # (dates, tickers, values) with values shaped (bars, tickers, columns)
+    # and NaN where a ticker has no bar
+    history = history.dropna(subset=['Date', 'Ticker']).drop_duplicates(['Ticker', 'Date'], keep='last')
+    dates = pd.DatetimeIndex(np.sort(history['Date'].unique()))
+    tickers = pd.Index(np.sort(history['Ticker'].astype(str).unique()))
+    values = np.full((len(dates), len(tickers), len(COLUMNS)), np.nan)
+    values[dates.get_indexer(history['Date']), tickers.get_indexer(history['Ticker'].astype(str))] = \
+        history[COLUMNS].to_numpy(dtype=float)
+    return dates.to_numpy(), tickers.to_numpy(), values
+
+
+def rolling_origins(n_bars, horizon, folds, step, min_train):
+    # Index of the last training bar of each fold, oldest first
+    origins = n_bars - horizon - 1 - step * np.arange(folds)
+    return np.sort(origins[origins >= min_train - 1])
+
+
+def evaluate(values, candidates, horizon, folds, step, min_train):
+    # Per candidate: mean absolute percentage error over the folds, and how
+    # often the forecast got the direction of the last bar right
+    close = values[:, CLOSE]
+    origins = rolling_origins(len(values), horizon, folds, step, min_train)
+    scores = {}
+    for candidate in candidates:
+        errors = []
+        hits = []
+        try:
+            for origin in origins:
+                history = values[:origin + 1]
+                predicted = local_models.fit_forecast(candidate, history, horizon)
+                actual = close[origin + 1:origin + 1 + horizon]
+                errors.append(np.mean(np.abs(predicted - actual) / actual))
+                hits.append(np.sign(predicted[-1] - close[origin]) == np.sign(actual[-1] - close[origin]))
+        except (ValueError, np.linalg.LinAlgError) as e:
+            scores[candidate] = {'error': str(e)}
+            continue
+        mape = float(np.mean(errors))
+        scores[candidate] = {'mape': mape if np.isfinite(mape) else None,
+                             'direction_hit_rate': float(np.mean(hits)), 'folds': len(origins)}
+    return scores
+
+
+def train_ticker(ticker, values, settings):
+    started = time.perf_counter()
+    scores = evaluate(values, settings['candidates'], settings['horizon'], settings['folds'],
+                      settings['step'], settings['min_train'])
+    ranked = sorted((s['mape'], c) for c, s in scores.items() if s.get('mape') is not None)
+    result = {'ticker': ticker, 'bars': len(values), 'scores': scores, 'candidate': None, 'params': None}
+    if ranked:
+        result['candidate'] = ranked[0][1]
+        result['params'] = CANDIDATES[result['candidate']][0](values, settings['horizon'])
+    result['elapsed_seconds'] = time.perf_counter() - started
+    return result
+
+
+def ticker_values(panel, index):
+    # The bars of one ticker that have a close
+    values = panel[:, index, :]
+    rows = np.isfinite(values[:, CLOSE])
+    return values[rows], rows
+
+
+_worker_memory = None
+_worker_panel = None
+_worker_tickers = None
+_worker_settings = None
+
+
+def _init_worker(memory_name, shape, tickers, settings):
+    # Attaches to the parent's panel instead of receiving a copy
+    global _worker_memory, _worker_panel, _worker_tickers, _worker_settings
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    _worker_panel = np.ndarray(shape, dtype=float, buffer=_worker_memory.buf)
+    _worker_tickers = tickers
+    _worker_settings = settings
+
+
+def _train_chunk(indices):
+    return [train_ticker(_worker_tickers[i], ticker_values(_worker_panel, i)[0], _worker_settings)
+            for i in indices]
+
+
+def code_hash():
+    # Changing a candidate invalidates every cached result
+    return file_sha256(local_models.__file__)
+
+
+def data_key(dates, values, settings):
+    digest = hashlib.sha256()
+    digest.update(json.dumps({**settings, 'code': code_hash()}, sort_keys=True).encode())
+    digest.update(dates.astype('datetime64[ns]').tobytes())
+    digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+
+def cache_path(cache_dir, ticker):
+    return os.path.join(cache_dir, f"{quote(ticker, safe='')}.pkl")
+
+
+def read_cached(cache_dir, ticker, key):
+    try:
+        with open(cache_path(cache_dir, ticker), 'rb') as f:
+            entry = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    return entry['result'] if entry.get('key') == key else None
+
+
+def write_cached(cache_dir, ticker, key, result):
+    # Written next to the entry and moved into place, so a crash never
+    # leaves a truncated entry
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, staging = tempfile.mkstemp(dir=cache_dir, prefix='.entry-')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump({'key': key, 'result': result}, f)
+    os.replace(staging, cache_path(cache_dir, ticker))
+
+
+def run_training(history, candidates=None, horizon=28, folds=8, step=None, min_train=250,
+                 workers=TRAIN_WORKERS, cache_dir=TRAIN_CACHE_DIR, use_cache=True):
+    # history is a long frame with Date, Ticker and COLUMNS. Returns a report
+    # with the per-ticker results, fitted params included.
+    started = time.perf_counter()
+    candidates = list(candidates or CANDIDATES)
+    settings = {'candidates': candidates, 'horizon': horizon, 'folds': folds, 'step': step or horizon,
+                'min_train': min_train}
+    dates, tickers, panel = feature_panel(history)
+
+    results = {}
+    skipped = {}
+    keys = {}
+    stale = []
+    for i, ticker in enumerate(tickers):
+        values, rows = ticker_values(panel, i)
+        if len(values) < min_train + horizon + 1:
+            skipped[ticker] = f"{len(values)} bars, needs {min_train + horizon + 1}"
+            continue
+        keys[ticker] = data_key(dates[rows], values, settings)
+        cached = read_cached(cache_dir, ticker, keys[ticker]) if use_cache else None
+        if cached is not None:
+            results[ticker] = {**cached, 'cached': True}
+        else:
+            stale.append(i)
+
+    if len(stale) <= 1 or workers <= 1:
+        trained = [train_ticker(tickers[i], ticker_values(panel, i)[0], settings) for i in stale]
+    else:
+        # The panel goes into shared memory once; each task is a run of
+        # ticker indices
+        memory = shared_memory.SharedMemory(create=True, size=max(panel.nbytes, 1))
+        try:
+            shared = np.ndarray(panel.shape, dtype=float, buffer=memory.buf)
+            shared[:] = panel
+            chunks = np.array_split(np.array(stale), min(len(stale), workers * 4))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(memory.name, panel.shape, tickers, settings)) as pool:
+                trained = [result for part in pool.map(_train_chunk, chunks) for result in part]
+            del shared
+        finally:
+            memory.close()
+            memory.unlink()
+
+    for result in trained:
+        ticker = result['ticker']
+        if use_cache:
+            write_cached(cache_dir, ticker, keys[ticker], result)
+        results[ticker] = {**result, 'cached': False}
+
+    for ticker, result in results.items():
+        if result['candidate'] is None:
+            skipped[ticker] = 'no candidate could be fitted'
+    return {
+        'tickers': len(tickers),
+        'trained': sum(not r['cached'] for r in results.values()),
+        'cached': sum(r['cached'] for r in results.values()),
+        'skipped': skipped,
+        'start': str(pd.Timestamp(dates[0]).date()) if len(dates) else None,
+        'end': str(pd.Timestamp(dates[-1]).date()) if len(dates) else None,
+        'settings': settings,
+        'results': {ticker: results[ticker] for ticker in sorted(results)},
+        'elapsed_seconds': time.perf_counter() - started,
+    }
+
+
+def format_report(report):
+    candidates = report['settings']['candidates']
+    lines = [
+        f"{report['tickers']} tickers ({report['start']} to {report['end']}), "
+        f"{report['trained']} trained, {report['cached']} from cache, {len(report['skipped'])} skipped, "
+        f"{report['settings']['folds']} folds of {report['settings']['horizon']} bars",
+        f"elapsed {report['elapsed_seconds']:.2f}s",
+        '',
+        f"{'ticker':<10}{'best':>12}" + ''.join(f"{c + ' mape':>18}" for c in candidates),
+    ]
+    for ticker, result in report['results'].items():
+        if result['candidate'] is None:
+            continue
+        row = f"{ticker:<10}{result['candidate']:>12}"
+        for candidate in candidates:
+            mape = result['scores'].get(candidate, {}).get('mape')
+            row += f"{mape:>18.2%}" if mape is not None else f"{'-':>18}"
+        lines.append(row)
+    for ticker, reason in report['skipped'].items():
+        lines.append(f"{ticker:<10} skipped: {reason}")
+    return '\n'.join(lines)
+
+
+def yaml_dump(data, path):
+    import yaml
+
+    with open(path, 'w') as f:
+        yaml.safe_dump(data, f, default_flow_style=False, sort_keys=False)
+
+
+def next_version(name, cache_dir):
+    versions = [int(v) for v in cached_versions(name, cache_dir) if v.isdigit()]
+    return str(max(versions, default=0) + 1)
+
+
+def export_model(report, name=TRAIN_MODEL_NAME, cache_dir=MODEL_CACHE_DIR, fallback='drift'):
+    # Writes the fitted models as a new version of name in the model cache,
+    # MODEL_CACHE_DIR/<name>/<version>/mlflow-model, laid out like the
+    # downloaded AutoML artifacts (MLmodel, model.pkl, conda.yaml,
+    # python_env.yaml, requirements.txt, checksums.sha256). local_models is
+    # shipped in code/, so mlflow.pyfunc.load_model needs no training code.
+    models = {ticker: {'candidate': r['candidate'], 'params': r['params']}
+              for ticker, r in report['results'].items() if r['candidate'] is not None}
+    if not models:
+        raise ValueError("No ticker has a fitted model to export")
+    forecaster = LocalForecaster(models, report['settings']['horizon'], fallback, {
+        'trained_through': report['end'],
+        'scores': {ticker: r['scores'] for ticker, r in report['results'].items()},
+    })
+    try:
+        import mlflow
+        mlflow_version = mlflow.__version__
+    except ImportError:
+        mlflow_version = None
+
+    version = next_version(name, cache_dir)
+    target = os.path.join(cache_dir, name, version)
+    os.makedirs(os.path.join(cache_dir, name), exist_ok=True)
+    staging = tempfile.mkdtemp(dir=os.path.join(cache_dir, name), prefix=f".{version}-")
+    try:
+        model_dir = os.path.join(staging, 'mlflow-model')
+        os.makedirs(os.path.join(model_dir, 'code'))
+        shutil.copy(local_models.__file__, os.path.join(model_dir, 'code', 'local_models.py'))
+        with open(os.path.join(model_dir, 'model.pkl'), 'wb') as f:
+            pickle.dump(forecaster, f)
+
+        python_version = platform.python_version()
+        requirements = [f"mlflow=={mlflow_version}" if mlflow_version else 'mlflow',
+                        f"numpy=={np.__version__}", f"pandas=={pd.__version__}"]
+        with open(os.path.join(model_dir, 'requirements.txt'), 'w') as f:
+            f.write('\n'.join(requirements) + '\n')
+        yaml_dump({'channels': ['conda-forge'],
+                   'dependencies': [f"python={python_version}", 'pip', {'pip': requirements}],
+                   'name': 'mlflow-env'}, os.path.join(model_dir, 'conda.yaml'))
+        yaml_dump({'python': python_version, 'build_dependencies': ['pip', 'setuptools', 'wheel'],
+                   'dependencies': ['-r requirements.txt']}, os.path.join(model_dir, 'python_env.yaml'))
+
+        mlmodel = {
+            'artifact_path': 'mlflow-model',
+            'flavors': {'python_function': {
+                'code': 'code',
+                'data': 'model.pkl',
+                'env': {'conda': 'conda.yaml', 'virtualenv': 'python_env.yaml'},
+                'loader_module': 'local_models',
+                'predict_fn': 'predict',
+                'python_version': python_version,
+            }},
+            'metadata': {
+                'engine': 'train.py',
+                'trained_through': report['end'],
+                'tickers': len(models),
+                'horizon': report['settings']['horizon'],
+                'candidates': sorted({m['candidate'] for m in models.values()}),
+            },
+            'model_size_bytes': os.path.getsize(os.path.join(model_dir, 'model.pkl')),
+            'model_uuid': uuid.uuid4().hex,
+            'utc_time_created': str(datetime.utcnow()),
+        }
+        if mlflow_version:
+            mlmodel['mlflow_version'] = mlflow_version
+        yaml_dump(mlmodel, os.path.join(model_dir, 'MLmodel'))
+        write_checksums(model_dir)
+        os.replace(staging, target)
+    finally:
+        if os.path.isdir(staging):
+            shutil.rmtree(staging)
+    return os.path.join(target, 'mlflow-model'), version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Evaluate and train the local per-ticker forecasters')
+    parser.add_argument('--csv', nargs='+', default=[DEFAULT_CSV],
+                        help='CSVs with Date, Ticker, prices and indicators')
+    parser.add_argument('--store', choices=['arrow', 'mongo'], help='Read the feature store instead')
+    parser.add_argument('--tickers', help='Comma-separated tickers (default for --store: data_handler.TICKERS)')
+    parser.add_argument('--candidates', default=','.join(CANDIDATES), help='Comma-separated candidate models')
+    parser.add_argument('--horizon', type=int, default=28)
+    parser.add_argument('--folds', type=int, default=8)
+    parser.add_argument('--step', type=int, help='Bars between fold origins (default: the horizon)')
+    parser.add_argument('--min-train', type=int, default=250, help='Fewest bars a fold trains on')
+    parser.add_argument('--workers', type=int, default=TRAIN_WORKERS)
+    parser.add_argument('--cache-dir', default=TRAIN_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true', help='Retrain every ticker')
+    parser.add_argument('--export', action='store_true', help='Export the models into the model cache')
+    parser.add_argument('--name', default=TRAIN_MODEL_NAME, help='Model name to export under')
+    parser.add_argument('--model-cache-dir', default=MODEL_CACHE_DIR)
+    parser.add_argument('--output', help='Write the report (without fitted params) as JSON')
+    args = parser.parse_args()
+
+    candidates = [c.strip() for c in args.candidates.split(',') if c.strip()]
+    unknown = set(candidates) - set(CANDIDATES)
+    if unknown:
+        parser.error(f"unknown candidates: {', '.join(sorted(unknown))}")
+
+    tickers = args.tickers.split(',') if args.tickers else None
+    if args.store:
+        os.environ['FEATURE_STORE'] = args.store
+        from feature_store import feature_store_from_env
+        if tickers is None:
+            from data_handler import TICKERS
+            tickers = TICKERS
+        history = load_store_features(feature_store_from_env(), tickers)
+    else:
+        history = load_csv_features(args.csv)
+        if tickers:
+            history = history[history['Ticker'].isin(tickers)]
+    if history.empty:
+        sys.exit("No features to train on")
+
+    report = run_training(history, candidates, args.horizon, args.folds, args.step, args.min_train,
+                          args.workers, args.cache_dir, not args.no_cache)
+    print(format_report(report))
+    if args.export:
+        path, version = export_model(report, args.name, args.model_cache_dir)
+        print(f"\nExported '{args.name}' version {version} to {path}")
+        print(f"Serve it with MODEL_NAME={args.name} MODEL_CACHE_DIR={args.model_cache_dir}")
+    if args.output:
+        results = {ticker: {k: v for k, v in r.items() if k != 'params'} for ticker, r in report['results'].items()}
+        with open(args.output, 'w') as f:
+            json.dump({**report, 'results': results}, f, indent=2)
@@ -0,0 +1,27 @@
+#wsgi.py
+# Production entry point for a pre-fork server:
+#
+#   gunicorn -c gunicorn.conf.py wsgi:app
+#
+# gunicorn.conf.py preloads this module in the master, so the model is loaded
+# once before the workers fork and its memory is shared copy-on-write.
+import os
+import importlib
+from refresher import serialized
+
+# Load the model while importing rather than on a warm-up thread, which
+# would not survive the fork
+os.environ.setdefault('MODEL_LOAD_MODE', 'eager')
+os.environ['SERVE_PREFORK'] = 'true'
+
+SERVICE_MODULE = os.getenv('SERVICE_MODULE', 'predict-1')
+
+service = importlib.import_module(SERVICE_MODULE)
+app = service.app
+
+def start_worker():
+    # Called by gunicorn once a worker has the app loaded
+    if hasattr(service, 'data_refresher'):
+        service.data_refresher.refresh_fn = serialized(service.data_refresher.refresh_fn)
+    if hasattr(service, 'start_background_tasks'):
+        service.start_background_tasks()